@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response
+from sqlalchemy.orm import Session
+import models, auth, analytics_store
+from database import get_db
+from student_query import STUDENT_MODELS
+
+analytics_api_router = APIRouter()
+
+# no-cache makes the browser revalidate every time, an unchanged summary is answered with an empty 304
+def summary_response(request: Request, etag: str, body: bytes) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# api to get the summary of both education levels, {"senior-high": {...}, "college": {...}}
+@analytics_api_router.get('/api/analytics/summary')
+def get_analytics_summaries(request: Request, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    etags, parts = [], []
+    for education_level in STUDENT_MODELS:
+        etag, body, _ = analytics_store.cached_summary(db, education_level)
+        etags.append(etag)
+        parts.append(b'"' + education_level.encode() + b'":' + body)
+    etag = '"' + "-".join(tag.strip('"') for tag in etags) + '"'
+    return summary_response(request, etag, b"{" + b",".join(parts) + b"}")
+
+# api to get the student counts per year, strand, course, city, age, cluster and school of one education level
+@analytics_api_router.get('/api/analytics/summary/{education_level}')
+def get_analytics_summary(education_level: str, request: Request, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    if education_level not in STUDENT_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unknown education level '{education_level}'.")
+    etag, body, _ = analytics_store.cached_summary(db, education_level)
+    return summary_response(request, etag, body)
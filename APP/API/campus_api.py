@@ -2,7 +2,7 @@ from typing import List
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from database import get_db
-import models, schemas, auth
+import models, schemas, auth, nearest_campus
 
 campus_api_router = APIRouter()
 
@@ -34,6 +34,7 @@ def create_campus(campus_data: schemas.CampusBase, db: Session = Depends(get_db)
     
     db.commit()
     db.refresh(campus)
+    nearest_campus.invalidate()
 
     return campus
 
@@ -54,6 +55,7 @@ def update_campus(campus_id: int, updated_data: schemas.CampusBase, db: Session
 
     db.commit()
     db.refresh(existing_campus)
+    nearest_campus.invalidate()
 
     return existing_campus
 
@@ -76,5 +78,6 @@ def delete_campus(campus_id: int, db: Session = Depends(get_db), current_user: m
     db.add(log_entry)
     
     db.commit()
+    nearest_campus.invalidate()
 
     return {"message": "Campus successfully deleted."}
\ No newline at end of file
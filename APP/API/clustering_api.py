@@ -0,0 +1,92 @@
+import time
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+import numpy as np
+import models, auth, schemas, cluster_store
+from clustering import cluster_coordinates
+from student_query import STUDENT_MODELS
+from database import get_db
+
+clustering_api_router = APIRouter()
+
+def get_student_model(education_level: str):
+    model = STUDENT_MODELS.get(education_level)
+    if model is None:
+        raise HTTPException(status_code=400, detail=f"Unknown education level '{education_level}'.")
+    return model
+
+# api to re-run clustering on the students already in the database with another method or parameters
+# only the labels are returned unless save is set, then the cluster column is rewritten
+@clustering_api_router.post('/api/clustering/{education_level}')
+def recluster_students(
+    education_level: str,
+    request: schemas.ReclusterRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_admin)
+):
+    model = get_student_model(education_level)
+    start = time.perf_counter()
+
+    rows = db.query(model.stud_id, model.latitude, model.longitude).order_by(model.stud_id).all()
+    stud_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    coords = np.array([(row[1] or 0, row[2] or 0) for row in rows], dtype=np.float64).reshape(-1, 2)
+
+    try:
+        labels, info = cluster_coordinates(
+            coords,
+            method=request.method,
+            projection=request.projection,
+            eps_m=request.eps_m,
+            min_samples=request.min_samples,
+            min_cluster_size=request.min_cluster_size
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # same numbering as the file processors, clusters start at 1 and -1 is unclustered
+    clusters = np.where(labels >= 0, labels + 1, -1)
+
+    # saved labels also replace the stored centroids that incremental uploads are assigned to
+    if request.save:
+        cluster_store.save_student_clusters(db, model, stud_ids, clusters)
+        cluster_store.save_model(db, education_level, coords, labels, info)
+
+    sizes = np.bincount(clusters[clusters > 0]) if (clusters > 0).any() else np.zeros(1, dtype=int)
+    return {
+        "method": info["method"],
+        "projection": info["projection"],
+        "n_clusters": info["n_clusters"],
+        "best_k": info.get("best_k"),
+        "noise": info["noise"],
+        "valid": info["valid"],
+        "cluster_sizes": {str(cluster): int(size) for cluster, size in enumerate(sizes) if cluster > 0},
+        "saved": request.save,
+        "seconds": round(time.perf_counter() - start, 3),
+        "stud_ids": stud_ids.tolist(),
+        "clusters": clusters.tolist()
+    }
+
+# api to check the stored centroids and how far incremental uploads have drifted from them
+@clustering_api_router.get('/api/clustering/{education_level}/model')
+def get_cluster_model(
+    education_level: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_admin)
+):
+    get_student_model(education_level)
+    stored = cluster_store.get_model(db, education_level)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="No clusters have been fitted for this education level yet.")
+
+    return {
+        "education_level": stored.education_level,
+        "method": stored.method,
+        "projection": stored.projection,
+        "clusters": len(stored.centroids),
+        "fit_points": stored.fit_points,
+        "added_points": stored.added_points,
+        "drift": cluster_store.drift(stored),
+        "drift_threshold": cluster_store.CLUSTER_DRIFT_THRESHOLD,
+        "incremental": cluster_store.CLUSTER_INCREMENTAL,
+        "updated_at": stored.updated_at
+    }
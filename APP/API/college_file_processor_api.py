@@ -1,18 +1,19 @@
-import math, io, os ,re, html
-from tempfile import NamedTemporaryFile
+import io, os ,re, html
 from dotenv import load_dotenv
 from fastapi import File, HTTPException, UploadFile
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import StreamingResponse
+import numpy as np
 import pandas as pd
-from kneed import KneeLocator
 
-import models, auth
+import models, auth, geocode_cache, jobs
+from database import get_db
+from geocoding import geocode_address, geocode_previous_school, geocode_unique
 
 from fastapi import APIRouter, Depends
-from sklearn.cluster import KMeans
-import requests
+from sqlalchemy.orm import Session
 
-from rapidfuzz import process, fuzz
+from school_index import canonicalize_school_names
+from cluster_store import cluster_students
 from collections import defaultdict
 
 college_file_api_router = APIRouter()
@@ -23,27 +24,6 @@ def clean_strand(strand):
     return re.sub(r"^\d{2}", "", strand).strip()
 
 
-def clean_text(text):
-    return re.sub(r'[^\w\s]', '', str(text))
-
-# geocode address function    
-def geocode_address(address, api_key):
-    url = "https://geocode.search.hereapi.com/v1/geocode"
-    params = {"q": address, "apiKey": api_key}
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        data = response.json()
-        if data['items']:
-            latitude = data['items'][0]['position']['lat']
-            longitude = data['items'][0]['position']['lng']
-            return latitude, longitude
-        else:
-            print(f"Geocoding failed for {address}, returning 'Unknown'")
-            return 0, 0
-    else:
-        print(f"Error geocoding {address}: {response.status_code}")
-        return 0, 0
-
 # clean previous school name function
 def clean_previous_school_name(name: str):
     name = html.unescape(name)
@@ -66,81 +46,14 @@ def clean_previous_school_name(name: str):
     return name
 
 
-# fuzzy matching for previous school
-def group_similar_schools(school_series, threshold=85):
-    def get_canonical_school_name(school_name):
-        return mapping.get(school_name, school_name)
-
-    cleaned_schools = school_series.unique().tolist()
-    grouped = {}
-    assigned = set()
-
-    for i, name in enumerate(cleaned_schools):
-        if name in assigned:
-            continue
-        grouped[name] = [name]
-        assigned.add(name)
-
-        for j in range(i + 1, len(cleaned_schools)):
-            candidate = cleaned_schools[j]
-            if candidate in assigned:
-                continue
-            score = fuzz.ratio(name, candidate)
-            if score >= threshold:
-                grouped[name].append(candidate)
-                assigned.add(candidate)
-
-    mapping = {}
-    for canonical, variants in grouped.items():
-        for variant in variants:
-            mapping[variant] = canonical
-
-    return school_series.map(get_canonical_school_name)
-
-# geocode previous school function
-def geocode_previous_school(school: str, barangay: str = "", city: str = "", province: str =""):
-    if not school or school.strip().lower() == "na":
-        return 0, 0
-
-    clean_school = clean_text(school)
-    
-    query_parts = [clean_school]
-
-    if barangay:
-        query_parts.append(barangay.title())
-    if city:
-        query_parts.append(city.title())
-    if province:
-        query_parts.append(province.title())
-    query_parts.append("Philippines")
-
-    query_address = ", ".join(query_parts)
-    
-    api_key_prev = os.getenv("GEOCODE_API_KEY") 
-    if not api_key_prev:
-        raise HTTPException(status_code=500, detail="Geocode API key for previous schools is missing.")
-    
-    url = "https://geocode.search.hereapi.com/v1/geocode"
-    params = {"q": query_address, "apiKey": api_key_prev}
-    response = requests.get(url, params=params)
-    
-    try:
-        url = "https://geocode.search.hereapi.com/v1/geocode"
-        params = {"q": query_address, "apiKey": api_key_prev}
-        response = requests.get(url, params=params, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        if data.get('items'):
-            lat = data['items'][0]['position']['lat']
-            lng = data['items'][0]['position']['lng']
-            return lat, lng
-    except Exception as e:
-        print(f"Geocoding failed for: {query_address} - Error: {e}")
-    
-    return 0, 0
-
 # preprocess college file function
-def preprocess_file_college(file_path: str):
+def preprocess_file_college(file_path: str, progress=None):
+    # progress(percent, message) is called between stages when running as a background job
+    def report(percent, message):
+        if progress:
+            progress(percent, message)
+
+    report(5, "Reading CSV")
     try:
         # read the raw CSV file
         df = pd.read_csv(file_path, header=None)  
@@ -164,6 +77,7 @@ def preprocess_file_college(file_path: str):
     df.insert(0, "stud_id", range(1, len(df) + 1))
 
     # fill missing values
+    report(10, "Cleaning columns")
     df["year"] = df["year"].fillna("N/A").astype(str).str.strip()
     df["course"] = df["course"].fillna("N/A").astype(str).str.strip()
     df["age"] = pd.to_numeric(df["age"], errors="coerce").fillna(0)
@@ -179,104 +93,64 @@ def preprocess_file_college(file_path: str):
 
     df["strand"] = df["strand"].apply(clean_strand)
 
+    report(15, "Grouping similar school names")
     df["previous_school"] = df["previous_school"].apply(clean_previous_school_name)
-    df["previous_school"] = group_similar_schools(df["previous_school"])
+    df["previous_school"] = canonicalize_school_names(df["previous_school"])
 
     # create the full address column by concatenating city, province, and barangay columns
     df["full_address"] = (
         df["barangay"] + ", " + df["city"] + ", " + df["province"]
     ).str.strip()
 
-    # geocode 
+    # geocode each unique address once and join the coordinates back
+    report(30, "Geocoding student addresses")
     def get_coordinates(address):
             return geocode_address(address, api_key)
-        
-    geocoded_data = df['full_address'].apply(get_coordinates)
-    df['latitude'], df['longitude'] = zip(*geocoded_data)
+
+    df = geocode_unique(df, ['full_address'], get_coordinates, 'latitude', 'longitude')
 
     # cluster part
+    report(55, "Clustering student locations")
     df['latitude'] = pd.to_numeric(df['latitude'], errors='coerce').fillna(0)
     df['longitude'] = pd.to_numeric(df['longitude'], errors='coerce').fillna(0)
 
-    valid_coordinates = df[(df['latitude'] != 0) & (df['longitude'] != 0)].copy()
-
-    if not valid_coordinates.empty:
-        n = len(valid_coordinates)
-        upper_k = round(math.sqrt(n / 2))
-        print(f"Sample size (all valid students): {n}")
-        print(f"Upper limit for k (√(n/2)): {upper_k}")
-
-        coords = valid_coordinates[['latitude', 'longitude']].values
-        wcss = []
-
-        for k in range(2, max(3, upper_k + 1)):
-            kmeans = KMeans(n_clusters=k, random_state=42, init='k-means++')
-            kmeans.fit(coords)
-            wcss.append(kmeans.inertia_)
-
-        kl = KneeLocator(range(2, max(3, upper_k + 1)), wcss, curve='convex', direction='decreasing')
-        best_k = kl.elbow if kl.elbow is not None else 2  # fallback if knee not found
-
-        print(f"✅ Optimal k based on Elbow Method: {best_k}")
-
-        kmeans_final = KMeans(n_clusters=best_k, random_state=42, init='k-means++')
-        valid_coordinates['cluster'] = kmeans_final.fit_predict(coords) + 1
+    # rows without coordinates are skipped and keep cluster -1, method and projection come from
+    # CLUSTER_METHOD / CLUSTER_PROJECTION, with CLUSTER_INCREMENTAL the rows are only labelled with the stored
+    # centroids, the stored model is updated when the file is uploaded
+    labels = cluster_students('college', df[['latitude', 'longitude']].values)
+    df['cluster'] = np.where(labels >= 0, labels + 1, -1)
 
-        # merge back to main dataframe
-        df = df.merge(
-            valid_coordinates[['stud_id', 'cluster']],
-            on='stud_id',
-            how='left'
-        )
-    else:
-        df['cluster'] = -1
 
-    df['cluster'] = df['cluster'].fillna(-1).astype(int)
-
-
-    # geocode previous school part
-    def geocode_prev_school_from_row(row):
-        return geocode_previous_school(
-            row['previous_school'],
-            row['barangay'],
-            row['city'],
-            row['province']
-        )
-
-    geocoded_prev_school = df.apply(geocode_prev_school_from_row, axis=1)
-    df['prev_latitude'], df['prev_longitude'] = zip(*geocoded_prev_school)
+    # geocode previous school part, once per unique (school, barangay, city, province)
+    report(75, "Geocoding previous schools")
+    df = geocode_unique(
+        df,
+        ['previous_school', 'barangay', 'city', 'province'],
+        geocode_previous_school,
+        'prev_latitude',
+        'prev_longitude'
+    )
 
     df['prev_latitude'] = df['prev_latitude'].fillna(0)
     df['prev_longitude'] = df['prev_longitude'].fillna(0)
 
+    print(f"Geocode cache stats: {geocode_cache.get_stats()}")
+
     # save the cleaned file
+    report(95, "Saving processed file")
     output_path = file_path.replace(".csv", "_processed.csv")
     df.to_csv(output_path, index=False)
     return output_path
 
 
-# upload raw college file api
+# upload raw college file api, the file is preprocessed by a background job
 @college_file_api_router.post("/api/upload/raw/college-file")
-async def upload_file(file: UploadFile = File(...)):
+def upload_file(file: UploadFile = File(...), db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_admin)):
     # validate file type
     if not file.filename.endswith(".csv"):
         raise HTTPException(status_code=400, detail="Only CSV files are allowed")
-    
-    tmp_path = None
-    try:
-        with NamedTemporaryFile(delete=False, suffix=".csv") as tmp:
-            tmp.write(await file.read())
-            tmp_path = tmp.name
-
-        processed_path = preprocess_file_college(tmp_path)
-
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            os.remove(tmp_path)  
 
+    job = jobs.create_job(db, "college", file, user_id=current_user.user_id)
+    jobs.submit_job(job.job_id)
 
-    return FileResponse(
-        path=processed_path,
-        media_type='text/csv',
-        filename="[1]_preprocessed_college_file.csv"
-    )
\ No newline at end of file
+    return jobs.job_to_dict(job)
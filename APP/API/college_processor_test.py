@@ -13,7 +13,6 @@ from fastapi import APIRouter, Depends
 from sklearn.cluster import KMeans
 import requests
 
-from rapidfuzz import process, fuzz
 from collections import defaultdict
 
 college_file_api_router = APIRouter()
@@ -67,36 +66,6 @@ def clean_previous_school_name(name: str):
     return name
 
 
-# fuzzy matching for previous school
-def group_similar_schools(school_series, threshold=85):
-    cleaned_schools = school_series.unique().tolist()
-    grouped = {}
-    assigned = set()
-
-    for i, name in enumerate(cleaned_schools):
-        if name in assigned:
-            continue
-        grouped[name] = [name]
-        assigned.add(name)
-
-        for j in range(i + 1, len(cleaned_schools)):
-            candidate = cleaned_schools[j]
-            if candidate in assigned:
-                continue
-            score = fuzz.ratio(name, candidate)
-            if score >= threshold:
-                grouped[name].append(candidate)
-                assigned.add(candidate)
-
-    # Create mapping dict
-    mapping = {}
-    for canonical, variants in grouped.items():
-        for variant in variants:
-            mapping[variant] = canonical
-
-    # Map values in original series
-    return school_series.map(lambda x: mapping.get(x, x))
-
 # geocode previous school function
 def geocode_previous_school(school: str, barangay: str = "", city: str = "", province: str =""):
     if not school or school.strip().lower() == "na":
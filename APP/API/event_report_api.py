@@ -1,8 +1,11 @@
-from typing import List
+from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 import models, auth, schemas
 from database import get_db
+from affected_students import affected_students, education_level_key, impact_analysis, students_in_area
+from student_query import STUDENT_MODELS
+import spatial_index
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter, landscape
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
@@ -14,14 +17,53 @@ from datetime import datetime, timezone
 
 event_reports_api_router = APIRouter()
 
+# the requested education level, or both when none is given
+def requested_levels(education_level: Optional[str]) -> list:
+    if not education_level:
+        return list(STUDENT_MODELS)
+    level = education_level_key(education_level)
+    if level not in STUDENT_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unknown education level '{education_level}'.")
+    return [level]
+
+# api to count the students inside drawn areas per area type and education level
+@event_reports_api_router.post('/api/affected-students')
+def get_affected_students(request: schemas.AffectedStudentsRequest, current_user: models.User = Depends(auth.get_current_user)):
+    levels = requested_levels(request.education_level)
+    try:
+        return {level: affected_students(level, request.areas, request.include_ids) for level in levels}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# api for what-if analysis of many candidate event areas at once: the area of every feature, its affected
+# students per cluster and strand, and the students shared by each pair of overlapping features
+@event_reports_api_router.post('/api/affected-students/batch')
+def analyse_event_areas(request: schemas.ImpactAnalysisRequest, current_user: models.User = Depends(auth.get_current_user)):
+    levels = requested_levels(request.education_level)
+    try:
+        return impact_analysis(levels, request.features)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # api to make event reports
 @event_reports_api_router.post('/api/affected-areas', response_model=schemas.AffectedArea)
 def create_affected_area(affected_area_data: schemas.AffectedAreaBase, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    # the number of affected students is counted here, the count sent by the map is only used for areas
+    # that are not tied to an education level
+    number_of_students_affected = affected_area_data.number_of_students_affected or 0
+    education_level = education_level_key(affected_area_data.education_level)
+    if education_level in STUDENT_MODELS:
+        try:
+            index = spatial_index.get_index(education_level)
+            number_of_students_affected = int(len(students_in_area(index, affected_area_data.geojson_data)))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     affected_area = models.EventReports(
         user_id=current_user.user_id,  # Set current user's ID
         event_type=affected_area_data.type,
         total_area=affected_area_data.total_area,
-        number_of_students_affected=affected_area_data.number_of_students_affected,
+        number_of_students_affected=number_of_students_affected,
         geojson_data=affected_area_data.geojson_data,
         education_level=affected_area_data.education_level   
     )
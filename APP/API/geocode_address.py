@@ -1,6 +1,10 @@
+# run from the APP folder with: python -m API.geocode_address
+# the HERE api key is read from GEOCODE_API_KEY in .env
 import pandas as pd
 import re
-import requests
+from concurrent.futures import ThreadPoolExecutor
+
+from geocoding import get_engine
 
 # Function to clean special characters from a string
 def clean_text(text):
@@ -38,44 +42,28 @@ for col in columns_to_clean:
     else:
         print(f"Warning: Column '{col}' not found in the data.")
 
-# Function to geocode an address using the Here API
+# Function to geocode a school using the shared geocoding engine (cached, rate limited, retried)
 def geocode_address(school):
     if not school or school.strip().lower() == "na":
         return None, None
 
-    api_key = "Fb6Yb4tbwP9ffSMTEWihOXTSTAp6C9KbUf7CYDoWMvA"
-    url = "https://geocode.search.hereapi.com/v1/geocode"
     address = f"{school}, Philippines"  # add country context
-    params = {
-        "q": address,
-        "apiKey": api_key
-    }
-
-    try:
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            if data['items']:
-                lat = data['items'][0]['position']['lat']
-                lng = data['items'][0]['position']['lng']
-                print(f"'{school}' is geocoded successfully [{lat}, {lng}]")
-                return lat, lng
-            else:
-                print(f"No result for: {school}")
-                return None, None
-        else:
-            print(f"Error geocoding address '{school}': {response.status_code}")
-            return None, None
-    except Exception as e:
-        print(f"Error during geocoding for '{school}': {e}")
+    lat, lng = get_engine().geocode(address)
+    if lat == 0 and lng == 0:
+        print(f"No result for: {school}")
         return None, None
 
+    print(f"'{school}' is geocoded successfully [{lat}, {lng}]")
+    return lat, lng
+
 # Control how many rows to geocode
 num_rows_to_geocode = 5
 subset_indices = df.head(num_rows_to_geocode).index
 
 # Geocode selected rows with logging
-geocoded_data = df.loc[subset_indices, 'previous_school'].apply(geocode_address)
+# lookups run concurrently on the engine's thread pool
+with ThreadPoolExecutor(max_workers=get_engine().concurrency) as executor:
+    geocoded_data = list(executor.map(geocode_address, df.loc[subset_indices, 'previous_school']))
 df.loc[subset_indices, 'prev_latitude'], df.loc[subset_indices, 'prev_longitude'] = zip(*geocoded_data)
 
 # Output file path
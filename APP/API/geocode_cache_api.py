@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Depends
+import models, auth, geocode_cache
+
+geocode_cache_api_router = APIRouter()
+
+# api to check how many geocode lookups were served from the cache
+@geocode_cache_api_router.get('/api/geocode-cache/stats')
+def get_geocode_cache_stats(current_user: models.User = Depends(auth.get_current_admin)):
+    return {
+        "ttl_days": geocode_cache.GEOCODE_CACHE_TTL_DAYS,
+        "miss_ttl_days": geocode_cache.GEOCODE_CACHE_MISS_TTL_DAYS,
+        **geocode_cache.get_stats()
+    }
@@ -1,27 +1,47 @@
 from typing import Optional
 from fastapi import APIRouter, Depends
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 import models, auth
 from database import get_db
 
 get_previous_schools_api_router = APIRouter()
 
-@get_previous_schools_api_router.get('/api/previous-schools')
-def get_all_previous_schools(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    schools = db.query(models.PreviousSchool).all()
+# per school student counts come from one query: each student table is grouped by school first and the two
+# grouped results are left joined to previous_schools, joining the raw tables would multiply the rows
+def school_student_counts(db: Session):
+    senior_high = db.query(
+        models.SeniorHighStudents.previous_school_id.label("school_id"),
+        func.count().label("student_count")
+    ).group_by(models.SeniorHighStudents.previous_school_id).subquery()
+    college = db.query(
+        models.CollegeStudents.previous_school_id.label("school_id"),
+        func.count().label("student_count")
+    ).group_by(models.CollegeStudents.previous_school_id).subquery()
 
-    result = []
-    for school in schools:
-        senior_high_count = db.query(models.SeniorHighStudents).filter(models.SeniorHighStudents.previous_school_id == school.id).count()
-        college_count = db.query(models.CollegeStudents).filter(models.CollegeStudents.previous_school_id == school.id).count()
+    return db.query(
+        models.PreviousSchool.id,
+        models.PreviousSchool.name,
+        models.PreviousSchool.latitude,
+        models.PreviousSchool.longitude,
+        func.coalesce(senior_high.c.student_count, 0).label("senior_high_count"),
+        func.coalesce(college.c.student_count, 0).label("college_count")
+    ).outerjoin(
+        senior_high, senior_high.c.school_id == models.PreviousSchool.id
+    ).outerjoin(
+        college, college.c.school_id == models.PreviousSchool.id
+    ).order_by(models.PreviousSchool.id)
 
-        result.append({
+@get_previous_schools_api_router.get('/api/previous-schools')
+def get_all_previous_schools(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    return [
+        {
             "id": school.id,
             "name": school.name,
             "latitude": school.latitude,
             "longitude": school.longitude,
-            "senior_high_count": senior_high_count,
-            "college_count": college_count
-        })
-
-    return result
+            "senior_high_count": school.senior_high_count,
+            "college_count": school.college_count
+        }
+        for school in school_student_counts(db).all()
+    ]
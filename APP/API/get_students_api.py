@@ -1,125 +1,171 @@
 from typing import Optional
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func
 from sqlalchemy.orm import Session, joinedload
-import models, auth
+import models, auth, analytics_store
 from database import get_db
+import student_query
+from API.get_previous_school_api import school_student_counts
 
 get_students_api_router = APIRouter()
 
 
 @get_students_api_router.get("/api/senior-high-students/count")
 def get_senior_high_student_count(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    count = db.query(models.SeniorHighStudents).count()
-    return {"count": count}
+    # served from the analytics summary instead of counting the table
+    _, _, summary = analytics_store.cached_summary(db, "senior-high")
+    return {"count": summary["total"]}
 
 @get_students_api_router.get("/api/college-students/count")
 def get_college_student_count(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    count = db.query(models.CollegeStudents).count()
-    return {"count": count}
+    _, _, summary = analytics_store.cached_summary(db, "college")
+    return {"count": summary["total"]}
+
+# without cursor or limit the endpoints return every student as a list like before, with either one they return
+# one page: {"items": [...], "next_cursor": stud_id or null}. fields picks the columns, e.g. fields=latitude,longitude
+# format=ndjson streams the rows one json object per line, format=columnar / format=binary send parallel arrays,
+# all of them with the same cursor, limit and fields
+def students_response(
+    db: Session, student_model, cursor: Optional[int], limit: Optional[int], fields: Optional[str], output: str = "json"
+):
+    if output not in student_query.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{output}'. Use one of: {', '.join(student_query.FORMATS)}")
+    if output == "ndjson":
+        return student_query.ndjson_response(db, student_model, fields, cursor, limit)
+    if output == "columnar":
+        return student_query.columnar_response(db, student_model, fields, cursor, limit)
+    if output == "binary":
+        return student_query.binary_response(db, student_model, fields, cursor, limit)
+
+    if cursor is None and limit is None:
+        return student_query.student_rows(db, student_model, fields)
+    return student_query.student_page(db, student_model, fields, cursor, limit)
 
 # get all seniorhigh students
 @get_students_api_router.get("/api/senior-high-students/all")
 def get_all_senior_high_students(
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    output: str = Query("json", alias="format"),
     db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)
 ):
-    students = db.query(models.SeniorHighStudents).all()
-    
-    return [
-        {
-            "year": student.year,
-            "strand": student.strand,
-            "previous_school": student.previous_school,
-            "age": student.age,
-            "latitude": student.latitude,
-            "longitude": student.longitude,
-            "cluster": student.cluster,
-        }
-        for student in students
-    ]
+    return students_response(db, models.SeniorHighStudents, cursor, limit, fields, output)
 
 # get all college students
 @get_students_api_router.get("/api/college-students/all")
 def get_all_college_students(
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    output: str = Query("json", alias="format"),
     db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)
 ):
-    students = db.query(models.CollegeStudents).all()
-    
-    return [
-        {
-            "year": student.year,
-            "course": student.course,
-            "strand": student.strand,
-            "previous_school": student.previous_school,
-            "age": student.age,
-            "latitude": student.latitude,
-            "longitude": student.longitude,
-            "cluster": student.cluster,
-        }
-        for student in students
-    ]
+    return students_response(db, models.CollegeStudents, cursor, limit, fields, output)
 
 # api to get all senior high students from the database for clustering
+# cluster_type is still accepted from the maps page, rows are always ordered by stud_id for the cursor
 @get_students_api_router.get('/api/senior-high-student-data')
 def get_senior_high_student_data(
     cluster_type: Optional[str] = None,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    output: str = Query("json", alias="format"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    query = db.query(models.SeniorHighStudents)
-
-    if cluster_type == "cluster_address":
-        query = query.order_by(models.SeniorHighStudents.cluster_address)
-    elif cluster_type == "cluster_proximity":
-        query = query.order_by(models.SeniorHighStudents.cluster_proximity)
-
-    students = query.all()
-
-    return [
-        {
-            "year": student.year,
-            "strand": student.strand,
-            "previous_school": student.previous_school,
-            "age": student.age,
-            "latitude": student.latitude,
-            "longitude": student.longitude,
-            "cluster": student.cluster,
-        }
-        for student in students
-    ]
+    return students_response(db, models.SeniorHighStudents, cursor, limit, fields, output)
 
 # api to get all college students from the database for clustering
 @get_students_api_router.get('/api/college-student-data')
 def get_college_student_data(
     cluster_type: Optional[str] = None,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    output: str = Query("json", alias="format"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    query = db.query(models.CollegeStudents)
-
-    if cluster_type == "cluster_address":
-        query = query.order_by(models.CollegeStudents.cluster_address)
-    elif cluster_type == "cluster_proximity":
-        query = query.order_by(models.CollegeStudents.cluster_proximity)
-
-    students = query.all()
-
-    return [
-        {
-            "year": student.year,
-            "course": student.course,
-            "strand": student.strand,
-            "previous_school": student.previous_school,
-            "age": student.age,
-            "latitude": student.latitude,
-            "longitude": student.longitude,
-            "cluster": student.cluster,
-        }
-        for student in students
-    ]
-
-# retrieve top 10 schools with most students
+    return students_response(db, models.CollegeStudents, cursor, limit, fields, output)
+
+# breakdowns available in counts mode, course is only stored for college students
+SCHOOL_BREAKDOWNS = {
+    "strand": (models.SeniorHighStudents, models.CollegeStudents),
+    "year": (models.SeniorHighStudents, models.CollegeStudents),
+    "course": (models.CollegeStudents,),
+}
+
+def parse_breakdown(breakdown: Optional[str]) -> list:
+    if not breakdown:
+        return []
+    names = list(dict.fromkeys(name.strip() for name in breakdown.split(",") if name.strip()))
+    unknown = [name for name in names if name not in SCHOOL_BREAKDOWNS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown breakdown: {', '.join(unknown)}. Available breakdowns: {', '.join(SCHOOL_BREAKDOWNS)}"
+        )
+    return names
+
+# per school counts without loading a single student row, schools are merged with the same key as the full mode
+def school_counts(db: Session, breakdown: list, top_n: Optional[int]) -> list:
+    school_map, school_keys = {}, {}
+    for school in school_student_counts(db).all():
+        key = (school.name.strip().lower(), round(school.latitude, 4), round(school.longitude, 4))
+        school_keys[school.id] = key
+        if key not in school_map:
+            school_map[key] = {
+                "id": school.id,
+                "name": school.name,
+                "latitude": school.latitude,
+                "longitude": school.longitude,
+                "senior_high_count": 0,
+                "college_count": 0,
+                **{name: {} for name in breakdown}
+            }
+        school_map[key]["senior_high_count"] += school.senior_high_count
+        school_map[key]["college_count"] += school.college_count
+
+    for school in school_map.values():
+        school["total"] = school["senior_high_count"] + school["college_count"]
+    schools = sorted(school_map.values(), key=lambda school: school["total"], reverse=True)
+    if top_n is not None:
+        schools = schools[:max(0, top_n)]
+    if not breakdown or not schools:
+        return schools
+
+    # the breakdowns are grouped in sql, only for the schools that are returned
+    selected = {id(school) for school in schools}
+    school_ids = [school_id for school_id, key in school_keys.items() if id(school_map[key]) in selected]
+    for name in breakdown:
+        for student_model in SCHOOL_BREAKDOWNS[name]:
+            column = getattr(student_model, name)
+            rows = db.query(student_model.previous_school_id, column, func.count()).filter(
+                student_model.previous_school_id.in_(school_ids)
+            ).group_by(student_model.previous_school_id, column).all()
+            for school_id, value, count in rows:
+                counts = school_map[school_keys[school_id]][name]
+                value = "Unknown" if value is None else str(value)
+                counts[value] = counts.get(value, 0) + count
+    return schools
+
+# retrieve the schools with their students
+# mode=counts only returns student counts per school (largest first), optionally broken down per strand, course
+# and year with breakdown=strand,year, and top_n limits the result to the largest schools
 @get_students_api_router.get('/api/students/all-schools')
-def get_top_schools_with_students(db: Session = Depends(get_db)):
+def get_top_schools_with_students(
+    mode: str = "full",
+    breakdown: Optional[str] = None,
+    top_n: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    if mode == "counts":
+        return school_counts(db, parse_breakdown(breakdown), top_n)
+    if mode != "full":
+        raise HTTPException(status_code=400, detail="Unknown mode. Available modes: full, counts")
+
     schools = db.query(models.PreviousSchool).options(
         joinedload(models.PreviousSchool.students_senior_high),
         joinedload(models.PreviousSchool.students_college)
@@ -144,4 +190,7 @@ def get_top_schools_with_students(db: Session = Depends(get_db)):
         school_map[key]["students_senior_high"].extend(school.students_senior_high)
         school_map[key]["students_college"].extend(school.students_college)
 
-    return list(school_map.values())
+    schools = list(school_map.values())
+    if top_n is not None:
+        schools = sorted(schools, key=lambda school: len(school["students_senior_high"]) + len(school["students_college"]), reverse=True)[:max(0, top_n)]
+    return schools
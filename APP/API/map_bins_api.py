@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+import models, auth, spatial_index
+from student_query import STUDENT_MODELS
+
+map_bins_api_router = APIRouter()
+
+# api to get the students inside a map viewport aggregated into grid bins, with counts per cluster and strand
+# e.g. /api/map-bins/senior-high?west=123.7&south=10.2&east=124.1&north=10.5&zoom=12
+@map_bins_api_router.get('/api/map-bins/{education_level}')
+def get_map_bins(
+    education_level: str,
+    west: float = Query(..., ge=-180, le=180),
+    south: float = Query(..., ge=-90, le=90),
+    east: float = Query(..., ge=-180, le=180),
+    north: float = Query(..., ge=-90, le=90),
+    zoom: int = Query(..., ge=spatial_index.MIN_ZOOM, le=spatial_index.MAX_ZOOM),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    if education_level not in STUDENT_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unknown education level '{education_level}'.")
+    if south > north:
+        raise HTTPException(status_code=400, detail="south must not be greater than north.")
+
+    return spatial_index.get_index(education_level).query(west, south, east, north, zoom)
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+import models, auth, schemas, nearest_campus
+from affected_students import education_level_key
+from student_query import STUDENT_MODELS
+
+nearest_campus_api_router = APIRouter()
+
+# api to get the nearest campus of every student of a level, with the number of students per campus
+# e.g. /api/nearest-campus/senior-high?include_students=true
+@nearest_campus_api_router.get('/api/nearest-campus/{education_level}')
+def get_nearest_campus_students(
+    education_level: str,
+    include_students: bool = Query(False),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    level = education_level_key(education_level)
+    if level not in STUDENT_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unknown education level '{education_level}'.")
+    try:
+        return nearest_campus.student_summary(level, include_students)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# api to get the nearest campus and its distance for a batch of points
+@nearest_campus_api_router.post('/api/nearest-campus')
+def get_nearest_campus_points(request: schemas.NearestCampusRequest, current_user: models.User = Depends(auth.get_current_user)):
+    try:
+        return {"points": nearest_campus.assign_points([(point.lat, point.lng) for point in request.points])}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,36 @@
+import os
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+import models, auth, jobs
+from database import get_db
+
+preprocess_jobs_api_router = APIRouter()
+
+# a job is only visible to the user who started it and to admins, anyone else gets the same 404 as a missing job
+def get_job_or_404(db: Session, job_id: str, current_user: models.User):
+    job = db.query(models.PreprocessJob).filter(models.PreprocessJob.job_id == job_id).first()
+    if not job or (job.user_id != current_user.user_id and current_user.role_id not in [2, 3]):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# api to poll the status and progress of a preprocessing job
+@preprocess_jobs_api_router.get('/api/jobs/{job_id}')
+def get_job_status(job_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    return jobs.job_to_dict(get_job_or_404(db, job_id, current_user))
+
+# api to download the processed csv once the job is completed
+@preprocess_jobs_api_router.get('/api/jobs/{job_id}/result')
+def download_job_result(job_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    job = get_job_or_404(db, job_id, current_user)
+
+    if job.status != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}, the result is not ready yet.")
+    if not job.result_path or not os.path.exists(job.result_path):
+        raise HTTPException(status_code=410, detail="The processed file is no longer available.")
+
+    return FileResponse(
+        path=job.result_path,
+        media_type=jobs.RESULT_MEDIA_TYPES.get(job.job_type, 'text/csv'),
+        filename=jobs.RESULT_FILE_NAMES.get(job.job_type, "preprocessed_file.csv")
+    )
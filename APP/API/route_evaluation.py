@@ -5,9 +5,7 @@ from typing import List, Dict, Any
 import math
 import statistics
 from datetime import datetime
-
-# Global dictionary to store the latest evaluations
-latest_evaluations_store: Dict[tuple, Dict[str, Any]] = {}
+import evaluation_store
 
 class RouteDataInput(BaseModel):
     student_name: str = "Unknown Student"
@@ -81,8 +79,9 @@ def compute_route_quality(distances_km: List[float], times_min: List[float]) ->
 
 route_evaluation_router = APIRouter()
 
+# sync endpoints, the db store blocks and runs in the threadpool
 @route_evaluation_router.post('/evaluate-routes-data', summary="Calculate and store route evaluation from frontend data")
-async def evaluate_and_store_routes_from_data(
+def evaluate_and_store_routes_from_data(
     route_data: RouteDataInput = Body(...)
 ):
     distances = route_data.distances
@@ -143,37 +142,29 @@ async def evaluate_and_store_routes_from_data(
 
     # --- Store the result ---
     storage_key = (student_name, campus_name)
-    latest_evaluations_store[storage_key] = {
-        "data": evaluation_results,
-        "timestamp": datetime.now() # Timestamp of storage
-    }
-    print(f"Stored evaluation for {storage_key} at {latest_evaluations_store[storage_key]['timestamp']}") # Server log
+    stored_at = evaluation_store.get_store().save(storage_key, evaluation_results)
+    print(f"Stored evaluation for {storage_key} at {stored_at}") # Server log
 
     # Optionally return the same data back to the frontend (as before)
     return JSONResponse(content=evaluation_results)
 
 
 @route_evaluation_router.get('/evaluate-routes', summary="Get latest stored route evaluation for Notebook")
-async def get_latest_evaluation_for_notebook(
+def get_latest_evaluation_for_notebook(
     student_name: str = Query("Unknown Student"),  # Match the exact default 
     campus_name: str = Query("USJ-R Main Campus")
 ):
-    storage_key = (student_name, campus_name)
-    print(f"GET request received with key: {storage_key}")  # Add debug log
-    
-    print(f"Available keys in store: {list(latest_evaluations_store.keys())}")  # Show what's available
-    
-    stored_result = latest_evaluations_store.get(storage_key)
     """
     Retrieves the most recently calculated and stored route evaluation
     for the specified student and campus, intended for consumption by
     analysis tools like Jupyter notebooks.
     """
     storage_key = (student_name, campus_name)
-    stored_result = latest_evaluations_store.get(storage_key)
+    print(f"GET request received with key: {storage_key}")  # Add debug log
+    stored_result = evaluation_store.get_store().latest(storage_key)
 
     if stored_result:
-        print(f"Retrieved stored evaluation for {storage_key} (stored at {stored_result['timestamp']})") # Server log
+        print(f"Retrieved stored evaluation for {storage_key} (stored at {stored_result['stored_at']})") # Server log
         # Return the actual data part that was stored
         return JSONResponse(content=stored_result["data"])
     else:
@@ -182,4 +173,25 @@ async def get_latest_evaluation_for_notebook(
             status_code=404,
             detail=f"No evaluation data found for student '{student_name}' and campus '{campus_name}'. "
                    f"Please perform a route calculation in the frontend GIS application first."
-        )
\ No newline at end of file
+        )
+
+
+@route_evaluation_router.get('/evaluate-routes/history', summary="Get past route evaluations of a student and campus")
+def get_evaluation_history(
+    student_name: str = Query("Unknown Student"),
+    campus_name: str = Query("USJ-R Main Campus"),
+    limit: int = Query(evaluation_store.EVALUATION_HISTORY_LIMIT, ge=1, le=evaluation_store.EVALUATION_HISTORY_LIMIT)
+):
+    """
+    Returns the stored evaluations for the specified student and campus,
+    newest first. At most EVALUATION_HISTORY_LIMIT are kept per pair.
+    """
+    history = evaluation_store.get_store().history((student_name, campus_name), limit)
+    return {
+        "studentName": student_name,
+        "campusName": campus_name,
+        "evaluations": [
+            {"storedAt": entry["stored_at"].isoformat(), "data": entry["data"]}
+            for entry in history
+        ]
+    }
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends, HTTPException
+import models, auth, schemas, routing
+
+routing_api_router = APIRouter()
+
+# api to get the best routes from start to end that avoid the hazard polygons
+# sync endpoint, the router calls block and run in the threadpool
+@routing_api_router.post('/api/routes/detour')
+def get_detour_routes(request: schemas.DetourRequest, current_user: models.User = Depends(auth.get_current_user)):
+    try:
+        return routing.detour_routes(
+            (request.start.lat, request.start.lng),
+            (request.end.lat, request.end.lng),
+            request.hazards,
+            request.alternatives
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except routing.RoutingError as e:
+        raise HTTPException(status_code=502, detail=str(e))
@@ -0,0 +1,57 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+import models, auth, jobs, travel_matrix
+from affected_students import education_level_key
+from database import get_db
+from student_query import STUDENT_MODELS
+
+travel_matrix_api_router = APIRouter()
+
+def level_or_400(education_level: str) -> str:
+    level = education_level_key(education_level)
+    if level not in STUDENT_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unknown education level '{education_level}'.")
+    return level
+
+# api to start a background job that builds or updates the travel matrix of a level, poll it with /api/jobs/{job_id}
+# only the students and campuses that are new or moved since the last build are routed again
+@travel_matrix_api_router.post('/api/travel-matrix/{education_level}')
+def build_travel_matrix(
+    education_level: str,
+    origins: Optional[str] = Query(None, description="clusters or students, TRAVEL_MATRIX_ORIGINS when left out"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_admin)
+):
+    level = level_or_400(education_level)
+    if origins is not None and origins not in travel_matrix.ORIGIN_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown origins '{origins}'.")
+
+    # two builds of one level would route the same cells and replace each other's file
+    active = db.query(models.PreprocessJob).filter(
+        models.PreprocessJob.job_type == "travel-matrix",
+        models.PreprocessJob.status.in_(["queued", "running"])
+    ).all()
+    for active_job in active:
+        if jobs.job_params(active_job).get("education_level") == level:
+            raise HTTPException(status_code=409, detail=f"A travel matrix job for {level} is already {active_job.status}: {active_job.job_id}")
+
+    job = jobs.create_job(db, "travel-matrix", user_id=current_user.user_id, params={"education_level": level, "origins": origins})
+    jobs.submit_job(job.job_id)
+    return jobs.job_to_dict(job)
+
+# api to get the accessibility of every campus from the saved travel matrix
+@travel_matrix_api_router.get('/api/travel-matrix/{education_level}')
+def get_travel_matrix_summary(education_level: str, current_user: models.User = Depends(auth.get_current_user)):
+    summary = travel_matrix.accessibility(level_or_400(education_level))
+    if summary is None:
+        raise HTTPException(status_code=404, detail="The travel matrix has not been built yet.")
+    return summary
+
+# api to get the travel time and distance from one origin (a cluster, or a student id) to every campus
+@travel_matrix_api_router.get('/api/travel-matrix/{education_level}/origins/{origin_key}')
+def get_origin_travel(education_level: str, origin_key: int, current_user: models.User = Depends(auth.get_current_user)):
+    travel = travel_matrix.origin_travel(level_or_400(education_level), origin_key)
+    if travel is None:
+        raise HTTPException(status_code=404, detail="Origin not found in the travel matrix.")
+    return travel
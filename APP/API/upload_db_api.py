@@ -1,206 +1,223 @@
 # upload senior high students data api endpoint
-import csv
-from io import StringIO
+import time
 from fastapi import File, HTTPException, UploadFile, APIRouter, Depends
 
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
 from sqlalchemy.orm import Session
-import auth, models, schemas
+import analytics_store, auth, cluster_store, models, schemas, spatial_index
 from database import get_db
 from datetime import datetime, timezone
+from student_loader import college_row, load_students_csv, senior_high_row
 
 upload_db_api_router = APIRouter()
 
 # upload senior high students data to database
+# sync endpoint so the streamed read and the inserts run in the threadpool instead of blocking the event loop
 @upload_db_api_router.post('/api/upload/senior-high-data')
-async def upload_senior_high_data(file: UploadFile = File(...), db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_admin)):
+def upload_senior_high_data(file: UploadFile = File(...), db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_admin)):
     if file.content_type != 'text/csv':
         raise HTTPException(status_code=400, detail='Invalid file type. Only CSV files are allowed.')
 
-    try:
-        content = await file.read()
-        file_size = len(content) / 1024
-        csv_data = csv.DictReader(StringIO(content.decode('utf-8')))
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f'Failed to read CSV file {str(e)}')
+    # rows are parsed as the file is read, schools are resolved from one preloaded map and students go in
+    # with executemany in chunks
+    summary = analytics_store.SummaryCounts(models.SeniorHighStudents)
+    uploaded = cluster_store.UploadedPoints() if cluster_store.CLUSTER_INCREMENTAL else None
+    stats = load_students_csv(db, file, models.SeniorHighStudents, senior_high_row, summary, uploaded)
+    file_size = stats.pop("file_size")
 
-    students = []
-    for row in csv_data:
-        try:
-            prev_school = db.query(models.PreviousSchool).filter(models.PreviousSchool.name == row['previous_school']).first()
-
-            if not prev_school:
-                prev_school = models.PreviousSchool(
-                    name=row['previous_school'],
-                    latitude=float(row['prev_latitude']),
-                    longitude=float(row['prev_longitude'])
-                )
-                db.add(prev_school)
-                db.commit()
-                db.refresh(prev_school)
-
-            student = models.SeniorHighStudents(
-                stud_id=int(row['stud_id']),
-                year=int(row['year']),
-                strand=row['strand'],
-                age=int(row['age']),
-                previous_school=prev_school,
-                city=row['city'],
-                province=row['province'],
-                barangay=row['barangay'],
-                full_address=row['full_address'],
-                latitude=float(row['latitude']),
-                longitude=float(row['longitude']),
-                cluster=int(row['cluster']) if row['cluster'] else None,
-                previous_school_id=prev_school.id
-            )
-            
-            if prev_school.id:  # if it already exists in db
-                student.previous_school_id = prev_school.id
-            else:
-                # handle db relationship first before committing to db
-                student.previous_school = prev_school
-                
-            students.append(student)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f'Invalid data in row: {row}. Error: {str(e)}')
-
-    db.add_all(students)
-    
     # create activity log
     log_entry = models.UserActivityLog(
         user_id=current_user.user_id,
         activity_type="csv_upload",
         target_table="senior_high_students",
         file_name=file.filename,
-        record_count=len(students),
+        record_count=stats["rows"],
         file_size=file_size
     )
     
     db.add(log_entry)
+    # the analytics counts of the new rows are committed together with them
+    analytics_store.apply_upload(db, "senior-high", summary)
     db.commit()
+    spatial_index.invalidate("senior-high")
+    analytics_store.invalidate("senior-high")
+    # the rows are stored now, so their drift counts against the stored clusters
+    if uploaded is not None:
+        cluster_store.record_upload(db, "senior-high", uploaded)
 
-    return {'message': f'Successfully uploaded Senior High School Student Data. Rows inserted: {len(students)}'}
+    return {
+        'message': f'Successfully uploaded Senior High School Student Data. Rows inserted: {stats["rows"]}',
+        **stats
+    }
 
 
 
 # upload college students data to database
 @upload_db_api_router.post('/api/upload/college-data')
-async def upload_college_data(file: UploadFile = File(...), db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_admin)):
+def upload_college_data(file: UploadFile = File(...), db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_admin)):
     if file.content_type != 'text/csv':
         raise HTTPException(status_code=400, detail='Invalid file type. Only CSV files are allowed.')
 
-    try:
-        content = await file.read()
-        file_size = len(content) / 1024
-        csv_data = csv.DictReader(StringIO(content.decode('utf-8')))
-        
-        rows = list(csv_data)
-        row_count = len(rows)
-        
-        csv_data = csv.DictReader(StringIO(content.decode('utf-8')))
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f'Failed to read CSV file {str(e)}')
-
-    students = []
-    for row in csv_data:
-        try:
-            prev_school = db.query(models.PreviousSchool).filter(models.PreviousSchool.name == row['previous_school']).first()
-
-            if not prev_school:
-                prev_school = models.PreviousSchool(
-                    name=row['previous_school'],
-                    latitude=float(row['prev_latitude']),
-                    longitude=float(row['prev_longitude'])
-                )
-                db.add(prev_school)
-                db.commit()
-                db.refresh(prev_school)
-
-            student = models.CollegeStudents(
-                stud_id=int(row['stud_id']),
-                year=int(row['year']),
-                course=row['course'],
-                age=int(row['age']),
-                strand=row['strand'],
-                previous_school=prev_school,
-                city=row['city'],
-                province=row['province'],
-                barangay=row['barangay'],
-                full_address=row['full_address'],
-                latitude=float(row['latitude']),
-                longitude=float(row['longitude']),
-                cluster=int(row['cluster']) if row['cluster'] else None,
-                previous_school_id=prev_school.id
-            )
-            
-            if prev_school and prev_school.id:  # if it already exists in db
-                student.previous_school_id = prev_school.id
-            else:
-                # handle db relationship first before committing to db
-                student.previous_school = prev_school
-             
-            students.append(student)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f'Invalid data in row: {row}. Error: {str(e)}')
-
-    db.add_all(students)
+    summary = analytics_store.SummaryCounts(models.CollegeStudents)
+    uploaded = cluster_store.UploadedPoints() if cluster_store.CLUSTER_INCREMENTAL else None
+    stats = load_students_csv(db, file, models.CollegeStudents, college_row, summary, uploaded)
+    file_size = stats.pop("file_size")
+
     # log activity
     log_entry = models.UserActivityLog(
         user_id=current_user.user_id,
         activity_type="csv_upload",
         target_table="college_students",
         file_name=file.filename,
-        record_count=len(students),
+        record_count=stats["rows"],
         file_size=file_size
     )
     db.add(log_entry)
+    # the analytics counts of the new rows are committed together with them
+    analytics_store.apply_upload(db, "college", summary)
     db.commit()
+    spatial_index.invalidate("college")
+    analytics_store.invalidate("college")
+    # the rows are stored now, so their drift counts against the stored clusters
+    if uploaded is not None:
+        cluster_store.record_upload(db, "college", uploaded)
 
-    return {'message': f'Successfully uploaded College Student Data. Rows inserted: {len(students)}'}
+    return {
+        'message': f'Successfully uploaded College Student Data. Rows inserted: {stats["rows"]}',
+        **stats
+    }
 
 
-@upload_db_api_router.post("/api/remove-all-student-data")
-async def remove_all_student_data(
-    db: Session = Depends(get_db),
-    current_user: schemas.UserInDBBase = Depends(auth.get_current_admin)
-):
+STUDENT_TABLES = {
+    "senior-high": models.SeniorHighStudents.__table__,
+    "college": models.CollegeStudents.__table__,
+}
+SCHOOL_TABLE = models.PreviousSchool.__table__
 
-    senior_high_count = db.query(models.SeniorHighStudents).count()
-    college_count = db.query(models.CollegeStudents).count()
-    previous_school_count = db.query(models.PreviousSchool).count()
 
-    db.query(models.SeniorHighStudents).delete()
-    db.query(models.CollegeStudents).delete()
-    db.query(models.PreviousSchool).delete()
+# row counts of several tables with one aggregate query
+def count_rows(db: Session, tables) -> dict:
+    counts = db.execute(select(*[
+        select(func.count()).select_from(table).scalar_subquery().label(table.name) for table in tables
+    ])).one()
+    return dict(counts._mapping)
 
-    logs = [
-        models.UserActivityLog(
-            user_id=current_user.user_id,
-            activity_type="data_delete",
-            target_table="senior_high_students",
-            record_count=senior_high_count,
-        ),
-        models.UserActivityLog(
-            user_id=current_user.user_id,
-            activity_type="data_delete",
-            target_table="college_students",
-            record_count=college_count,
-        ),
+
+# empty the tables in the given order (students before the schools they reference)
+# mysql uses TRUNCATE, which drops and recreates the table instead of deleting row by row, with the foreign key
+# checks off for the session so previous_schools can be truncated while the student tables point at it.
+# other databases, or a mysql user without the DROP privilege, fall back to a plain DELETE per table.
+# TRUNCATE commits on its own in mysql, so callers commit everything else first and the wipe is committed here
+def wipe_tables(db: Session, tables):
+    if db.get_bind().dialect.name == "mysql":
+        try:
+            db.execute(text("SET FOREIGN_KEY_CHECKS = 0"))
+            try:
+                for table in tables:
+                    db.execute(text(f"TRUNCATE TABLE `{table.name}`"))
+            finally:
+                db.execute(text("SET FOREIGN_KEY_CHECKS = 1"))
+            db.commit()
+            return
+        except (OperationalError, ProgrammingError) as e:
+            print(f"TRUNCATE failed, deleting instead: {e}")
+            db.rollback()
+
+    for table in tables:
+        db.execute(table.delete())
+    db.commit()
+
+
+# previous schools no student points to anymore
+def delete_orphan_schools(db: Session) -> int:
+    referenced = [
+        select(table.c.previous_school_id).where(table.c.previous_school_id.is_not(None))
+        for table in STUDENT_TABLES.values()
+    ]
+    result = db.execute(SCHOOL_TABLE.delete().where(
+        SCHOOL_TABLE.c.id.not_in(referenced[0]),
+        SCHOOL_TABLE.c.id.not_in(referenced[1])
+    ))
+    return result.rowcount
+
+
+def delete_logs(user_id: int, counts: dict):
+    return [
         models.UserActivityLog(
-            user_id=current_user.user_id,
+            user_id=user_id,
             activity_type="data_delete",
-            target_table="previous_schools",
-            record_count=previous_school_count,
-        ),
+            target_table=table_name,
+            record_count=count,
+        )
+        for table_name, count in counts.items()
     ]
-    db.add_all(logs)
+
+
+@upload_db_api_router.post("/api/remove-all-student-data")
+def remove_all_student_data(
+    db: Session = Depends(get_db),
+    current_user: schemas.UserInDBBase = Depends(auth.get_current_admin)
+):
+    start = time.perf_counter()
+    tables = [*STUDENT_TABLES.values(), SCHOOL_TABLE]
+    counts = count_rows(db, tables)
+
+    # the stored centroids belong to the students that are removed
+    db.query(models.ClusterModel).delete()
+    analytics_store.discard(db)
+    db.add_all(delete_logs(current_user.user_id, counts))
     db.commit()
 
+    wipe_tables(db, tables)
+    spatial_index.invalidate()
+    analytics_store.invalidate()
+
     return {
         "message": "All student and previous school data removed successfully.",
         "details": {
-            "senior_high_deleted": senior_high_count,
-            "college_deleted": college_count,
-            "previous_schools_deleted": previous_school_count,
-        }
+            "senior_high_deleted": counts["senior_high_students"],
+            "college_deleted": counts["college_students"],
+            "previous_schools_deleted": counts["previous_schools"],
+        },
+        "seconds": round(time.perf_counter() - start, 3)
     }
+
+
+# remove one education level, previous schools are only removed once no student of either level uses them
+def remove_education_level_data(db: Session, education_level: str, user_id: int) -> dict:
+    start = time.perf_counter()
+    table = STUDENT_TABLES[education_level]
+    counts = count_rows(db, [table])
+
+    db.query(models.ClusterModel).filter(models.ClusterModel.education_level == education_level).delete()
+    analytics_store.discard(db, education_level)
+    db.add_all(delete_logs(user_id, counts))
+    db.commit()
+
+    wipe_tables(db, [table])
+    # orphans are only known once the students are gone, they get a log entry of their own
+    counts["previous_schools"] = delete_orphan_schools(db)
+    db.add_all(delete_logs(user_id, {"previous_schools": counts["previous_schools"]}))
+    db.commit()
+    spatial_index.invalidate(education_level)
+    analytics_store.invalidate(education_level)
+    return {"details": counts, "seconds": round(time.perf_counter() - start, 3)}
+
+
+@upload_db_api_router.post("/api/remove-senior-high-data")
+def remove_senior_high_data(
+    db: Session = Depends(get_db),
+    current_user: schemas.UserInDBBase = Depends(auth.get_current_admin)
+):
+    result = remove_education_level_data(db, "senior-high", current_user.user_id)
+    return {"message": "Senior High student data removed successfully.", **result}
+
+
+@upload_db_api_router.post("/api/remove-college-data")
+def remove_college_data(
+    db: Session = Depends(get_db),
+    current_user: schemas.UserInDBBase = Depends(auth.get_current_admin)
+):
+    result = remove_education_level_data(db, "college", current_user.user_id)
+    return {"message": "College student data removed successfully.", **result}
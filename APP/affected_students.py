@@ -0,0 +1,169 @@
+# affected_students.py
+# students inside drawn event areas, counted on the server
+#
+# candidates come from the latitude sorted arrays of spatial_index: the students between the south and north edge
+# of an area's bounding box are one searchsorted slice, the longitude range is a vectorized mask over that slice,
+# and only those candidates get the point in polygon test. the test is an even-odd ray cast over every edge at
+# once for a block of candidates, so holes and multipolygons need no special handling.
+import os, time
+from dotenv import load_dotenv
+import numpy as np
+
+import spatial_index
+
+load_dotenv()
+
+# edges x candidates tested at once, bounds the memory of one ray cast block
+RAY_CAST_BLOCK = 2_000_000
+# most features one what-if batch may hold
+IMPACT_MAX_FEATURES = int(os.getenv("IMPACT_MAX_FEATURES", 500))
+# radius turf.area uses, so the areas match the ones the map shows
+WGS84_RADIUS_M = 6378137.0
+
+
+# polygons of a geojson geometry, feature or feature collection as lists of [lng, lat] ring arrays
+def area_polygons(geojson: dict) -> list:
+    if not isinstance(geojson, dict):
+        raise ValueError("GeoJSON must be an object")
+    kind = geojson.get("type")
+    if kind == "FeatureCollection":
+        return [polygon for feature in geojson.get("features") or [] for polygon in area_polygons(feature)]
+    if kind == "Feature":
+        return area_polygons(geojson.get("geometry") or {})
+    if kind == "GeometryCollection":
+        return [polygon for geometry in geojson.get("geometries") or [] for polygon in area_polygons(geometry)]
+
+    try:
+        if kind == "Polygon":
+            polygons = [geojson["coordinates"]]
+        elif kind == "MultiPolygon":
+            polygons = geojson["coordinates"]
+        else:
+            raise ValueError(f"Unsupported geometry type '{kind}', only Polygon and MultiPolygon areas are supported")
+        polygons = [[np.asarray(ring, dtype=np.float64)[:, :2] for ring in polygon] for polygon in polygons]
+    except (KeyError, TypeError, IndexError) as e:
+        raise ValueError(f"Invalid {kind} coordinates: {e}")
+
+    for polygon in polygons:
+        if not polygon or any(len(ring) < 3 for ring in polygon):
+            raise ValueError("Every polygon ring needs at least 3 positions")
+    return polygons
+
+
+# even-odd rule over every ring of a polygon, holes flip the points inside them back to outside
+def points_in_polygon(x: np.ndarray, y: np.ndarray, polygon: list) -> np.ndarray:
+    inside = np.zeros(len(x), dtype=bool)
+    for ring in polygon:
+        xi, yi = ring[:, 0][:, None], ring[:, 1][:, None]
+        xj, yj = np.roll(ring[:, 0], 1)[:, None], np.roll(ring[:, 1], 1)[:, None]
+        block = max(1, RAY_CAST_BLOCK // len(ring))
+        for start in range(0, len(x), block):
+            px, py = x[start:start + block], y[start:start + block]
+            # horizontal edges never straddle py, the division by zero they cause is masked out
+            with np.errstate(divide="ignore", invalid="ignore"):
+                crosses = ((yi > py) != (yj > py)) & (px < (xj - xi) * (py - yi) / (yj - yi) + xi)
+            inside[start:start + block] ^= (np.count_nonzero(crosses, axis=0) % 2).astype(bool)
+    return inside
+
+
+# positions in the spatial index of the students inside any polygon of geojson
+def students_in_area(index, geojson: dict) -> np.ndarray:
+    found = []
+    for polygon in area_polygons(geojson):
+        outer = polygon[0]
+        west, south = outer.min(axis=0)
+        east, north = outer.max(axis=0)
+        candidates = index.in_box(west, south, east, north)
+        if len(candidates):
+            inside = points_in_polygon(index.longitude[candidates], index.latitude[candidates], polygon)
+            found.append(candidates[inside])
+    return np.unique(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+
+
+# geodesic area of a ring in square metres, the spherical excess approximation turf.area uses
+def ring_area(ring: np.ndarray) -> float:
+    lng, lat = np.radians(ring[:, 0]), np.radians(ring[:, 1])
+    lng_next, lat_next = np.roll(lng, -1), np.roll(lat, -1)
+    return abs(float(((lng_next - lng) * (2 + np.sin(lat) + np.sin(lat_next))).sum())) * WGS84_RADIUS_M ** 2 / 2
+
+
+# holes are subtracted from their outer ring
+def area_m2(geojson: dict) -> float:
+    return sum(ring_area(polygon[0]) - sum(ring_area(hole) for hole in polygon[1:]) for polygon in area_polygons(geojson))
+
+
+def code_counts(codes: np.ndarray, label) -> dict:
+    values, counts = np.unique(codes, return_counts=True)
+    return {label(int(value)): int(count) for value, count in zip(values, counts)}
+
+
+# "senior_high" from the map and "senior-high" from the api paths both name the same level
+def education_level_key(education_level: str) -> str:
+    return (education_level or "").strip().lower().replace("_", "-")
+
+
+# affected students of one education level per area type, areas is {area type: [geojson, ...]}
+def affected_students(education_level: str, areas: dict, include_ids: bool = True) -> dict:
+    index = spatial_index.get_index(education_level)
+    result, affected = {}, []
+    for area_type, shapes in areas.items():
+        positions = [students_in_area(index, shape) for shape in shapes or []]
+        positions = np.unique(np.concatenate(positions)) if positions else np.zeros(0, dtype=np.int64)
+        affected.append(positions)
+        result[area_type] = {"count": int(len(positions))}
+        if include_ids:
+            result[area_type]["stud_ids"] = index.stud_id[positions].tolist()
+
+    total = np.unique(np.concatenate(affected)) if affected else []
+    return {"education_level": education_level, "total": int(len(total)), "areas": result}
+
+
+# what-if impact of many candidate areas of one education level at once
+# every feature gets its affected students per cluster and strand, and every pair of features that share
+# students gets the number of students in both
+def impact_batch(education_level: str, features: list) -> dict:
+    index = spatial_index.get_index(education_level)
+    strand_label = lambda code: index.strand_values[code] if code >= 0 else "Unknown"
+    cluster_label = lambda code: str(code) if code >= 0 else "Unknown"
+
+    found, results = [], []
+    for feature in features:
+        positions = students_in_area(index, feature)
+        found.append(positions)
+        results.append({
+            "count": int(len(positions)),
+            "clusters": code_counts(index.cluster[positions], cluster_label),
+            "strands": code_counts(index.strand[positions], strand_label),
+        })
+
+    # membership matrix over the students inside any feature, its gram matrix holds the shared counts
+    affected = np.unique(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+    overlaps = []
+    if len(features) > 1 and len(affected):
+        membership = np.zeros((len(features), len(affected)), dtype=np.float32)
+        for row, positions in enumerate(found):
+            membership[row, np.searchsorted(affected, positions)] = 1
+        shared = membership @ membership.T
+        first, second = np.nonzero(np.triu(shared, k=1))
+        overlaps = [
+            {"a": int(a), "b": int(b), "students": int(shared[a, b])}
+            for a, b in zip(first.tolist(), second.tolist())
+        ]
+
+    return {"total": int(len(affected)), "features": results, "overlaps": overlaps}
+
+
+# areas of every feature plus the impact per education level
+def impact_analysis(education_levels: list, features: list) -> dict:
+    if len(features) > IMPACT_MAX_FEATURES:
+        raise ValueError(f"At most {IMPACT_MAX_FEATURES} features can be analysed at once")
+    start = time.perf_counter()
+    areas = []
+    for number, feature in enumerate(features):
+        area = area_m2(feature)
+        properties = feature.get("properties") or {}
+        areas.append({"index": number, "id": feature.get("id", properties.get("name")), "area_m2": area})
+    levels = {level: impact_batch(level, features) for level in education_levels}
+    seconds = time.perf_counter() - start
+    print(f"Analysed {len(features)} event areas against {', '.join(education_levels)} students in {seconds:.3f}s")
+    return {"areas": areas, "levels": levels, "seconds": round(seconds, 3)}
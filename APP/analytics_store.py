@@ -0,0 +1,172 @@
+# analytics_store.py
+# precomputed student counts for the dashboard and the analytics pages
+#
+# one summary per education level holds the number of students and the counts per year, strand, course, city,
+# age, cluster and previous school. summaries are stored in analytics_summaries. an upload merges the counts of
+# the rows it inserts in the same transaction, so the summary never has to be counted again after an upload.
+# removals and re-clustering drop the summary and the next read counts it again with one grouped query per field.
+#
+# reads are served from an in-process cache that holds the summary as ready json bytes with an etag. the stored
+# row is read again after ANALYTICS_CACHE_TTL seconds to pick up changes made by another process.
+import hashlib, json, os, threading, time
+from collections import Counter
+from dotenv import load_dotenv
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+import models
+from student_query import STUDENT_MODELS
+
+load_dotenv()
+
+ANALYTICS_CACHE_TTL = int(os.getenv("ANALYTICS_CACHE_TTL", 60))
+
+# summary field -> student column, fields whose column a level does not have are left out
+SUMMARY_FIELDS = {
+    "year": "year",
+    "strand": "strand",
+    "course": "course",
+    "city": "city",
+    "age": "age",
+    "cluster": "cluster",
+    "school": "previous_school_id",
+}
+
+
+def summary_fields(student_model) -> list:
+    return [name for name, column in SUMMARY_FIELDS.items() if hasattr(student_model, column)]
+
+
+def add_counts(counts: dict, rows):
+    for value, count in rows:
+        key = "Unknown" if value is None else str(value)
+        counts[key] = counts.get(key, 0) + int(count)
+
+
+# count every student of a level, one grouped query per field
+def compute_summary(db, education_level: str) -> dict:
+    student_model = STUDENT_MODELS[education_level]
+    summary = {"total": db.query(func.count()).select_from(student_model).scalar() or 0}
+    for name in summary_fields(student_model):
+        summary[name] = {}
+        if name == "school":
+            rows = db.query(models.PreviousSchool.name, func.count()).select_from(student_model).outerjoin(
+                models.PreviousSchool, student_model.previous_school_id == models.PreviousSchool.id
+            ).group_by(models.PreviousSchool.name).all()
+        else:
+            column = getattr(student_model, SUMMARY_FIELDS[name])
+            rows = db.query(column, func.count()).group_by(column).all()
+        add_counts(summary[name], rows)
+    return summary
+
+
+# counts of the students inserted by one upload, filled by StudentLoader chunk by chunk
+class SummaryCounts:
+    def __init__(self, student_model):
+        self.fields = summary_fields(student_model)
+        self.total = 0
+        self.counts = {name: Counter() for name in self.fields}
+
+    def add(self, students: list):
+        self.total += len(students)
+        for name in self.fields:
+            column = SUMMARY_FIELDS[name]
+            self.counts[name].update(student.get(column) for student in students)
+
+
+def _locked_row(db, education_level: str):
+    return db.query(models.AnalyticsSummary).filter(
+        models.AnalyticsSummary.education_level == education_level
+    ).with_for_update().first()
+
+
+# merge the counts of an upload into the stored summary, called before the upload commits
+def apply_upload(db, education_level: str, counts: SummaryCounts):
+    row = _locked_row(db, education_level)
+    if row is None:
+        # nothing stored yet, count the whole table including the rows of this upload
+        try:
+            with db.begin_nested():
+                db.add(models.AnalyticsSummary(education_level=education_level, summary=compute_summary(db, education_level)))
+            return
+        except IntegrityError:
+            # a summary was stored meanwhile, merge into that one
+            row = _locked_row(db, education_level)
+
+    school_names = {}
+    school_ids = [school_id for school_id in counts.counts.get("school", {}) if school_id is not None]
+    if school_ids:
+        school_names = dict(db.query(models.PreviousSchool.id, models.PreviousSchool.name).filter(
+            models.PreviousSchool.id.in_(school_ids)
+        ).all())
+
+    # a new dict, the JSON column does not see changes made in place
+    summary = {name: dict(value) if isinstance(value, dict) else value for name, value in row.summary.items()}
+    summary["total"] = summary.get("total", 0) + counts.total
+    for name, counter in counts.counts.items():
+        rows = counter.items()
+        if name == "school":
+            rows = [(school_names.get(school_id), count) for school_id, count in rows]
+        add_counts(summary.setdefault(name, {}), rows)
+    row.summary = summary
+
+
+# drop the stored summary of one level, or of every level, it is counted again on the next read
+def discard(db, education_level: str = None):
+    query = db.query(models.AnalyticsSummary)
+    if education_level is not None:
+        query = query.filter(models.AnalyticsSummary.education_level == education_level)
+    query.delete(synchronize_session=False)
+
+
+# education level -> (loaded at, etag, json body, summary)
+_cache = {}
+_cache_lock = threading.Lock()
+# bumped on every invalidation, a summary read before that is not kept
+_generation = 0
+
+
+def _load(db, education_level: str) -> dict:
+    row = db.query(models.AnalyticsSummary).filter(models.AnalyticsSummary.education_level == education_level).first()
+    if row is not None:
+        return {**row.summary, "updated_at": row.updated_at.isoformat() if row.updated_at else None}
+
+    start = time.perf_counter()
+    summary = compute_summary(db, education_level)
+    row = models.AnalyticsSummary(education_level=education_level, summary=summary)
+    try:
+        db.add(row)
+        db.commit()
+    except IntegrityError:
+        # stored by another request meanwhile
+        db.rollback()
+        return _load(db, education_level)
+    print(f"Counted {education_level} analytics summary over {summary['total']} students in {time.perf_counter() - start:.2f}s")
+    return {**summary, "updated_at": row.updated_at.isoformat() if row.updated_at else None}
+
+
+# (etag, json body, summary) of one level
+def cached_summary(db, education_level: str):
+    with _cache_lock:
+        cached = _cache.get(education_level)
+        if cached is not None and time.monotonic() - cached[0] < ANALYTICS_CACHE_TTL:
+            return cached[1:]
+        generation = _generation
+
+    summary = {"education_level": education_level, **_load(db, education_level)}
+    body = json.dumps(summary, separators=(",", ":")).encode("utf-8")
+    etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+    with _cache_lock:
+        if generation == _generation:
+            _cache[education_level] = (time.monotonic(), etag, body, summary)
+    return etag, body, summary
+
+
+def invalidate(education_level: str = None):
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        if education_level is None:
+            _cache.clear()
+        else:
+            _cache.pop(education_level, None)
@@ -0,0 +1,100 @@
+# benchmark_school_matcher.py
+# compares the blocked school matcher against the old pairwise loop on synthetic school names
+# usage: python benchmark_school_matcher.py [sizes...] [--legacy-limit N]
+import random, sys, time
+from rapidfuzz import fuzz
+
+from school_matcher import group_names
+
+PREFIXES = ["SAN", "SANTA", "STO", "ST", "MOTHER", "HOLY", "SACRED", "OUR LADY OF", "DON", "DONA"]
+PLACES = [
+    "JOSE", "ISIDRO", "NINO", "ROSA", "LAPU LAPU", "MANDAUE", "TALISAY", "MINGLANILLA", "CONSOLACION",
+    "LILOAN", "DANAO", "CARCAR", "NAGA", "TOLEDO", "BOGO", "GUADALUPE", "LAHUG", "TALAMBAN", "MABOLO",
+    "BANILAD", "PARDO", "BASAK", "LABANGON", "TISA", "INAYAWAN", "BULACAO", "CORDOVA", "COMPOSTELA",
+]
+KINDS = [
+    "NATIONAL HIGH SCHOOL", "HIGH SCHOOL", "ACADEMY", "COLLEGE", "INSTITUTE", "MONTESSORI SCHOOL",
+    "INTEGRATED SCHOOL", "SCIENCE HIGH SCHOOL", "PAROCHIAL SCHOOL", "CHRISTIAN SCHOOL", "UNIVERSITY",
+]
+
+
+# the pairwise grouping the processors used before school_matcher
+def legacy_group_names(names, threshold=85):
+    grouped = {}
+    assigned = set()
+    for i, name in enumerate(names):
+        if name in assigned:
+            continue
+        grouped[name] = [name]
+        assigned.add(name)
+        for candidate in names[i + 1:]:
+            if candidate in assigned:
+                continue
+            if fuzz.ratio(name, candidate) >= threshold:
+                grouped[name].append(candidate)
+                assigned.add(candidate)
+    return grouped
+
+
+def typo(name, rng):
+    chars = list(name)
+    position = rng.randrange(len(chars))
+    action = rng.choice(["drop", "swap", "double"])
+    if action == "drop":
+        del chars[position]
+    elif action == "swap" and position < len(chars) - 1:
+        chars[position], chars[position + 1] = chars[position + 1], chars[position]
+    else:
+        chars.insert(position, chars[position])
+    return "".join(chars)
+
+
+def synthetic_names(count, seed=42):
+    rng = random.Random(seed)
+    names = []
+    seen = set()
+    while len(names) < count:
+        if names and rng.random() < 0.4:
+            name = typo(rng.choice(names), rng)
+        else:
+            parts = [rng.choice(PLACES), rng.choice(KINDS)]
+            if rng.random() < 0.5:
+                parts.insert(0, rng.choice(PREFIXES))
+            if rng.random() < 0.3:
+                parts.insert(-1, rng.choice(PLACES))
+            name = " ".join(parts)
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+
+def main():
+    args = sys.argv[1:]
+    legacy_limit = 5000
+    if "--legacy-limit" in args:
+        position = args.index("--legacy-limit")
+        legacy_limit = int(args[position + 1])
+        del args[position:position + 2]
+    sizes = [int(arg) for arg in args] or [1000, 5000, 20000]
+
+    print(f"{'names':>8} {'groups':>8} {'blocked (s)':>12} {'pairwise (s)':>13} {'same groups':>12}")
+    for size in sizes:
+        names = synthetic_names(size)
+
+        start = time.perf_counter()
+        grouped = group_names(names)
+        blocked_time = time.perf_counter() - start
+
+        legacy_time, same = "skipped", "-"
+        if size <= legacy_limit:
+            start = time.perf_counter()
+            legacy = legacy_group_names(names)
+            legacy_time = f"{time.perf_counter() - start:.2f}"
+            same = "yes" if legacy == grouped else "NO"
+
+        print(f"{size:>8} {len(grouped):>8} {blocked_time:>12.2f} {legacy_time:>13} {same:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# cluster_store.py
+# fitted cluster centroids per education level, so new students can join the existing clusters
+#
+# centroids are kept in metres on the local projection of the fit. with CLUSTER_INCREMENTAL on, preprocessing
+# only labels a file against the stored centroids and changes nothing. once the rows are uploaded, record_upload
+# adds the squared distances of the inserted students to the stored totals, and once the mean squared distance
+# has grown by more than CLUSTER_DRIFT_THRESHOLD every student in the database is clustered again from scratch.
+import os, time
+from dotenv import load_dotenv
+import numpy as np
+from sqlalchemy import update
+
+import analytics_store, models, spatial_index
+from clustering import cluster_coordinates, prepare_coordinates, project_local
+from database import SessionLocal
+from student_query import STUDENT_MODELS
+
+load_dotenv()
+
+CLUSTER_INCREMENTAL = os.getenv("CLUSTER_INCREMENTAL", "false").lower() in ("1", "true", "yes")
+# allowed growth of the mean squared distance to the nearest centroid before a full refit, 0.25 = 25%
+CLUSTER_DRIFT_THRESHOLD = float(os.getenv("CLUSTER_DRIFT_THRESHOLD", 0.25))
+
+
+# index of the nearest centroid and the squared distance to it for every point
+def nearest_centroids(points, centroids, chunk_size: int = 65536):
+    labels = np.empty(len(points), dtype=int)
+    distances = np.empty(len(points), dtype=np.float64)
+    centroid_norms = (centroids ** 2).sum(axis=1)
+
+    for start in range(0, len(points), chunk_size):
+        chunk = points[start:start + chunk_size]
+        # |p - c|² = |p|² - 2 p·c + |c|²
+        squared = (chunk ** 2).sum(axis=1)[:, None] - 2 * chunk @ centroids.T + centroid_norms[None, :]
+        chunk_labels = squared.argmin(axis=1)
+        labels[start:start + len(chunk)] = chunk_labels
+        distances[start:start + len(chunk)] = np.maximum(squared[np.arange(len(chunk)), chunk_labels], 0)
+    return labels, distances
+
+
+def get_model(db, education_level: str):
+    return db.query(models.ClusterModel).filter(models.ClusterModel.education_level == education_level).first()
+
+
+def drift(stored: models.ClusterModel, added_inertia: float = 0, added_points: int = 0) -> float:
+    if not stored.fit_points or not stored.fit_inertia:
+        return 0.0
+    baseline = stored.fit_inertia / stored.fit_points
+    current = (stored.fit_inertia + (stored.added_inertia or 0) + added_inertia) / (
+        stored.fit_points + (stored.added_points or 0) + added_points
+    )
+    return current / baseline - 1
+
+
+# save the centroids of a fit, labels are the 0-based labels cluster_coordinates returned for coords
+def save_model(db, education_level: str, coords, labels, info: dict):
+    prepared = prepare_coordinates(coords)
+    labels = np.asarray(labels)
+    valid_labels = labels[prepared["mask"]]
+    stored = get_model(db, education_level)
+
+    clustered = valid_labels >= 0
+    if not clustered.any():
+        if stored is not None:
+            db.delete(stored)
+            db.commit()
+        return None
+
+    # weighted mean of the distinct points of each cluster, density noise is left out
+    point_labels = np.full(len(prepared["points"]), -1, dtype=int)
+    point_labels[prepared["inverse"]] = valid_labels
+    keep = point_labels >= 0
+    k = int(point_labels.max()) + 1
+    sums = np.zeros((k, 2))
+    np.add.at(sums, point_labels[keep], prepared["points"][keep] * prepared["weights"][keep, None])
+    counts = np.bincount(point_labels[keep], weights=prepared["weights"][keep], minlength=k)
+    centroids = sums / np.maximum(counts, 1)[:, None]
+
+    # the baseline is measured the same way incremental students are scored
+    _, distances = nearest_centroids(prepared["points"], centroids)
+    fit_inertia = float((distances * prepared["weights"]).sum())
+
+    if stored is None:
+        stored = models.ClusterModel(education_level=education_level)
+        db.add(stored)
+    stored.method = info.get("method", "kmeans")
+    stored.projection = info.get("projection", "local")
+    stored.origin_latitude, stored.origin_longitude = prepared["origin"]
+    stored.centroids = centroids.tolist()
+    stored.fit_inertia = fit_inertia
+    stored.fit_points = int(prepared["weights"].sum())
+    stored.added_inertia = 0
+    stored.added_points = 0
+    db.commit()
+    return stored
+
+
+# nearest stored centroid for every row of coords, -1 for rows without coordinates
+def assign_to_model(stored: models.ClusterModel, coords):
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    prepared = prepare_coordinates(coords)
+    labels = np.full(len(coords), -1, dtype=int)
+    if not len(prepared["points"]):
+        return labels, 0.0, 0
+
+    points, _ = project_local(prepared["degrees"], (stored.origin_latitude, stored.origin_longitude))
+    point_labels, distances = nearest_centroids(points, np.asarray(stored.centroids, dtype=np.float64))
+    labels[prepared["mask"]] = point_labels[prepared["inverse"]]
+    added_inertia = float((distances * prepared["weights"]).sum())
+    return labels, added_inertia, int(prepared["weights"].sum())
+
+
+def save_student_clusters(db, student_model, stud_ids, clusters):
+    if len(stud_ids):
+        db.execute(
+            update(student_model),
+            [{"stud_id": int(stud_id), "cluster": int(cluster)} for stud_id, cluster in zip(stud_ids, clusters)]
+        )
+        # the cluster counts of the analytics summary are counted again on the next read
+        education_level = next(level for level, model in STUDENT_MODELS.items() if model is student_model)
+        analytics_store.discard(db, education_level)
+        db.commit()
+        # the map bins carry per cluster counts
+        spatial_index.invalidate()
+        analytics_store.invalidate(education_level)
+
+
+# cluster every student in the database, relabel them and save the model
+def refit(db, education_level: str):
+    student_model = STUDENT_MODELS[education_level]
+    rows = db.query(student_model.stud_id, student_model.latitude, student_model.longitude).all()
+    stud_ids = [row[0] for row in rows]
+    coords = np.array([(row[1] or 0, row[2] or 0) for row in rows], dtype=np.float64).reshape(-1, 2)
+    if not len(coords):
+        return
+
+    labels, info = cluster_coordinates(coords)
+    save_student_clusters(db, student_model, stud_ids, np.where(labels >= 0, labels + 1, -1))
+    save_model(db, education_level, coords, labels, info)
+    print(f"Refitted {education_level} clusters on {len(coords)} stored students")
+
+
+# 0-based cluster labels for a file being preprocessed, -1 for rows without coordinates or density noise
+# read only: the file may never be uploaded, so the stored model is only used, never updated
+def cluster_students(education_level: str, coords, incremental: bool = CLUSTER_INCREMENTAL):
+    if incremental:
+        db = SessionLocal()
+        try:
+            stored = get_model(db, education_level)
+        finally:
+            db.close()
+        if stored is not None:
+            labels, _, added_points = assign_to_model(stored, coords)
+            print(f"Labelled {added_points} students with {len(stored.centroids)} stored {education_level} clusters")
+            return labels
+
+    labels, _ = cluster_coordinates(coords)
+    return labels
+
+
+# stud_id, coordinates and cluster of the rows an upload inserted, filled by StudentLoader chunk by chunk
+class UploadedPoints:
+    def __init__(self):
+        self.stud_ids, self.coords, self.clusters = [], [], []
+
+    def add(self, students: list):
+        for student in students:
+            self.stud_ids.append(student["stud_id"])
+            self.coords.append((student.get("latitude") or 0, student.get("longitude") or 0))
+            self.clusters.append(student.get("cluster"))
+
+
+# called after an upload committed its rows: count their drift against the stored model, refit once it is
+# over CLUSTER_DRIFT_THRESHOLD, and relabel the uploaded rows the model now puts in another cluster
+def record_upload(db, education_level: str, uploaded: UploadedPoints):
+    start = time.perf_counter()
+    stored = get_model(db, education_level)
+    if stored is None:
+        # the first incremental upload clusters everything stored, including its own rows
+        refit(db, education_level)
+        return
+
+    labels, added_inertia, added_points = assign_to_model(stored, uploaded.coords)
+    growth = drift(stored, added_inertia, added_points)
+    if growth > CLUSTER_DRIFT_THRESHOLD:
+        print(f"Drift {growth:.1%} is over {CLUSTER_DRIFT_THRESHOLD:.0%}, refitting {education_level} clusters")
+        refit(db, education_level)
+        return
+
+    stored.added_inertia = (stored.added_inertia or 0) + added_inertia
+    stored.added_points = (stored.added_points or 0) + added_points
+    db.commit()
+    print(f"Assigned {added_points} uploaded students to {len(stored.centroids)} stored {education_level} clusters "
+          f"in {(time.perf_counter() - start) * 1000:.1f}ms, drift {growth:.1%}")
+
+    # the file was labelled when it was preprocessed, the model may have been refitted since
+    clusters = np.where(labels >= 0, labels + 1, -1)
+    changed = [i for i, cluster in enumerate(clusters.tolist()) if uploaded.clusters[i] != cluster]
+    if changed:
+        save_student_clusters(
+            db, STUDENT_MODELS[education_level], [uploaded.stud_ids[i] for i in changed], clusters[changed]
+        )
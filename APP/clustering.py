@@ -0,0 +1,239 @@
+# clustering.py
+# student location clustering shared by the senior high and college file processors
+#
+# coordinates are projected once to metres on a local equirectangular plane centred on the data, so a degree
+# of longitude no longer counts as much as a degree of latitude. the projected array is cached by the content
+# of the input, re-running with another method or parameters skips the filtering and projection.
+import hashlib, math, os, threading, time
+from collections import OrderedDict
+from dotenv import load_dotenv
+from joblib import Parallel, delayed
+from kneed import KneeLocator
+import numpy as np
+from sklearn.cluster import DBSCAN, HDBSCAN, KMeans, MiniBatchKMeans
+
+load_dotenv()
+
+# processes used for the k sweep, -1 uses every core
+CLUSTER_N_JOBS = int(os.getenv("CLUSTER_N_JOBS", -1))
+# "kmeans", "minibatch" or "auto" (minibatch once there are at least CLUSTER_MINIBATCH_THRESHOLD points)
+CLUSTER_MODE = os.getenv("CLUSTER_MODE", "auto")
+CLUSTER_MINIBATCH_THRESHOLD = int(os.getenv("CLUSTER_MINIBATCH_THRESHOLD", 10000))
+# "kmeans" (elbow sweep), "dbscan" or "hdbscan"
+CLUSTER_METHOD = os.getenv("CLUSTER_METHOD", "kmeans")
+# "local" clusters metres on the local projection, "haversine" runs dbscan/hdbscan on great circle distances,
+# "degrees" clusters raw latitude/longitude like the processors used to
+CLUSTER_PROJECTION = os.getenv("CLUSTER_PROJECTION", "local")
+# neighbourhood radius for dbscan
+CLUSTER_EPS_M = float(os.getenv("CLUSTER_EPS_M", 500))
+CLUSTER_MIN_SAMPLES = int(os.getenv("CLUSTER_MIN_SAMPLES", 10))
+# smallest hdbscan cluster, counted in distinct locations
+CLUSTER_MIN_CLUSTER_SIZE = int(os.getenv("CLUSTER_MIN_CLUSTER_SIZE", 25))
+
+EARTH_RADIUS_M = 6371008.8
+
+METHODS = ("kmeans", "dbscan", "hdbscan")
+PROJECTIONS = ("local", "haversine", "degrees")
+
+# projected arrays of the last few inputs
+PROJECTION_CACHE_SIZE = 4
+_projection_cache = OrderedDict()
+_projection_lock = threading.Lock()
+
+
+# rows with a missing or (0, 0) style coordinate are left out of clustering
+def valid_mask(coords) -> np.ndarray:
+    coords = np.asarray(coords, dtype=np.float64)
+    return np.isfinite(coords).all(axis=1) & (coords[:, 0] != 0) & (coords[:, 1] != 0)
+
+
+# equirectangular projection around origin (lat, lng), x east and y north in metres
+# the error stays well under 1% across a province sized area
+def project_local(coords, origin=None):
+    coords = np.asarray(coords, dtype=np.float64)
+    if origin is None:
+        origin = (float(coords[:, 0].mean()), float(coords[:, 1].mean())) if len(coords) else (0.0, 0.0)
+    lat0, lng0 = np.radians(origin[0]), np.radians(origin[1])
+    points = np.empty_like(coords)
+    points[:, 0] = EARTH_RADIUS_M * (np.radians(coords[:, 1]) - lng0) * np.cos(lat0)
+    points[:, 1] = EARTH_RADIUS_M * (np.radians(coords[:, 0]) - lat0)
+    return points, origin
+
+
+# valid rows of coords with their local projection, cached by the array content
+# students geocoded to the same address share a coordinate, so the distinct points are kept with their counts
+def prepare_coordinates(coords) -> dict:
+    coords = np.ascontiguousarray(coords, dtype=np.float64).reshape(-1, 2)
+    key = hashlib.sha1(coords.tobytes()).hexdigest()
+    with _projection_lock:
+        if key in _projection_cache:
+            _projection_cache.move_to_end(key)
+            return _projection_cache[key]
+
+    mask = valid_mask(coords)
+    valid = coords[mask]
+    unique, inverse, counts = np.unique(valid, axis=0, return_inverse=True, return_counts=True)
+    # the origin is the mean over every student, not over the distinct points
+    origin = (float(valid[:, 0].mean()), float(valid[:, 1].mean())) if len(valid) else (0.0, 0.0)
+    points, _ = project_local(unique, origin)
+    prepared = {
+        "mask": mask,
+        "degrees": unique,
+        "points": points,
+        "inverse": inverse.reshape(-1),
+        "weights": counts,
+        "origin": origin
+    }
+
+    with _projection_lock:
+        _projection_cache[key] = prepared
+        while len(_projection_cache) > PROJECTION_CACHE_SIZE:
+            _projection_cache.popitem(last=False)
+    return prepared
+
+
+def resolve_mode(n: int, mode: str = CLUSTER_MODE) -> str:
+    if mode == "auto":
+        return "minibatch" if n >= CLUSTER_MINIBATCH_THRESHOLD else "kmeans"
+    if mode not in ("kmeans", "minibatch"):
+        raise ValueError(f"Unknown clustering mode '{mode}'")
+    return mode
+
+
+def fit_kmeans(coords, k: int, mode: str, sample_weight=None):
+    start = time.perf_counter()
+    if mode == "minibatch":
+        model = MiniBatchKMeans(n_clusters=k, random_state=42, init='k-means++', batch_size=4096, n_init=3)
+    else:
+        model = KMeans(n_clusters=k, random_state=42, init='k-means++')
+    model.fit(coords, sample_weight=sample_weight)
+    return k, model, time.perf_counter() - start
+
+
+# fit every k in parallel, returns {k: fitted model} and {k: seconds}
+def elbow_sweep(coords, k_values, mode: str = CLUSTER_MODE, n_jobs: int = CLUSTER_N_JOBS, sample_weight=None):
+    n = len(coords) if sample_weight is None else int(np.sum(sample_weight))
+    mode = resolve_mode(n, mode)
+    results = Parallel(n_jobs=n_jobs)(delayed(fit_kmeans)(coords, k, mode, sample_weight) for k in k_values)
+
+    fitted = {k: model for k, model, _ in results}
+    timings = {k: seconds for k, _, seconds in results}
+    return fitted, timings
+
+
+# pick k with the elbow method over k = 2 .. √(n/2) and return 0-based labels plus run details
+# sample_weight counts how many students share each coordinate, the sweep then only fits the distinct points
+def kmeans_elbow(coords, mode: str = CLUSTER_MODE, n_jobs: int = CLUSTER_N_JOBS, sample_weight=None):
+    n = len(coords) if sample_weight is None else int(np.sum(sample_weight))
+    if len(coords) < 2:
+        return np.zeros(len(coords), dtype=int), {"best_k": 1, "mode": None, "timings": {}, "inertia": {}}
+
+    upper_k = round(math.sqrt(n / 2))
+    print(f"Sample size (all valid students): {n}")
+    print(f"Upper limit for k (√(n/2)): {upper_k}")
+
+    k_values = [k for k in range(2, max(3, upper_k + 1)) if k <= len(coords)]
+    start = time.perf_counter()
+    fitted, timings = elbow_sweep(coords, k_values, mode, n_jobs, sample_weight)
+    sweep_seconds = time.perf_counter() - start
+
+    wcss = [fitted[k].inertia_ for k in k_values]
+    kl = KneeLocator(k_values, wcss, curve='convex', direction='decreasing')
+    best_k = kl.elbow if kl.elbow is not None else 2  # fallback if knee not found
+
+    for k in k_values:
+        print(f"k={k}: inertia={fitted[k].inertia_:.6f}, fit {timings[k]:.3f}s")
+    print(f"✅ Optimal k based on Elbow Method: {best_k} (sweep of {len(k_values)} k took {sweep_seconds:.2f}s)")
+
+    # the model fitted for best_k during the sweep is reused instead of fitting it again
+    best_model = fitted[best_k]
+    return best_model.labels_, {
+        "best_k": best_k,
+        "mode": resolve_mode(n, mode),
+        "timings": timings,
+        "inertia": {k: fitted[k].inertia_ for k in k_values},
+        "sweep_seconds": sweep_seconds,
+        "model": best_model
+    }
+
+
+# labels for the distinct points, dbscan weighs each point by its student count
+# hdbscan has no sample weights, it runs on the distinct points so min_cluster_size counts locations, not
+# students (repeating the points would make every crowded address a cluster of its own)
+def density_cluster(points, weights, method: str, metric: str, eps: float, min_samples: int, min_cluster_size: int):
+    if method == "dbscan":
+        algorithm = "ball_tree" if metric == "haversine" else "kd_tree"
+        model = DBSCAN(eps=eps, min_samples=min_samples, metric=metric, algorithm=algorithm, n_jobs=CLUSTER_N_JOBS)
+        model.fit(points, sample_weight=weights)
+        return model.labels_, model
+
+    model = HDBSCAN(min_cluster_size=min_cluster_size, min_samples=min_samples, metric=metric, n_jobs=CLUSTER_N_JOBS, copy=True)
+    model.fit(points)
+    return model.labels_, model
+
+
+# cluster [latitude, longitude] rows, invalid rows and density noise get -1, clusters are numbered from 0
+def cluster_coordinates(
+    coords,
+    method: str = CLUSTER_METHOD,
+    projection: str = CLUSTER_PROJECTION,
+    mode: str = CLUSTER_MODE,
+    n_jobs: int = CLUSTER_N_JOBS,
+    eps_m: float = CLUSTER_EPS_M,
+    min_samples: int = CLUSTER_MIN_SAMPLES,
+    min_cluster_size: int = CLUSTER_MIN_CLUSTER_SIZE
+):
+    if method not in METHODS:
+        raise ValueError(f"Unknown clustering method '{method}'")
+    if projection not in PROJECTIONS:
+        raise ValueError(f"Unknown projection '{projection}'")
+    if method == "kmeans" and projection == "haversine":
+        raise ValueError("KMeans needs euclidean coordinates, use the 'local' projection instead of 'haversine'")
+
+    start = time.perf_counter()
+    prepared = prepare_coordinates(coords)
+    mask = prepared["mask"]
+    labels = np.full(len(mask), -1, dtype=int)
+
+    if projection == "local":
+        points = prepared["points"]
+    elif projection == "haversine":
+        points = np.radians(prepared["degrees"])
+    else:
+        points = prepared["degrees"]
+
+    weights = prepared["weights"]
+    if method == "kmeans":
+        point_labels, info = kmeans_elbow(points, mode, n_jobs, weights)
+    elif len(points) == 0:
+        point_labels, info = np.zeros(0, dtype=int), {}
+    else:
+        metric = "haversine" if projection == "haversine" else "euclidean"
+        # eps is given in metres, haversine distances are in radians and raw degrees are roughly 111 km each
+        if projection == "haversine":
+            eps = eps_m / EARTH_RADIUS_M
+        elif projection == "degrees":
+            eps = eps_m / (EARTH_RADIUS_M * math.pi / 180)
+        else:
+            eps = eps_m
+        point_labels, model = density_cluster(points, weights, method, metric, eps, min_samples, min_cluster_size)
+        info = {"model": model}
+
+    valid_labels = np.asarray(point_labels)[prepared["inverse"]]
+    labels[mask] = valid_labels
+    n_clusters = int(labels.max()) + 1 if len(labels) and labels.max() >= 0 else 0
+    noise = int((valid_labels < 0).sum())
+    seconds = time.perf_counter() - start
+    print(f"Clustered {int(mask.sum())} of {len(mask)} points ({len(points)} distinct) with {method} on {projection} coordinates: "
+          f"{n_clusters} clusters, {noise} noise points in {seconds:.2f}s")
+
+    info.update({
+        "method": method,
+        "projection": projection,
+        "n_clusters": n_clusters,
+        "noise": noise,
+        "valid": int(mask.sum()),
+        "origin": prepared["origin"],
+        "seconds": seconds
+    })
+    return labels, info
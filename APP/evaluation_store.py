@@ -0,0 +1,141 @@
+# evaluation_store.py
+# storage of the route evaluations posted by the map, keyed by (student name, campus name)
+#
+# the store is picked with EVALUATION_STORE: "db" (the default) saves them in route_evaluations so they survive
+# restarts and are shared by every worker, and "memory" keeps them in this process only, bounded to
+# EVALUATION_CACHE_SIZE keys (least recently used dropped first) and EVALUATION_TTL seconds. both keep the last
+# EVALUATION_HISTORY_LIMIT evaluations of a key for the history endpoint, with stored_at in utc.
+import os, threading, time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+import models
+from database import SessionLocal
+
+load_dotenv()
+
+EVALUATION_STORE = os.getenv("EVALUATION_STORE", "db")
+EVALUATION_CACHE_SIZE = int(os.getenv("EVALUATION_CACHE_SIZE", 1000))
+EVALUATION_TTL = int(os.getenv("EVALUATION_TTL", 86400))
+EVALUATION_HISTORY_LIMIT = int(os.getenv("EVALUATION_HISTORY_LIMIT", 20))
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+# mysql gives the stored utc datetimes back without a timezone
+def _aware(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+# evaluations are returned as {"stored_at": datetime, "data": evaluation}, newest first in a history
+class MemoryEvaluationStore:
+    def __init__(self, size: int = EVALUATION_CACHE_SIZE, ttl: int = EVALUATION_TTL, history: int = EVALUATION_HISTORY_LIMIT):
+        self.size = size
+        self.ttl = ttl
+        self.history_limit = history
+        # key -> deque of (saved at monotonic, stored_at, data), oldest first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def save(self, key: tuple, data: dict) -> datetime:
+        stored_at = _utcnow()
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = deque(maxlen=self.history_limit)
+            self.entries[key].append((time.monotonic(), stored_at, data))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return stored_at
+
+    # evaluations of a key that are not expired, newest first
+    def _fresh(self, key: tuple) -> list:
+        entries = self.entries.get(key)
+        if not entries:
+            return []
+        expired_before = time.monotonic() - self.ttl
+        while entries and entries[0][0] < expired_before:
+            entries.popleft()
+        if not entries:
+            del self.entries[key]
+            return []
+        self.entries.move_to_end(key)
+        return [{"stored_at": stored_at, "data": data} for _, stored_at, data in reversed(entries)]
+
+    def latest(self, key: tuple):
+        with self.lock:
+            fresh = self._fresh(key)
+        return fresh[0] if fresh else None
+
+    def history(self, key: tuple, limit: int = EVALUATION_HISTORY_LIMIT) -> list:
+        with self.lock:
+            return self._fresh(key)[:limit]
+
+
+class DatabaseEvaluationStore:
+    def __init__(self, history: int = EVALUATION_HISTORY_LIMIT):
+        self.history_limit = history
+
+    @staticmethod
+    def _query(db, key: tuple):
+        student_name, campus_name = key
+        return db.query(models.RouteEvaluation).filter(
+            models.RouteEvaluation.student_name == student_name,
+            models.RouteEvaluation.campus_name == campus_name
+        ).order_by(models.RouteEvaluation.created_at.desc(), models.RouteEvaluation.evaluation_id.desc())
+
+    def save(self, key: tuple, data: dict) -> datetime:
+        db = SessionLocal()
+        try:
+            evaluation = models.RouteEvaluation(student_name=key[0], campus_name=key[1], data=data, created_at=_utcnow())
+            db.add(evaluation)
+            db.flush()
+            # keep only the newest evaluations of the key
+            stale = [evaluation_id for (evaluation_id,) in self._query(db, key).with_entities(
+                models.RouteEvaluation.evaluation_id
+            ).offset(self.history_limit).all()]
+            if stale:
+                db.query(models.RouteEvaluation).filter(
+                    models.RouteEvaluation.evaluation_id.in_(stale)
+                ).delete(synchronize_session=False)
+            db.commit()
+            return _aware(evaluation.created_at)
+        finally:
+            db.close()
+
+    def history(self, key: tuple, limit: int = EVALUATION_HISTORY_LIMIT) -> list:
+        db = SessionLocal()
+        try:
+            return [
+                {"stored_at": _aware(evaluation.created_at), "data": evaluation.data}
+                for evaluation in self._query(db, key).limit(limit).all()
+            ]
+        finally:
+            db.close()
+
+    def latest(self, key: tuple):
+        history = self.history(key, 1)
+        return history[0] if history else None
+
+
+# store name -> factory
+STORES = {
+    "memory": MemoryEvaluationStore,
+    "db": DatabaseEvaluationStore,
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            if EVALUATION_STORE not in STORES:
+                raise ValueError(f"Unknown evaluation store '{EVALUATION_STORE}'. Available stores: {', '.join(STORES)}")
+            _store = STORES[EVALUATION_STORE]()
+        return _store
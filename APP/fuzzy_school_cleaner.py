@@ -1,6 +1,6 @@
 import pandas as pd
 import re
-from rapidfuzz import fuzz
+from school_matcher import leader_clusters
 
 
 def clean_school_name(name: str) -> str:
@@ -18,20 +18,16 @@ def clean_school_name(name: str) -> str:
 
 
 def cluster_school_names(names, threshold=90):
-    grouped = {}
+    cleaned_names = [clean_school_name(name) for name in names]
+
+    # match each distinct cleaned name once, names with the same cleaned form always land in the same group
+    unique_cleaned = list(dict.fromkeys(cleaned_names))
+    leader_of = leader_clusters(unique_cleaned, threshold)
+    canonical = {cleaned: unique_cleaned[leader_of[i]] for i, cleaned in enumerate(unique_cleaned)}
 
-    for name in names:
-        cleaned = clean_school_name(name)
-        match = None
-        for canon in grouped:
-            if fuzz.ratio(cleaned, canon) >= threshold:
-                match = canon
-                break
-
-        if match:
-            grouped[match].append(name)
-        else:
-            grouped[cleaned] = [name]
+    grouped = {}
+    for name, cleaned in zip(names, cleaned_names):
+        grouped.setdefault(canonical[cleaned], []).append(name)
 
     return grouped
 
@@ -0,0 +1,129 @@
+# geocode_cache.py
+# persistent geocode cache shared by the file processors, so an address is only sent to the HERE api once
+import hashlib, os, re, threading
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from sqlalchemy.exc import IntegrityError
+
+import models
+from database import SessionLocal
+
+load_dotenv()
+
+# how long a cached result is trusted before it gets geocoded again
+# misses (0, 0) expire sooner so addresses that HERE learns later are retried
+GEOCODE_CACHE_TTL_DAYS = float(os.getenv("GEOCODE_CACHE_TTL_DAYS", 180))
+GEOCODE_CACHE_MISS_TTL_DAYS = float(os.getenv("GEOCODE_CACHE_MISS_TTL_DAYS", 14))
+
+_stats = {"hits": 0, "negative_hits": 0, "misses": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _utcnow():
+    # stored datetimes come back naive from the database so compare everything as naive utc
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# normalize query so "Guadalupe, Cebu City" and "guadalupe ,  cebu city." share one cache entry
+def normalize_query(query: str) -> str:
+    parts = [re.sub(r"[^\w\s]", "", part).lower() for part in str(query).split(",")]
+    parts = [" ".join(part.split()) for part in parts]
+    return ", ".join(part for part in parts if part)
+
+
+def _query_hash(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def _is_expired(entry: models.GeocodeCache) -> bool:
+    if entry.created_at is None:
+        return True
+    ttl_days = GEOCODE_CACHE_TTL_DAYS if entry.is_found else GEOCODE_CACHE_MISS_TTL_DAYS
+    return entry.created_at.replace(tzinfo=None) < _utcnow() - timedelta(days=ttl_days)
+
+
+# returns cached (lat, lng), (0, 0) for a cached miss, or None if the query is not cached
+def get_cached(query: str):
+    normalized = normalize_query(query)
+    db = SessionLocal()
+    try:
+        entry = db.query(models.GeocodeCache).filter(models.GeocodeCache.query_hash == _query_hash(normalized)).first()
+        if entry is None or _is_expired(entry):
+            return None
+        if not entry.is_found:
+            return 0, 0
+        return entry.latitude, entry.longitude
+    finally:
+        db.close()
+
+
+# store a geocode result, (0, 0) is stored as a negative entry
+def store(query: str, latitude: float, longitude: float):
+    normalized = normalize_query(query)
+    query_hash = _query_hash(normalized)
+    is_found = not (latitude == 0 and longitude == 0)
+
+    db = SessionLocal()
+    try:
+        entry = db.query(models.GeocodeCache).filter(models.GeocodeCache.query_hash == query_hash).first()
+        if entry is None:
+            entry = models.GeocodeCache(query_hash=query_hash, query=normalized[:512])
+            db.add(entry)
+        entry.latitude = latitude
+        entry.longitude = longitude
+        entry.is_found = is_found
+        entry.created_at = _utcnow()
+        db.commit()
+    except IntegrityError:
+        # another upload cached the same address first
+        db.rollback()
+    finally:
+        db.close()
+
+
+# look up the cache first and only call fetch() on a miss
+# fetch() returns (lat, lng), (0, 0) when the address has no result, or None on api errors (never cached)
+def cached_geocode(query: str, fetch):
+    cached = get_cached(query)
+    if cached is not None:
+        _count("hits" if cached != (0, 0) else "negative_hits")
+        return cached
+
+    _count("misses")
+    result = fetch()
+    if result is None:
+        _count("errors")
+        return 0, 0
+
+    store(query, result[0], result[1])
+    return result
+
+
+# raw counters, jobs return what they added so the server process that submitted them can merge it
+def get_counts() -> dict:
+    with _stats_lock:
+        return dict(_stats)
+
+
+def add_counts(counts: dict):
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] += counts.get(name, 0)
+
+
+def get_stats():
+    stats = get_counts()
+    lookups = stats["hits"] + stats["negative_hits"] + stats["misses"]
+    stats["hit_rate"] = (stats["hits"] + stats["negative_hits"]) / lookups if lookups else 0.0
+    return stats
+
+
+def reset_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
@@ -0,0 +1,164 @@
+# geocoding.py
+# shared geocoding helpers for the senior high and college file processors
+import os, re, random, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from fastapi import HTTPException
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+import geocode_cache
+
+load_dotenv()
+
+HERE_GEOCODE_URL = "https://geocode.search.hereapi.com/v1/geocode"
+
+# number of lookups running at the same time
+GEOCODE_CONCURRENCY = int(os.getenv("GEOCODE_CONCURRENCY", 8))
+# requests per second sent to HERE (the freemium plan allows 5 rps)
+GEOCODE_RATE_LIMIT = float(os.getenv("GEOCODE_RATE_LIMIT", 5))
+# retries for 429 and 5xx responses, waits 0.5s, 1s, 2s ... between attempts
+GEOCODE_MAX_RETRIES = int(os.getenv("GEOCODE_MAX_RETRIES", 3))
+GEOCODE_TIMEOUT = float(os.getenv("GEOCODE_TIMEOUT", 5))
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+# token bucket shared by all worker threads so the combined request rate never exceeds the quota
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class GeocodingEngine:
+    def __init__(self, api_key: str, concurrency: int = GEOCODE_CONCURRENCY, rate_limit: float = GEOCODE_RATE_LIMIT,
+                 max_retries: int = GEOCODE_MAX_RETRIES, timeout: float = GEOCODE_TIMEOUT):
+        self.api_key = api_key
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate_limit)
+
+        # keep-alive session, one pooled connection per worker thread
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount("https://", adapter)
+
+    # call HERE for one query
+    # returns (lat, lng), (0, 0) when HERE has no result, or None when the request keeps failing
+    def fetch(self, query: str):
+        params = {"q": query, "apiKey": self.api_key}
+
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                response = self.session.get(HERE_GEOCODE_URL, params=params, timeout=self.timeout)
+            except requests.RequestException as e:
+                print(f"Error geocoding {query}: {e}")
+                response = None
+
+            if response is not None and response.status_code not in RETRY_STATUS_CODES:
+                break
+
+            if attempt < self.max_retries:
+                retry_after = response.headers.get("Retry-After") if response is not None else None
+                delay = float(retry_after) if retry_after and retry_after.isdigit() else 0.5 * (2 ** attempt)
+                time.sleep(delay + random.uniform(0, 0.1))
+        else:
+            print(f"Giving up geocoding {query} after {self.max_retries + 1} attempts")
+            return None
+
+        if response.status_code != 200:
+            print(f"Error geocoding {query}: {response.status_code}")
+            return None
+
+        items = response.json().get("items")
+        if not items:
+            print(f"Geocoding failed for {query}, returning 'Unknown'")
+            return 0, 0
+        return items[0]["position"]["lat"], items[0]["position"]["lng"]
+
+    # cached lookup, only cache misses reach the network
+    def geocode(self, query: str):
+        return geocode_cache.cached_geocode(query, lambda: self.fetch(query))
+
+    def geocode_many(self, queries: list) -> list:
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            return list(executor.map(self.geocode, queries))
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+# one engine per api key per process so the session and rate limiter are shared between uploads
+def get_engine(api_key: str = None) -> GeocodingEngine:
+    api_key = api_key or os.getenv("GEOCODE_API_KEY")
+    if not api_key:
+        raise HTTPException(status_code=500, detail="Geocode API key is missing.")
+
+    with _engines_lock:
+        if api_key not in _engines:
+            _engines[api_key] = GeocodingEngine(api_key)
+        return _engines[api_key]
+
+
+def clean_text(text):
+    return re.sub(r'[^\w\s]', '', str(text))
+
+
+# geocode address function
+def geocode_address(address, api_key=None):
+    return get_engine(api_key).geocode(address)
+
+
+# geocode previous school function
+def geocode_previous_school(school: str, barangay: str = "", city: str = "", province: str = ""):
+    if not school or school.strip().lower() == "na":
+        return 0, 0
+
+    query_parts = [clean_text(school)]
+
+    if barangay:
+        query_parts.append(barangay.title())
+    if city:
+        query_parts.append(city.title())
+    if province:
+        query_parts.append(province.title())
+    query_parts.append("Philippines")
+
+    return get_engine().geocode(", ".join(query_parts))
+
+
+# geocode each distinct combination of key_columns once, then join the coordinates back onto every row
+# geocode_fn receives the key column values as positional arguments and returns (lat, lng)
+def geocode_unique(df: pd.DataFrame, key_columns: list, geocode_fn, lat_column: str, lng_column: str) -> pd.DataFrame:
+    unique_keys = df[key_columns].drop_duplicates().reset_index(drop=True)
+    print(f"Geocoding {len(unique_keys)} unique {'/'.join(key_columns)} values for {len(df)} rows")
+
+    keys = list(unique_keys.itertuples(index=False, name=None))
+    with ThreadPoolExecutor(max_workers=max(1, GEOCODE_CONCURRENCY)) as executor:
+        coordinates = list(executor.map(lambda key: geocode_fn(*key), keys))
+
+    unique_keys[lat_column] = [lat for lat, _ in coordinates]
+    unique_keys[lng_column] = [lng for _, lng in coordinates]
+
+    df = df.drop(columns=[lat_column, lng_column], errors='ignore')
+    return df.merge(unique_keys, on=key_columns, how='left')
@@ -0,0 +1,232 @@
+# jobs.py
+# background jobs for the raw csv preprocessors and the travel time matrix
+# uploads, or the parameters of jobs without an upload, are saved to PREPROCESS_JOB_DIR, the work runs in a
+# process pool and the job state lives in the preprocess_jobs table, so jobs left queued or running by a server
+# that stopped are run again
+import importlib, json, os, shutil, threading, time, traceback, uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+import models, geocode_cache
+from database import SessionLocal, engine
+
+load_dotenv()
+
+PREPROCESS_JOB_DIR = os.getenv("PREPROCESS_JOB_DIR", "jobs")
+PREPROCESS_JOB_WORKERS = int(os.getenv("PREPROCESS_JOB_WORKERS", 2))
+# a running job touches its updated_at every PREPROCESS_JOB_HEARTBEAT seconds, one that has not been touched for
+# PREPROCESS_JOB_LEASE seconds belongs to a process that is gone and is run again
+PREPROCESS_JOB_HEARTBEAT = int(os.getenv("PREPROCESS_JOB_HEARTBEAT", 30))
+PREPROCESS_JOB_LEASE = int(os.getenv("PREPROCESS_JOB_LEASE", 120))
+
+# job type -> "module:function" that takes (file_path, progress) and returns the path of the processed file
+# resolved inside the worker so the api modules are not imported here
+JOB_HANDLERS = {
+    "college": "API.college_file_processor_api:preprocess_file_college",
+    "seniorhigh": "API.senior_high_processor_api:preprocess_file_seniorhigh",
+    "travel-matrix": "travel_matrix:run_travel_matrix_job",
+}
+
+# download name of the processed file per job type
+RESULT_FILE_NAMES = {
+    "college": "[1]_preprocessed_college_file.csv",
+    "seniorhigh": "preprocessed_seniorhigh_file.csv",
+    "travel-matrix": "travel_matrix.npz",
+}
+
+# media type of the result file per job type, csv when not listed
+RESULT_MEDIA_TYPES = {
+    "travel-matrix": "application/octet-stream",
+}
+
+_executor = None
+
+
+def _init_worker():
+    # forked workers must not reuse the parent's pooled database connections
+    engine.dispose(close=False)
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PREPROCESS_JOB_WORKERS, initializer=_init_worker)
+    return _executor
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+# save the upload, or the parameters of a job without one, and create a queued job for it
+def create_job(db, job_type: str, upload_file=None, user_id: int = None, params: dict = None) -> models.PreprocessJob:
+    if job_type not in JOB_HANDLERS:
+        raise HTTPException(status_code=400, detail=f"Unknown job type '{job_type}'.")
+
+    job_id = str(uuid.uuid4())
+    job_dir = os.path.join(PREPROCESS_JOB_DIR, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+
+    if upload_file is not None:
+        input_path = os.path.join(job_dir, "input.csv")
+        with open(input_path, "wb") as out:
+            shutil.copyfileobj(upload_file.file, out)
+    else:
+        input_path = os.path.join(job_dir, "params.json")
+        with open(input_path, "w") as out:
+            json.dump(params or {}, out)
+
+    job = models.PreprocessJob(
+        job_id=job_id,
+        job_type=job_type,
+        status="queued",
+        progress=0,
+        message="Waiting for a worker",
+        file_name=upload_file.filename if upload_file is not None else None,
+        input_path=input_path,
+        user_id=user_id
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+# parameters a job without an upload was created with
+def job_params(job: models.PreprocessJob) -> dict:
+    if job.file_name is not None or not job.input_path or not os.path.exists(job.input_path):
+        return {}
+    with open(job.input_path) as source:
+        return json.load(source)
+
+
+def submit_job(job_id: str):
+    get_executor().submit(run_job, job_id).add_done_callback(_merge_geocode_counts)
+
+
+# the geocode cache counters of a worker stay in the worker, so each job hands back what it added
+def _merge_geocode_counts(future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    counts = future.result()
+    if counts:
+        geocode_cache.add_counts(counts)
+
+
+def update_job(job_id: str, **fields):
+    db = SessionLocal()
+    try:
+        fields["updated_at"] = _utcnow()
+        db.query(models.PreprocessJob).filter(models.PreprocessJob.job_id == job_id).update(fields)
+        db.commit()
+    finally:
+        db.close()
+
+
+# entry point inside the worker process, returns the geocode cache counters the job added
+def run_job(job_id: str):
+    db = SessionLocal()
+    try:
+        # claim the job, another worker may already have picked it up after a restart
+        claimed = db.query(models.PreprocessJob).filter(
+            models.PreprocessJob.job_id == job_id,
+            models.PreprocessJob.status == "queued"
+        ).update({"status": "running", "message": "Starting", "updated_at": _utcnow()})
+        db.commit()
+        if not claimed:
+            return None
+        job = db.query(models.PreprocessJob).filter(models.PreprocessJob.job_id == job_id).first()
+        job_type, input_path = job.job_type, job.input_path
+    finally:
+        db.close()
+
+    def progress(percent: int, message: str):
+        print(f"[job {job_id}] {percent}% {message}")
+        update_job(job_id, progress=percent, message=message)
+
+    # keeps the lease while the handler runs, also through long steps that report no progress
+    finished = threading.Event()
+    def heartbeat():
+        while not finished.wait(PREPROCESS_JOB_HEARTBEAT):
+            update_job(job_id)
+    threading.Thread(target=heartbeat, daemon=True).start()
+
+    geocode_before = geocode_cache.get_counts()
+    try:
+        module_name, function_name = JOB_HANDLERS[job_type].split(":")
+        handler = getattr(importlib.import_module(module_name), function_name)
+        result_path = handler(input_path, progress=progress)
+        update_job(job_id, status="completed", progress=100, message="Done", result_path=result_path)
+    except HTTPException as e:
+        update_job(job_id, status="failed", message=str(e.detail)[:255])
+    except Exception as e:
+        traceback.print_exc()
+        update_job(job_id, status="failed", message=f"Unexpected error: {e}"[:255])
+    finally:
+        finished.set()
+
+    return {name: count - geocode_before[name] for name, count in geocode_cache.get_counts().items()}
+
+
+# jobs whose lease ran out are queued again and submitted: running jobs whose worker stopped touching them, and
+# queued jobs that were waiting in the pool of a server process that is gone. a job submitted twice still runs
+# once because run_job claims it. with every_queued set (on startup) all queued jobs are submitted
+def requeue_expired_jobs(every_queued: bool = False) -> list:
+    expired = models.PreprocessJob.updated_at < _utcnow() - timedelta(seconds=PREPROCESS_JOB_LEASE)
+    if every_queued:
+        expired = expired | (models.PreprocessJob.status == "queued")
+    db = SessionLocal()
+    try:
+        job_ids = [job_id for (job_id,) in db.query(models.PreprocessJob.job_id).filter(
+            models.PreprocessJob.status.in_(["queued", "running"]),
+            expired
+        ).all()]
+        if job_ids:
+            # touched so the next sweep leaves them alone for another lease
+            db.query(models.PreprocessJob).filter(
+                models.PreprocessJob.job_id.in_(job_ids),
+                models.PreprocessJob.status.in_(["queued", "running"])
+            ).update({"status": "queued", "message": "Re-queued, the server running it stopped", "updated_at": _utcnow()},
+                     synchronize_session=False)
+            db.commit()
+    finally:
+        db.close()
+
+    for job_id in job_ids:
+        submit_job(job_id)
+    if job_ids:
+        print(f"Re-queued {len(job_ids)} preprocessing job(s)")
+    return job_ids
+
+
+# a job interrupted by a restart still holds a fresh lease when the new server starts, so the leases are
+# checked again every PREPROCESS_JOB_HEARTBEAT seconds for as long as the server runs
+def _sweep_leases():
+    while True:
+        time.sleep(PREPROCESS_JOB_HEARTBEAT)
+        try:
+            requeue_expired_jobs()
+        except Exception:
+            traceback.print_exc()
+
+
+# called on startup
+def resume_pending_jobs():
+    requeue_expired_jobs(every_queued=True)
+    threading.Thread(target=_sweep_leases, daemon=True).start()
+
+
+def job_to_dict(job: models.PreprocessJob) -> dict:
+    return {
+        "job_id": job.job_id,
+        "job_type": job.job_type,
+        "status": job.status,
+        "progress": job.progress,
+        "message": job.message,
+        "file_name": job.file_name,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+        "result_url": f"/api/jobs/{job.job_id}/result" if job.status == "completed" else None
+    }
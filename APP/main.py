@@ -22,6 +22,14 @@ from API.route_evaluation import route_evaluation_router
 from API.usjr_student_processor_api import usjr_student_processor_api_router
 from API.campus_api import campus_api_router
 from API.get_previous_school_api import get_previous_schools_api_router
+from API.geocode_cache_api import geocode_cache_api_router
+from API.preprocess_jobs_api import preprocess_jobs_api_router
+from API.clustering_api import clustering_api_router
+from API.map_bins_api import map_bins_api_router
+from API.analytics_api import analytics_api_router
+from API.routing_api import routing_api_router
+from API.nearest_campus_api import nearest_campus_api_router
+from API.travel_matrix_api import travel_matrix_api_router
 
 from Routes.register_route import register_router
 from Routes.login_route import login_router
@@ -42,12 +50,19 @@ from Routes.file_process_route import file_process_router
 
 from Routes.exception_handler import custom_http_exception_handler  
 
+import jobs
+
 
 app = FastAPI()
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 app.add_exception_handler(HTTPException, custom_http_exception_handler)
 
+# pick up preprocessing jobs that were queued or running when the server stopped
+@app.on_event("startup")
+def resume_preprocess_jobs():
+    jobs.resume_pending_jobs()
+
 app.include_router(register_api_router)
 app.include_router(login_api_router)
 
@@ -80,6 +95,14 @@ app.include_router(event_reports_api_router)
 app.include_router(usjr_student_processor_api_router)
 app.include_router(campus_api_router)
 app.include_router(get_previous_schools_api_router)
+app.include_router(geocode_cache_api_router)
+app.include_router(preprocess_jobs_api_router)
+app.include_router(clustering_api_router)
+app.include_router(map_bins_api_router)
+app.include_router(analytics_api_router)
+app.include_router(routing_api_router)
+app.include_router(nearest_campus_api_router)
+app.include_router(travel_matrix_api_router)
 
 app.include_router(senior_high_file_api_router)
 app.include_router(college_file_api_router)
@@ -108,4 +108,78 @@ class EventReports(Base):
     education_level = Column(String(100))  
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User")
+
+class GeocodeCache(Base):
+    __tablename__ = "geocode_cache"
+    cache_id = Column(Integer, primary_key=True, index=True)
+    query_hash = Column(String(40), unique=True, index=True, nullable=False)
+    query = Column(String(512), nullable=False)
+    latitude = Column(Float)
+    longitude = Column(Float)
+    is_found = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class PreprocessJob(Base):
+    __tablename__ = "preprocess_jobs"
+    job_id = Column(String(36), primary_key=True, index=True)
+    job_type = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False, default="queued")
+    progress = Column(Integer, default=0)
+    message = Column(String(255))
+    file_name = Column(String(255))
+    input_path = Column(String(512))
+    result_path = Column(String(512))
+    user_id = Column(Integer, ForeignKey("users.user_id"))
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    user = relationship("User")
+
+
+class SchoolAlias(Base):
+    __tablename__ = "school_aliases"
+    alias_id = Column(Integer, primary_key=True, index=True)
+    alias = Column(String(255), unique=True, index=True, nullable=False)
+    canonical_name = Column(String(255), index=True, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class ClusterModel(Base):
+    __tablename__ = "cluster_models"
+    model_id = Column(Integer, primary_key=True, index=True)
+    education_level = Column(String(20), unique=True, index=True, nullable=False)
+    method = Column(String(20), nullable=False)
+    projection = Column(String(20), nullable=False)
+    origin_latitude = Column(Float, nullable=False)
+    origin_longitude = Column(Float, nullable=False)
+    # [[x, y], ...] in metres on the local projection around the origin, index i is cluster i + 1
+    centroids = Column(JSON, nullable=False)
+    # sum of squared distances to the nearest centroid when the model was fitted
+    fit_inertia = Column(Float, nullable=False)
+    fit_points = Column(Integer, nullable=False)
+    # totals for the students assigned incrementally since the last fit
+    added_inertia = Column(Float, default=0)
+    added_points = Column(Integer, default=0)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+
+class AnalyticsSummary(Base):
+    __tablename__ = "analytics_summaries"
+    summary_id = Column(Integer, primary_key=True, index=True)
+    education_level = Column(String(20), unique=True, index=True, nullable=False)
+    # {"total": n, "year": {value: count}, "strand": {...}, ...}, see analytics_store
+    summary = Column(JSON, nullable=False)
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+
+class RouteEvaluation(Base):
+    __tablename__ = "route_evaluations"
+    evaluation_id = Column(Integer, primary_key=True, index=True)
+    student_name = Column(String(255), index=True, nullable=False)
+    campus_name = Column(String(255), index=True, nullable=False)
+    # the evaluation returned by /evaluate-routes-data
+    data = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
@@ -0,0 +1,134 @@
+# nearest_campus.py
+# assignment of students, or any batch of points, to their nearest campus
+#
+# the campuses are loaded once into a BallTree with the haversine metric, so a batch of points is one vectorized
+# query that returns the great circle distance in metres. the assignment of every student of a level is cached
+# with the spatial index it was computed from: a new index (after an upload, removal or re-clustering) computes
+# it again, and campus_api drops everything with invalidate whenever a campus is created, updated or deleted.
+# invalidate only reaches the process it runs in, so the campuses are also read again after NEAREST_CAMPUS_TTL
+# seconds to pick up changes made through another worker.
+import os, threading, time
+import numpy as np
+from dotenv import load_dotenv
+from sklearn.neighbors import BallTree
+
+import models, spatial_index
+from database import SessionLocal
+from clustering import EARTH_RADIUS_M
+
+load_dotenv()
+
+NEAREST_CAMPUS_TTL = int(os.getenv("NEAREST_CAMPUS_TTL", 60))
+
+
+class CampusIndex:
+    def __init__(self, campuses: list):
+        self.campus_id = np.array([campus.campus_id for campus in campuses], dtype=np.int64)
+        self.name = [campus.name for campus in campuses]
+        self.latitude = np.array([campus.latitude for campus in campuses], dtype=np.float64)
+        self.longitude = np.array([campus.longitude for campus in campuses], dtype=np.float64)
+        self.tree = BallTree(np.radians(np.column_stack([self.latitude, self.longitude])), metric="haversine") if campuses else None
+        self.built_at = time.monotonic()
+
+    # position of the nearest campus and the distance to it in metres for every (lat, lng)
+    def nearest(self, latitude, longitude):
+        if self.tree is None:
+            raise ValueError("No campuses are saved yet")
+        points = np.radians(np.column_stack([np.asarray(latitude, dtype=np.float64), np.asarray(longitude, dtype=np.float64)]))
+        if not len(points):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        distance, position = self.tree.query(points, k=1)
+        return position[:, 0], distance[:, 0] * EARTH_RADIUS_M
+
+    def describe(self, position: int) -> dict:
+        return {"campus_id": int(self.campus_id[position]), "name": self.name[position]}
+
+
+_campuses = None
+# education level -> (spatial index, campuses, campus positions, distances)
+_assignments = {}
+_lock = threading.Lock()
+# bumped on every invalidation, campuses or assignments read before that are not kept
+_generation = 0
+
+
+def get_campuses() -> CampusIndex:
+    global _campuses
+    with _lock:
+        if _campuses is not None and time.monotonic() - _campuses.built_at < NEAREST_CAMPUS_TTL:
+            return _campuses
+        generation = _generation
+
+    db = SessionLocal()
+    try:
+        campuses = CampusIndex(db.query(models.Campus).order_by(models.Campus.campus_id).all())
+    finally:
+        db.close()
+
+    with _lock:
+        if generation == _generation:
+            _campuses = campuses
+    return campuses
+
+
+# nearest campus of every (lat, lng) point of a batch
+def assign_points(points: list) -> list:
+    campuses = get_campuses()
+    positions, distances = campuses.nearest([point[0] for point in points], [point[1] for point in points])
+    return [
+        {**campuses.describe(position), "distance_m": float(distance)}
+        for position, distance in zip(positions.tolist(), distances.tolist())
+    ]
+
+
+# (spatial index, campuses, campus positions, distances) of every student of a level with coordinates
+def student_assignment(education_level: str):
+    index = spatial_index.get_index(education_level)
+    campuses = get_campuses()
+    with _lock:
+        cached = _assignments.get(education_level)
+        if cached is not None and cached[0] is index and cached[1] is campuses:
+            return cached
+        generation = _generation
+
+    positions, distances = campuses.nearest(index.latitude, index.longitude)
+    assignment = (index, campuses, positions, distances)
+    with _lock:
+        if generation == _generation:
+            _assignments[education_level] = assignment
+    print(f"Assigned {len(positions)} {education_level} students to their nearest campus")
+    return assignment
+
+
+# students per campus with their distance statistics, and every student's campus when include_students is set
+def student_summary(education_level: str, include_students: bool = False) -> dict:
+    index, campuses, positions, distances = student_assignment(education_level)
+    result = []
+    for position in range(len(campuses.campus_id)):
+        campus_distances = distances[positions == position]
+        result.append({
+            **campuses.describe(position),
+            "students": int(len(campus_distances)),
+            "mean_distance_m": float(campus_distances.mean()) if len(campus_distances) else None,
+            "median_distance_m": float(np.median(campus_distances)) if len(campus_distances) else None,
+            "max_distance_m": float(campus_distances.max()) if len(campus_distances) else None,
+        })
+
+    summary = {"education_level": education_level, "students": int(len(positions)), "campuses": result}
+    if include_students:
+        # columnar, one entry per student
+        summary["assignments"] = {
+            "stud_id": index.stud_id.tolist(),
+            "campus_id": campuses.campus_id[positions].tolist() if len(positions) else [],
+            "distance_m": np.round(distances, 1).tolist(),
+        }
+    return summary
+
+
+# drop the campuses and every cached assignment, called after a campus is created, updated or deleted
+def invalidate():
+    global _campuses, _generation
+    with _lock:
+        _generation += 1
+        _campuses = None
+        _assignments.clear()
@@ -0,0 +1,348 @@
+# routing.py
+# hazard-avoiding routes between two points, computed on the server
+#
+# routes come from a pluggable backend (ROUTING_BACKEND): "osrm" calls an OSRM compatible /route/v1 service at
+# OSRM_URL, "graph" searches the local road network of road_graph.py and "direct" is an offline stand-in that
+# joins the points with straight lines. other modules can add backends with register_backend. route geometries
+# are cached by their rounded points, so the same request from the map does not reach the backend twice.
+# a backend with a route_avoiding method leaves out the hazard roads itself and returns the alternatives without
+# the waypoint search, and one with a table method answers a whole origins x destinations matrix at once (see
+# travel_matrix.py).
+#
+# when the direct route crosses a hazard polygon, candidate waypoints are laid on rings around the crossed
+# hazards. candidates inside a hazard or too far out of the way are dropped, and the rest are ordered so the
+# ones whose straight legs clear the hazards are tried first, before a single backend call is made.
+import math, os, threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from affected_students import RAY_CAST_BLOCK, area_polygons, points_in_polygon
+from clustering import EARTH_RADIUS_M, project_local
+from geocoding import TokenBucket
+
+load_dotenv()
+
+ROUTING_BACKEND = os.getenv("ROUTING_BACKEND", "osrm")
+OSRM_URL = os.getenv("OSRM_URL", "http://router.project-osrm.org").rstrip("/")
+OSRM_PROFILE = os.getenv("OSRM_PROFILE", "driving")
+OSRM_TIMEOUT = float(os.getenv("OSRM_TIMEOUT", 10))
+# requests per second sent to the router, the public demo server asks for at most 1
+OSRM_RATE_LIMIT = float(os.getenv("OSRM_RATE_LIMIT", 1))
+# most coordinates in one /table request, the default limit of osrm-routed
+OSRM_TABLE_SIZE = int(os.getenv("OSRM_TABLE_SIZE", 100))
+# backend calls running at the same time while candidates are tried
+ROUTE_CONCURRENCY = int(os.getenv("ROUTE_CONCURRENCY", 4))
+ROUTE_CACHE_SIZE = int(os.getenv("ROUTE_CACHE_SIZE", 2048))
+# decimals the cache key is rounded to, 4 is about 11 m
+ROUTE_CACHE_PRECISION = int(os.getenv("ROUTE_CACHE_PRECISION", 4))
+# most candidate waypoints tried after pruning
+ROUTE_MAX_CANDIDATES = int(os.getenv("ROUTE_MAX_CANDIDATES", 12))
+# candidates whose straight path is longer than this many times the straight start to end distance are dropped
+ROUTE_MAX_DETOUR = float(os.getenv("ROUTE_MAX_DETOUR", 3.0))
+# speed of the "direct" stand-in backend
+DIRECT_SPEED_KMH = float(os.getenv("ROUTE_DIRECT_SPEED_KMH", 30))
+
+# candidate rings at these multiples of the hazard radius, WAYPOINTS_PER_RING points each
+WAYPOINT_RINGS = (1.5, 2.0, 3.0)
+WAYPOINTS_PER_RING = 16
+
+
+class RoutingError(Exception):
+    pass
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+# a route is {"distance": m, "duration": s, "geometry": geojson LineString}, the shape of an OSRM route
+# points are (lat, lng) tuples, the backend returns None when it has no route between them
+class OsrmBackend:
+    def __init__(self, url: str = OSRM_URL, profile: str = OSRM_PROFILE, timeout: float = OSRM_TIMEOUT,
+                 rate_limit: float = OSRM_RATE_LIMIT):
+        self.url = url
+        self.profile = profile
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate_limit)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, ROUTE_CONCURRENCY))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def route(self, points: list):
+        coordinates = ";".join(f"{lng},{lat}" for lat, lng in points)
+        self.bucket.acquire()
+        try:
+            response = self.session.get(
+                f"{self.url}/route/v1/{self.profile}/{coordinates}",
+                params={"overview": "full", "geometries": "geojson"},
+                timeout=self.timeout
+            )
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise RoutingError(f"Router request failed: {e}")
+
+        if data.get("code") != "Ok" or not data.get("routes"):
+            return None
+        route = data["routes"][0]
+        return {"distance": route["distance"], "duration": route["duration"], "geometry": route["geometry"]}
+
+    # (durations, distances) from every origin to every destination, nan where there is no route
+    # origins are sent in chunks so a request never holds more than OSRM_TABLE_SIZE coordinates
+    def table(self, origins: list, destinations: list):
+        durations = np.full((len(origins), len(destinations)), np.nan)
+        distances = np.full((len(origins), len(destinations)), np.nan)
+        chunk = max(1, OSRM_TABLE_SIZE - len(destinations))
+        for first in range(0, len(origins), chunk):
+            sources = origins[first:first + chunk]
+            coordinates = ";".join(f"{lng},{lat}" for lat, lng in list(sources) + list(destinations))
+            self.bucket.acquire()
+            try:
+                # the index lists are sent as is, osrm splits them on a literal ";"
+                sources_param = ";".join(str(i) for i in range(len(sources)))
+                destinations_param = ";".join(str(len(sources) + i) for i in range(len(destinations)))
+                response = self.session.get(
+                    f"{self.url}/table/v1/{self.profile}/{coordinates}"
+                    f"?sources={sources_param}&destinations={destinations_param}&annotations=duration,distance",
+                    timeout=self.timeout
+                )
+                data = response.json()
+            except (requests.RequestException, ValueError) as e:
+                raise RoutingError(f"Router request failed: {e}")
+            if data.get("code") != "Ok":
+                raise RoutingError(f"Router table request failed: {data.get('message') or data.get('code')}")
+            # unreachable pairs come back as null
+            durations[first:first + len(sources)] = np.array(data["durations"], dtype=np.float64)
+            distances[first:first + len(sources)] = np.array(data["distances"], dtype=np.float64)
+        return durations, distances
+
+
+# straight lines between the points, for development without a router
+class DirectBackend:
+    def route(self, points: list):
+        latitude, longitude = np.array(points, dtype=np.float64).T
+        distance = float(haversine_m(latitude[:-1], longitude[:-1], latitude[1:], longitude[1:]).sum())
+        return {
+            "distance": distance,
+            "duration": distance / (DIRECT_SPEED_KMH / 3.6),
+            "geometry": {"type": "LineString", "coordinates": [[lng, lat] for lat, lng in points]}
+        }
+
+
+# the road graph module imports the geometry helpers of this one, so it is only imported once it is used
+def graph_backend():
+    from road_graph import GraphBackend
+    return GraphBackend()
+
+
+# backend name -> factory
+BACKENDS = {
+    "osrm": OsrmBackend,
+    "direct": DirectBackend,
+    "graph": graph_backend,
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def register_backend(name: str, factory):
+    with _backends_lock:
+        BACKENDS[name] = factory
+        _backends.pop(name, None)
+
+
+def get_backend(name: str = None):
+    name = name or ROUTING_BACKEND
+    with _backends_lock:
+        if name not in BACKENDS:
+            raise RoutingError(f"Unknown routing backend '{name}'. Available backends: {', '.join(BACKENDS)}")
+        if name in _backends:
+            return name, _backends[name]
+        factory = BACKENDS[name]
+
+    # built outside the lock, a backend that loads a road graph must not hold up requests to the others
+    backend = factory()
+    with _backends_lock:
+        if BACKENDS.get(name) is factory:
+            backend = _backends.setdefault(name, backend)
+    return name, backend
+
+
+# route geometries of the last ROUTE_CACHE_SIZE requests
+_route_cache = OrderedDict()
+_route_cache_lock = threading.Lock()
+
+
+def cached_route(points: list, backend_name: str = None, stats: dict = None):
+    name, backend = get_backend(backend_name)
+    key = (name, tuple((round(lat, ROUTE_CACHE_PRECISION), round(lng, ROUTE_CACHE_PRECISION)) for lat, lng in points))
+    with _route_cache_lock:
+        if key in _route_cache:
+            _route_cache.move_to_end(key)
+            if stats is not None:
+                stats["cache_hits"] += 1
+            return _route_cache[key]
+
+    route = backend.route(points)
+    if stats is not None:
+        stats["router_calls"] += 1
+    if route is not None:
+        with _route_cache_lock:
+            _route_cache[key] = route
+            while len(_route_cache) > ROUTE_CACHE_SIZE:
+                _route_cache.popitem(last=False)
+    return route
+
+
+def clear_route_cache():
+    with _route_cache_lock:
+        _route_cache.clear()
+
+
+# hazard polygons with their bounding boxes (west, south, east, north)
+def prepare_hazards(hazards: list) -> list:
+    prepared = []
+    for hazard in hazards:
+        for polygon in area_polygons(hazard):
+            outer = polygon[0]
+            prepared.append((polygon, (*outer.min(axis=0), *outer.max(axis=0))))
+    return prepared
+
+
+# segments (a -> b) against segments (c -> d), true where they cross or touch
+# touching counts, a route running along or through a corner of a hazard is not clear of it
+def segments_cross(a, b, c, d) -> np.ndarray:
+    def orientation(p, q, r):
+        return (q[..., 0] - p[..., 0]) * (r[..., 1] - p[..., 1]) - (q[..., 1] - p[..., 1]) * (r[..., 0] - p[..., 0])
+
+    a, b, c, d = a[:, None], b[:, None], c[None, :], d[None, :]
+    # the bounding boxes must overlap, this also rules out collinear segments that do not meet
+    boxes = np.ones(np.broadcast_shapes(a.shape[:2], c.shape[:2]), dtype=bool)
+    for axis in (0, 1):
+        boxes &= (np.minimum(a[..., axis], b[..., axis]) <= np.maximum(c[..., axis], d[..., axis])) & \
+                 (np.minimum(c[..., axis], d[..., axis]) <= np.maximum(a[..., axis], b[..., axis]))
+    return boxes & (orientation(a, b, c) * orientation(a, b, d) <= 0) & (orientation(c, d, a) * orientation(c, d, b) <= 0)
+
+
+# does a [lng, lat] polyline enter a hazard polygon: a vertex inside it or a segment crossing one of its edges
+def line_hits_polygon(line: np.ndarray, polygon: list) -> bool:
+    if points_in_polygon(line[:, 0], line[:, 1], polygon).any():
+        return True
+    start, end = line[:-1], line[1:]
+    for ring in polygon:
+        edges_start, edges_end = ring, np.roll(ring, -1, axis=0)
+        block = max(1, RAY_CAST_BLOCK // len(ring))
+        for first in range(0, len(start), block):
+            if segments_cross(start[first:first + block], end[first:first + block], edges_start, edges_end).any():
+                return True
+    return False
+
+
+# indexes of the hazards a polyline enters
+def hazards_hit(line, hazards: list) -> list:
+    line = np.asarray(line, dtype=np.float64)
+    west, south = line.min(axis=0)
+    east, north = line.max(axis=0)
+    return [
+        number for number, (polygon, box) in enumerate(hazards)
+        # the bounding boxes skip the hazards that are nowhere near the route
+        if box[0] <= east and box[2] >= west and box[1] <= north and box[3] >= south and line_hits_polygon(line, polygon)
+    ]
+
+
+# waypoints on rings around the crossed hazards, minus the ones pruned without asking the router
+# returns [(lat, lng), ...] in the order they should be tried and the number generated
+def candidate_waypoints(start, end, hazards: list, crossed: list):
+    vertices = np.concatenate([hazards[number][0][0] for number in crossed])
+    center_lng, center_lat = (vertices.min(axis=0) + vertices.max(axis=0)) / 2
+    points, _ = project_local(vertices[:, ::-1], (center_lat, center_lng))
+    radius = float(np.sqrt((points ** 2).sum(axis=1)).max())
+
+    angles = 2 * np.pi * np.arange(WAYPOINTS_PER_RING) / WAYPOINTS_PER_RING
+    distances = np.repeat(np.array(WAYPOINT_RINGS) * radius, WAYPOINTS_PER_RING)
+    angles = np.tile(angles, len(WAYPOINT_RINGS))
+    latitude = center_lat + np.degrees(distances * np.cos(angles) / EARTH_RADIUS_M)
+    longitude = center_lng + np.degrees(distances * np.sin(angles) / (EARTH_RADIUS_M * math.cos(math.radians(center_lat))))
+    generated = len(latitude)
+
+    # inside a hazard
+    keep = np.ones(generated, dtype=bool)
+    for polygon, _ in hazards:
+        keep &= ~points_in_polygon(longitude, latitude, polygon)
+
+    # too far out of the way
+    straight = float(haversine_m(start[0], start[1], end[0], end[1]))
+    path = haversine_m(start[0], start[1], latitude, longitude) + haversine_m(latitude, longitude, end[0], end[1])
+    keep &= path <= ROUTE_MAX_DETOUR * max(straight, radius)
+
+    # waypoints whose straight legs clear every hazard first, shorter paths first
+    candidates = []
+    for number in np.flatnonzero(keep):
+        waypoint = (float(latitude[number]), float(longitude[number]))
+        legs = [[start[1], start[0]], [waypoint[1], waypoint[0]], [end[1], end[0]]]
+        candidates.append((len(hazards_hit(legs, hazards)) > 0, float(path[number]), waypoint))
+    candidates.sort(key=lambda candidate: candidate[:2])
+    return [waypoint for _, _, waypoint in candidates[:ROUTE_MAX_CANDIDATES]], generated
+
+
+def with_waypoint(route: dict, waypoint=None) -> dict:
+    return {**route, "waypoint": {"lat": waypoint[0], "lng": waypoint[1]} if waypoint else None}
+
+
+# up to alternatives routes from start to end that stay out of every hazard, shortest first
+# when none is found the direct route is returned with avoids_hazards false
+def detour_routes(start, end, hazards: list, alternatives: int = 3, backend_name: str = None) -> dict:
+    began = time.perf_counter()
+    stats = {"router_calls": 0, "cache_hits": 0}
+    hazards = prepare_hazards(hazards)
+
+    direct = cached_route([start, end], backend_name, stats)
+    if direct is None:
+        raise RoutingError("No route found between the start and end points")
+    crossed = hazards_hit(direct["geometry"]["coordinates"], hazards) if hazards else []
+
+    result = {
+        "direct": {"distance": direct["distance"], "duration": direct["duration"], "crosses_hazard": bool(crossed)},
+        "candidates": 0,
+        "tried": 0,
+    }
+    _, backend = get_backend(backend_name)
+    if not crossed:
+        routes, avoids = [with_waypoint(direct)], True
+    elif hasattr(backend, "route_avoiding"):
+        # backends that can leave out the hazard roads themselves find the detours without waypoints
+        found = backend.route_avoiding([start, end], hazards, alternatives)
+        stats["router_calls"] += 1
+        found.sort(key=lambda route: route["distance"])
+        avoids = bool(found)
+        routes = [with_waypoint(route) for route in found] if found else [with_waypoint(direct)]
+    else:
+        waypoints, result["candidates"] = candidate_waypoints(start, end, hazards, crossed)
+        routes = []
+        # candidates are tried a batch at a time and the search stops once enough clear routes are found
+        batch_size = max(1, ROUTE_CONCURRENCY)
+        with ThreadPoolExecutor(max_workers=batch_size) as executor:
+            for first in range(0, len(waypoints), batch_size):
+                batch = waypoints[first:first + batch_size]
+                found = executor.map(lambda waypoint: cached_route([start, waypoint, end], backend_name, stats), batch)
+                for waypoint, route in zip(batch, found):
+                    if route is not None and not hazards_hit(route["geometry"]["coordinates"], hazards):
+                        routes.append(with_waypoint(route, waypoint))
+                result["tried"] += len(batch)
+                if len(routes) >= alternatives:
+                    break
+        routes.sort(key=lambda route: route["distance"])
+        avoids = bool(routes)
+        routes = routes[:alternatives] if routes else [with_waypoint(direct)]
+
+    seconds = time.perf_counter() - began
+    print(f"Routed with {len(hazards)} hazards: {result['tried']} of {result['candidates']} candidates tried, "
+          f"{stats['router_calls']} router calls, {stats['cache_hits']} cache hits in {seconds:.3f}s")
+    return {**result, "routes": routes, "avoids_hazards": avoids, **stats, "seconds": round(seconds, 3)}
@@ -2,7 +2,7 @@
 # pydantic models are responsible for telling the API how the request body should look like
 
 from datetime import datetime
-from typing import List, Union, Optional
+from typing import Dict, List, Union, Optional
 from pydantic import BaseModel, Field
 
 class Role(BaseModel):
@@ -45,7 +45,8 @@ class ResetPassword(BaseModel):
 
 class AffectedAreaBase(BaseModel):
     type: str
-    number_of_students_affected: int
+    # counted on the server when education_level is given
+    number_of_students_affected: Optional[int] = None
     total_area: float
     geojson_data: dict
     education_level: Optional[str] = None 
@@ -79,4 +80,39 @@ class Campus(CampusBase):
     campus_id: int
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class ReclusterRequest(BaseModel):
+    method: str = "kmeans"
+    projection: str = "local"
+    eps_m: float = 500
+    min_samples: int = 10
+    min_cluster_size: int = 25
+    save: bool = False
+
+class AffectedStudentsRequest(BaseModel):
+    # area type -> geojson polygons, e.g. {"flood": [feature, ...], "fire": [...]}
+    areas: Dict[str, List[dict]]
+    # "senior-high" or "college", both levels when left out
+    education_level: Optional[str] = None
+    include_ids: bool = True
+
+class ImpactAnalysisRequest(BaseModel):
+    # geojson features (or bare geometries) of the candidate event areas
+    features: List[dict]
+    # "senior-high" or "college", both levels when left out
+    education_level: Optional[str] = None
+
+class LatLng(BaseModel):
+    lat: float
+    lng: float
+
+class DetourRequest(BaseModel):
+    start: LatLng
+    end: LatLng
+    # geojson polygons the route has to stay out of
+    hazards: List[dict] = []
+    alternatives: int = Field(3, ge=1, le=10)
+
+class NearestCampusRequest(BaseModel):
+    points: List[LatLng]
@@ -0,0 +1,157 @@
+# school_index.py
+# persistent canonical school name dictionary shared by every upload
+#
+# the canonical names are the names in previous_schools plus the ones saved in school_aliases.
+# every spelling that was ever resolved is saved as an alias, so a known variant resolves with one dict lookup.
+# new spellings are matched against the canonical names with a length-blocked nearest neighbour search and
+# only the names that match nothing are grouped among themselves with school_matcher.
+import bisect, threading
+from datetime import datetime, timezone
+import pandas as pd
+from rapidfuzz import fuzz, process
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+import models
+from database import SessionLocal
+from school_matcher import group_names, length_window
+
+
+class SchoolNameIndex:
+    def __init__(self, threshold: float = 85):
+        self.threshold = threshold
+        self.aliases = {}
+        self.canonical_names = []
+        self.canonical_lengths = []
+        self.last_alias_id = 0
+        self.last_school_id = 0
+        # previous_schools names that are not saved as aliases yet
+        self.unsaved_seeds = {}
+        self.lock = threading.Lock()
+
+    def _add_canonical(self, name: str):
+        if name in self.aliases and self.aliases[name] == name:
+            return
+        self.aliases[name] = name
+        # keep the canonical names sorted by length so lookups only scan names of a compatible length
+        position = bisect.bisect_right(self.canonical_lengths, len(name))
+        self.canonical_lengths.insert(position, len(name))
+        self.canonical_names.insert(position, name)
+
+    # load only the rows added since the last refresh
+    def refresh(self, db):
+        with self.lock:
+            # ids start over after the student data is wiped
+            max_school_id = db.query(func.max(models.PreviousSchool.id)).scalar() or 0
+            if max_school_id < self.last_school_id:
+                self.last_school_id = 0
+
+            schools = db.query(models.PreviousSchool.id, models.PreviousSchool.name).filter(
+                models.PreviousSchool.id > self.last_school_id
+            ).order_by(models.PreviousSchool.id).all()
+            for school_id, name in schools:
+                if name and name not in self.aliases:
+                    self._add_canonical(name)
+                    self.unsaved_seeds[name] = name
+                self.last_school_id = school_id
+
+            aliases = db.query(models.SchoolAlias).filter(
+                models.SchoolAlias.alias_id > self.last_alias_id
+            ).order_by(models.SchoolAlias.alias_id).all()
+            for alias in aliases:
+                self.unsaved_seeds.pop(alias.alias, None)
+                if alias.alias == alias.canonical_name:
+                    self._add_canonical(alias.canonical_name)
+                else:
+                    self.aliases[alias.alias] = alias.canonical_name
+                self.last_alias_id = alias.alias_id
+
+    # closest canonical name with fuzz.ratio >= threshold, or None
+    def nearest(self, name: str):
+        shortest, longest = length_window(len(name), self.threshold)
+        start = bisect.bisect_left(self.canonical_lengths, shortest)
+        end = bisect.bisect_right(self.canonical_lengths, longest)
+        match = process.extractOne(name, self.canonical_names[start:end], scorer=fuzz.ratio, score_cutoff=self.threshold)
+        return match[0] if match else None
+
+    # map each name to a canonical name, names that match nothing become new canonical names
+    # returns the mapping and the new aliases that should be saved
+    def resolve(self, names: list):
+        mapping, new_aliases, unmatched = {}, {}, []
+
+        with self.lock:
+            new_aliases.update(self.unsaved_seeds)
+            self.unsaved_seeds = {}
+
+            for name in dict.fromkeys(names):
+                if name in self.aliases:
+                    mapping[name] = self.aliases[name]
+                    continue
+                canonical = self.nearest(name)
+                if canonical is None:
+                    unmatched.append(name)
+                else:
+                    mapping[name] = canonical
+                    new_aliases[name] = canonical
+
+            for canonical, variants in group_names(unmatched, self.threshold).items():
+                for variant in variants:
+                    mapping[variant] = canonical
+                    new_aliases[variant] = canonical
+
+            for alias, canonical in new_aliases.items():
+                if alias == canonical:
+                    self._add_canonical(canonical)
+                else:
+                    self.aliases[alias] = canonical
+
+        return mapping, new_aliases
+
+
+def save_aliases(db, new_aliases: dict):
+    if not new_aliases:
+        return
+    rows = [
+        {"alias": alias, "canonical_name": canonical, "created_at": datetime.now(timezone.utc)}
+        for alias, canonical in new_aliases.items()
+    ]
+    try:
+        db.execute(models.SchoolAlias.__table__.insert(), rows)
+        db.commit()
+    except IntegrityError:
+        # another upload saved some of these aliases first, keep the ones already stored
+        db.rollback()
+        for row in rows:
+            try:
+                db.execute(models.SchoolAlias.__table__.insert(), [row])
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+# one index per process, refreshed incrementally before every use
+def get_index(db, threshold: float = 85) -> SchoolNameIndex:
+    global _index
+    with _index_lock:
+        if _index is None or _index.threshold != threshold:
+            _index = SchoolNameIndex(threshold)
+    _index.refresh(db)
+    return _index
+
+
+# replace school names with their canonical spelling and remember every new spelling
+def canonicalize_school_names(school_series: pd.Series, threshold: float = 85) -> pd.Series:
+    db = SessionLocal()
+    try:
+        index = get_index(db, threshold)
+        mapping, new_aliases = index.resolve(school_series.unique().tolist())
+        save_aliases(db, new_aliases)
+    finally:
+        db.close()
+
+    print(f"Resolved {len(mapping)} school names, {len(new_aliases)} new aliases saved")
+    return school_series.map(lambda name: mapping.get(name, name))
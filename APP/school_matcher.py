@@ -0,0 +1,129 @@
+# school_matcher.py
+# shared fuzzy matcher for previous school names
+#
+# fuzz.ratio is 200 * LCS / (len(a) + len(b)), so two names can only reach a threshold t when the longer one
+# is at most (200 - t) / t times the length of the shorter one. names are blocked into length buckets and each
+# bucket is only scored against the buckets it can possibly match, with rapidfuzz cdist doing the scoring
+# in parallel. names are matched in blocks and names that already joined a group are dropped from later
+# blocks, like the old loop skipped them. no pair above the threshold is missed, so the groupings are the
+# same as comparing every pair.
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz
+from rapidfuzz.process import cdist
+
+# number of names matched per round, names grouped in one round are left out of the next rounds
+BLOCK_SIZE = 2000
+
+
+def length_window(length: int, threshold: float):
+    if threshold <= 0:
+        return 0, np.iinfo(np.int64).max
+    shortest = int(np.ceil(length * threshold / (200 - threshold) - 1e-9))
+    longest = int(np.floor(length * (200 - threshold) / threshold + 1e-9))
+    return shortest, longest
+
+
+# for every query, the sorted positions of the candidates with fuzz.ratio >= threshold
+def match_names(queries: list, candidates: list, threshold: float = 85, workers: int = -1) -> list:
+    matches = [[] for _ in queries]
+    if not queries or not candidates:
+        return matches
+
+    candidate_lengths = np.array([len(name) for name in candidates], dtype=np.int64)
+    candidate_order = np.argsort(candidate_lengths, kind="stable")
+    sorted_lengths = candidate_lengths[candidate_order]
+    query_lengths = np.array([len(name) for name in queries], dtype=np.int64)
+
+    # one cdist call per query length against the length bucket it can match
+    for length in np.unique(query_lengths):
+        rows = np.flatnonzero(query_lengths == length)
+        shortest, longest = length_window(length, threshold)
+        start = np.searchsorted(sorted_lengths, shortest, side="left")
+        end = np.searchsorted(sorted_lengths, longest, side="right")
+        if start >= end:
+            continue
+
+        columns = candidate_order[start:end]
+        scores = cdist(
+            [queries[row] for row in rows],
+            [candidates[column] for column in columns],
+            scorer=fuzz.ratio,
+            score_cutoff=threshold,
+            workers=workers
+        )
+        for row, column in zip(*np.nonzero(scores >= threshold)):
+            matches[rows[row]].append(columns[column])
+
+    return [sorted(items) for items in matches]
+
+
+# greedy grouping: in order of appearance, each ungrouped name becomes a canonical name and takes every
+# later ungrouped name that is similar to it
+def group_names(names: list, threshold: float = 85) -> dict:
+    names = list(names)
+    assigned = np.zeros(len(names), dtype=bool)
+    grouped = {}
+
+    for block_start in range(0, len(names), BLOCK_SIZE):
+        block = [i for i in range(block_start, min(len(names), block_start + BLOCK_SIZE)) if not assigned[i]]
+        if not block:
+            continue
+        # only names that are still ungrouped can join a group
+        candidates = np.flatnonzero(~assigned[block_start:]) + block_start
+        matches = match_names([names[i] for i in block], [names[j] for j in candidates], threshold)
+
+        for i, matched in zip(block, matches):
+            if assigned[i]:
+                continue
+            assigned[i] = True
+            grouped[names[i]] = [names[i]]
+            for position in matched:
+                j = candidates[position]
+                if j > i and not assigned[j]:
+                    assigned[j] = True
+                    grouped[names[i]].append(names[j])
+
+    return grouped
+
+
+# fuzzy matching for previous school, maps every name in the series to its canonical name
+def group_similar_schools(school_series: pd.Series, threshold: float = 85) -> pd.Series:
+    grouped = group_names(school_series.unique().tolist(), threshold)
+
+    mapping = {}
+    for canonical, variants in grouped.items():
+        for variant in variants:
+            mapping[variant] = canonical
+
+    return school_series.map(lambda name: mapping.get(name, name))
+
+
+# leader clustering: each name joins the first earlier leader it is similar to, otherwise it becomes a leader
+# returns the leader index of every name
+def leader_clusters(names: list, threshold: float = 90) -> list:
+    names = list(names)
+    leaders = []
+    is_leader = np.zeros(len(names), dtype=bool)
+    leader_of = [0] * len(names)
+
+    for block_start in range(0, len(names), BLOCK_SIZE):
+        block = list(range(block_start, min(len(names), block_start + BLOCK_SIZE)))
+        block_names = [names[i] for i in block]
+        # leaders from earlier blocks always come before leaders created inside this block
+        earlier = match_names(block_names, [names[j] for j in leaders], threshold)
+        inside = match_names(block_names, block_names, threshold)
+        earlier_leaders = list(leaders)
+
+        for row, i in enumerate(block):
+            if earlier[row]:
+                leader = earlier_leaders[earlier[row][0]]
+            else:
+                leader = next((block[col] for col in inside[row] if block[col] < i and is_leader[block[col]]), None)
+            if leader is None:
+                leader = i
+                is_leader[i] = True
+                leaders.append(i)
+            leader_of[i] = leader
+
+    return leader_of
@@ -0,0 +1,170 @@
+# spatial_index.py
+# server side aggregation of student markers into grid bins for a map viewport
+#
+# the student coordinates of an education level are loaded once into numpy arrays sorted by latitude. the bins
+# of a zoom level are computed the first time that zoom is asked for, after that a viewport request only slices
+# the bins inside the bounding box. bins are aligned to a global grid, so panning never moves them.
+# the index is dropped whenever students are uploaded, removed or re-clustered, and after SPATIAL_INDEX_TTL
+# seconds in case the data was changed by another process.
+import os, threading, time
+from dotenv import load_dotenv
+import numpy as np
+
+from database import SessionLocal
+from student_query import STUDENT_MODELS, columnar_data
+
+load_dotenv()
+
+SPATIAL_INDEX_TTL = int(os.getenv("SPATIAL_INDEX_TTL", 300))
+# bins across one 256px map tile, 4 gives bins of about 64px
+BINS_PER_TILE = int(os.getenv("SPATIAL_INDEX_BINS_PER_TILE", 4))
+MIN_ZOOM, MAX_ZOOM = 0, 20
+
+
+def cell_size(zoom: int) -> float:
+    return 360.0 / (2 ** zoom * BINS_PER_TILE)
+
+
+class SpatialIndex:
+    def __init__(self, columns: dict, values: dict):
+        latitude, longitude = columns["latitude"], columns["longitude"]
+        valid = np.isfinite(latitude) & np.isfinite(longitude) & (latitude != 0) & (longitude != 0)
+        order = np.argsort(latitude[valid], kind="stable")
+
+        self.latitude = latitude[valid][order]
+        self.longitude = longitude[valid][order]
+        self.stud_id = columns["stud_id"][valid][order]
+        self.cluster = np.nan_to_num(columns["cluster"][valid][order], nan=-1).astype(np.int64)
+        self.strand = np.nan_to_num(columns["strand"][valid][order], nan=-1).astype(np.int64)
+        self.strand_values = values["strand"]
+        self.zoom_bins = {}
+        self.lock = threading.Lock()
+        self.built_at = time.monotonic()
+
+    # positions of the students inside a bounding box, the latitude range is one slice of the sorted arrays
+    def in_box(self, west: float, south: float, east: float, north: float) -> np.ndarray:
+        start = np.searchsorted(self.latitude, south, side="left")
+        end = np.searchsorted(self.latitude, north, side="right")
+        longitude = self.longitude[start:end]
+        return np.flatnonzero((longitude >= west) & (longitude <= east)) + start
+
+    # bins of one zoom level over every student, sorted by bin latitude
+    def bins(self, zoom: int) -> dict:
+        with self.lock:
+            if zoom in self.zoom_bins:
+                return self.zoom_bins[zoom]
+
+        size = cell_size(zoom)
+        row = np.floor(self.latitude / size).astype(np.int64)
+        column = np.floor(self.longitude / size).astype(np.int64)
+        keys = row * (1 << 32) + (column + (1 << 31))
+        _, bin_of, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        bin_of = bin_of.reshape(-1)
+
+        # markers sit on the mean position of their students, not on the cell corner
+        latitude = np.bincount(bin_of, weights=self.latitude) / counts
+        longitude = np.bincount(bin_of, weights=self.longitude) / counts
+        order = np.argsort(latitude, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+
+        zoom_bins = {
+            "latitude": latitude[order],
+            "longitude": longitude[order],
+            "count": counts[order],
+            # bin of every student, renumbered to the latitude order
+            "bin_of": rank[bin_of],
+        }
+        with self.lock:
+            self.zoom_bins[zoom] = zoom_bins
+        return zoom_bins
+
+    def query(self, west: float, south: float, east: float, north: float, zoom: int) -> dict:
+        zoom_bins = self.bins(zoom)
+        start = np.searchsorted(zoom_bins["latitude"], south, side="left")
+        end = np.searchsorted(zoom_bins["latitude"], north, side="right")
+        longitude = zoom_bins["longitude"][start:end]
+        if west <= east:
+            inside = (longitude >= west) & (longitude <= east)
+        else:
+            # the box crosses the antimeridian
+            inside = (longitude >= west) | (longitude <= east)
+        selected = np.flatnonzero(inside) + start
+
+        # cluster and strand counts only for the bins in view
+        position = np.full(len(zoom_bins["count"]), -1, dtype=np.int64)
+        position[selected] = np.arange(len(selected))
+        student_bins = position[zoom_bins["bin_of"]]
+        in_view = student_bins >= 0
+        clusters = self._breakdown(student_bins[in_view], self.cluster[in_view], len(selected), str)
+        strands = self._breakdown(
+            student_bins[in_view], self.strand[in_view], len(selected),
+            lambda code: self.strand_values[code] if code >= 0 else "Unknown"
+        )
+
+        bins = [
+            {
+                "latitude": float(zoom_bins["latitude"][index]),
+                "longitude": float(zoom_bins["longitude"][index]),
+                "count": int(zoom_bins["count"][index]),
+                "clusters": clusters[i],
+                "strands": strands[i],
+            }
+            for i, index in enumerate(selected)
+        ]
+        return {
+            "zoom": zoom,
+            "cell_size": cell_size(zoom),
+            "total": int(zoom_bins["count"][selected].sum()),
+            "bins": bins
+        }
+
+    @staticmethod
+    def _breakdown(student_bins, codes, bin_count: int, label) -> list:
+        breakdown = [{} for _ in range(bin_count)]
+        if not len(student_bins):
+            return breakdown
+        offset = codes.min()
+        span = int(codes.max() - offset) + 1
+        pairs, pair_counts = np.unique(student_bins * span + (codes - offset), return_counts=True)
+        for pair, count in zip(pairs.tolist(), pair_counts.tolist()):
+            breakdown[pair // span][label(pair % span + offset)] = count
+        return breakdown
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+# bumped on every invalidation, an index built from data read before that is not kept
+_generation = 0
+
+
+def get_index(education_level: str) -> SpatialIndex:
+    with _indexes_lock:
+        index = _indexes.get(education_level)
+        if index is not None and time.monotonic() - index.built_at < SPATIAL_INDEX_TTL:
+            return index
+        generation = _generation
+
+    db = SessionLocal()
+    try:
+        _, columns, values = columnar_data(db, STUDENT_MODELS[education_level])
+    finally:
+        db.close()
+
+    index = SpatialIndex(columns, values)
+    with _indexes_lock:
+        if generation == _generation:
+            _indexes[education_level] = index
+    print(f"Built {education_level} spatial index over {len(index.latitude)} students")
+    return index
+
+
+# drop the index of one education level, or of every level when none is given
+def invalidate(education_level: str = None):
+    global _generation
+    with _indexes_lock:
+        _generation += 1
+        if education_level is None:
+            _indexes.clear()
+        else:
+            _indexes.pop(education_level, None)
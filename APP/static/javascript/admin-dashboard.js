@@ -34,13 +34,11 @@ window.addEventListener('resize', () => {
 // fetch student counts
 document.addEventListener("DOMContentLoaded", async function () {
     try {
-        const seniorHighResponse = await fetch("/api/senior-high-students/count");
-        const seniorHighData = await seniorHighResponse.json();
-        document.getElementById("seniorHighCount").textContent = seniorHighData.count || 0;
-
-        const collegeResponse = await fetch("/api/college-students/count");
-        const collegeData = await collegeResponse.json();
-        document.getElementById("collegeCount").textContent = collegeData.count || 0;
+        // both counts come from the precomputed analytics summary, revalidated with its etag
+        const response = await fetch("/api/analytics/summary");
+        const summary = await response.json();
+        document.getElementById("seniorHighCount").textContent = summary["senior-high"].total || 0;
+        document.getElementById("collegeCount").textContent = summary["college"].total || 0;
     } catch (error) {
         console.error("Error fetching student counts:", error);
     }
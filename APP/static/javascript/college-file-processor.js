@@ -43,8 +43,20 @@ form.addEventListener('submit', async (event) => {
             return;
         }
 
+        // the file is preprocessed by a background job, poll it until the result is ready
+        const job = await response.json();
+        const resultUrl = await waitForJob(job.job_id, (status) => {
+            statusMessage.textContent = `${status.message} (${status.progress}%)`;
+        });
+
         // download the file
-        const blob = await response.blob();
+        const resultResponse = await fetch(resultUrl);
+        if (!resultResponse.ok) {
+            const errorData = await resultResponse.json();
+            errorMessage.textContent = `Error: ${errorData.detail}`;
+            return;
+        }
+        const blob = await resultResponse.blob();
         const downloadLink = document.createElement('a');
         downloadLink.href = URL.createObjectURL(blob);
         downloadLink.download = '[1]_preprocessed_college_file.csv';
@@ -53,10 +65,28 @@ form.addEventListener('submit', async (event) => {
         statusMessage.textContent = "File preprocessed and downloaded successfully.";
     } catch (error) {
         console.error('Error uploading file.', error);
-        errorMessage.textContent = "An error occurred while uploading the file";
+        errorMessage.textContent = error.message || "An error occurred while uploading the file";
     }
 });
 
+// poll a preprocessing job until it completes, returns the url of the processed file
+async function waitForJob(jobId, onProgress) {
+    while (true) {
+        const response = await fetch(`/api/jobs/${jobId}`);
+        if (!response.ok) {
+            const errorData = await response.json();
+            throw new Error(errorData.detail || 'Failed to check job status');
+        }
+
+        const status = await response.json();
+        if (status.status === 'completed') return status.result_url;
+        if (status.status === 'failed') throw new Error(status.message || 'Preprocessing failed');
+
+        onProgress(status);
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+    }
+}
+
 const geocodeForm = document.getElementById('geocode-form');
 const geocodeFile = document.getElementById('geocode-file');
 const geocodeStatus = document.getElementById('geocode-status');
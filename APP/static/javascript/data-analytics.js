@@ -1,21 +1,23 @@
-async function fetchTopSchools() { 
-    const response = await fetch('/api/students/all-schools');
-    const schools = await response.json();
-  
-    const schoolsWithCounts = schools.map(school => {
-      const totalStudents = (school.students_senior_high?.length || 0) + (school.students_college?.length || 0);
-      return {
-        id: school.id,
-        name: school.name,
-        latitude: school.latitude,
-        longitude: school.longitude,
-        totalStudents: totalStudents
-      };
+// top schools by student count over both education levels, from the analytics summary
+function topSchoolsFromSummary(summary, count) {
+    const totals = {};
+    Object.values(summary).forEach(level => {
+        Object.entries(level.school || {}).forEach(([name, students]) => {
+            if (name !== 'Unknown') {
+                totals[name] = (totals[name] || 0) + students;
+            }
+        });
     });
-  
-    const top10Schools = schoolsWithCounts
-      .sort((a, b) => b.totalStudents - a.totalStudents)
-      .slice(0, 10);
+    return Object.entries(totals)
+        .map(([name, totalStudents]) => ({ name, totalStudents }))
+        .sort((a, b) => b.totalStudents - a.totalStudents)
+        .slice(0, count);
+}
+
+async function fetchTopSchools() { 
+    const response = await fetch('/api/analytics/summary');
+    const summary = await response.json();
+    const top10Schools = topSchoolsFromSummary(summary, 10);
   
     console.log("Top 10 Schools:", top10Schools);
     displaySchools(top10Schools); 
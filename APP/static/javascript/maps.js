@@ -205,6 +205,60 @@ document.getElementById("addCampusBtn").addEventListener("click", () => {
   })
 })
 
+// students are streamed as ndjson (one json object per line) so markers show up while the rest loads
+const STUDENT_BATCH_SIZE = 2000
+// stud_id matches the markers to the affected students counted on the server
+const STUDENT_MAP_FIELDS = {
+  senior_high: "stud_id,year,strand,previous_school,age,latitude,longitude,cluster",
+  college: "stud_id,year,course,strand,previous_school,age,latitude,longitude,cluster",
+}
+
+async function fetchStudentStream(apiUrl, onBatch, isCancelled = () => false) {
+  const students = []
+  const separator = apiUrl.includes("?") ? "&" : "?"
+
+  try {
+    const response = await fetch(`${apiUrl}${separator}format=ndjson`)
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`)
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffered = ""
+    let batch = []
+
+    while (true) {
+      const { done, value } = await reader.read()
+      if (isCancelled()) {
+        reader.cancel()
+        break
+      }
+
+      buffered += decoder.decode(value || new Uint8Array(), { stream: !done })
+      const lines = buffered.split("\n")
+      buffered = done ? "" : lines.pop() // keep a partial last line for the next chunk
+
+      for (const line of lines) {
+        if (!line.trim()) continue
+        const student = JSON.parse(line)
+        students.push(student)
+        batch.push(student)
+      }
+
+      if (batch.length >= STUDENT_BATCH_SIZE || (done && batch.length)) {
+        onBatch(batch)
+        batch = []
+      }
+      if (done) break
+    }
+  } catch (error) {
+    console.error("Error streaming students:", error)
+  }
+
+  return students
+}
+
 // asynchronous function to fetch data
 async function fetchData(url) {
   try {
@@ -574,6 +628,7 @@ function findNearestCampus(point) {
 }
 
 // Calculate route function (using the floodPolygon globally)
+// the server asks the router and, when the direct route enters the flood area, tries detour waypoints around it
 function calculateRoute(startPoint, endPoint) {
     // Show loading indicator
     const loadingDiv = document.createElement("div")
@@ -583,264 +638,40 @@ function calculateRoute(startPoint, endPoint) {
       "position: absolute; top: 10px; left: 50%; transform: translateX(-50%); background: white; padding: 10px; border-radius: 5px; box-shadow: 0 0 10px rgba(0,0,0,0.2); z-index: 1000;"
     document.body.appendChild(loadingDiv)
 
-    const url = `http://router.project-osrm.org/route/v1/driving/${startPoint.lng},${startPoint.lat};${endPoint.lng},${endPoint.lat}?overview=full&geometries=geojson`
-
-    console.log("OSRM Request URL:", url)
-
-    if (floodPolygon) {
-      console.log("Flood Polygon:", floodPolygon)
-
-      fetch(url)
-        .then((response) => response.json())
-        .then((data) => {
-          console.log("OSRM Response Data:", data)
-
-          if (data.routes && data.routes.length > 0) {
-            const route = data.routes[0]
-            console.log("Route found:", route)
-
-            // Check if the route intersects with the flood polygon
-            if (route.geometry && route.geometry.coordinates) {
-              const routeLine = turf.lineString(route.geometry.coordinates)
-              const intersects = turf.booleanIntersects(routeLine, floodPolygon)
-
-              if (intersects) {
-                console.log("Route intersects with flood area, calculating detour...")
-                calculateDetour(startPoint, endPoint)
-              } else {
-                console.log("Route does not intersect with flood area, using direct route")
-                // Remove loading indicator
-                document.body.removeChild(loadingDiv)
-                displayRoute(data)
-              }
-            } else {
-              console.error("No geometry found in route")
-              document.body.removeChild(loadingDiv)
-            }
-          } else {
-            console.error("No routes found in response")
-            document.body.removeChild(loadingDiv)
-          }
-        })
-        .catch((error) => {
-          console.error("Error fetching route data:", error)
-          document.body.removeChild(loadingDiv)
-          alert("Error calculating route. Please try again.")
-        })
-    } else {
-      // No flood polygon defined, just calculate the direct route
-      fetch(url)
-        .then((response) => response.json())
-        .then((data) => {
-          document.body.removeChild(loadingDiv)
-          displayRoute(data)
-        })
-        .catch((error) => {
-          console.error("Error fetching route data:", error)
-          document.body.removeChild(loadingDiv)
-          alert("Error calculating route. Please try again.")
-        })
+    const payload = {
+      start: { lat: startPoint.lat, lng: startPoint.lng },
+      end: { lat: endPoint.lat, lng: endPoint.lng },
+      hazards: floodPolygon ? [floodPolygon] : [],
+      alternatives: 1,
     }
-}
-
-function calculateDetour(startPoint, endPoint) {
-    console.log("Calculating detour waypoints...")
-
-    // Create points around the flood polygon to use as waypoints
-    const center = incidentCircle.getLatLng()
-    const radius = incidentCircle.getRadius()
-    console.log("Circle center:", center, "radius:", radius)
-
-    // Create potential waypoints around the flood area
-    const numPoints = 16 // Number of points to try
-    const waypoints = []
-
-    // Create multiple rings of waypoints at different distances
-    const distanceFactors = [1.5, 2.0, 3.0] // Multiple of radius
-
-    distanceFactors.forEach((factor) => {
-      for (let i = 0; i < numPoints; i++) {
-        const angle = (2 * Math.PI * i) / numPoints
-
-        // Calculate point on circle
-        const waypointLat = center.lat + ((radius * factor) / 111000) * Math.cos(angle) // 111000 meters is roughly 1 degree of latitude
-        const waypointLng =
-          center.lng + ((radius * factor) / (111000 * Math.cos(center.lat * (Math.PI / 180)))) * Math.sin(angle)
-
-        waypoints.push({
-          lng: waypointLng,
-          lat: waypointLat,
-        })
-      }
-    })
-
-    console.log(`Generated ${waypoints.length} waypoints for detour calculation`)
-
-    // Find the best waypoint to route through
-    tryNextWaypoint(startPoint, endPoint, waypoints, 0)
-}
-
-function findBestDetour(startPoint, endPoint, waypoints) {
-    let bestRoute = null
-    let bestDistance = Number.POSITIVE_INFINITY
-    const promises = []
-
-    console.log(`Trying ${waypoints.length} possible detour points around flood area`)
 
-    // Try each waypoint and find the best route
-    waypoints.forEach((waypoint, index) => {
-      console.log(`Trying waypoint ${index + 1}:`, waypoint)
-
-      const url = `http://router.project-osrm.org/route/v1/driving/${startPoint.lng},${startPoint.lat};${waypoint.lng},${waypoint.lat};${endPoint.lng},${endPoint.lat}?overview=full&geometries=geojson`
-
-      const promise = fetch(url)
-        .then((response) => response.json())
-        .then((data) => {
-          console.log(`Waypoint ${index + 1} response:`, data)
-
-          if (data.routes && data.routes.length > 0) {
-            const route = data.routes[0]
-            console.log(`Waypoint ${index + 1} route:`, route)
-
-            // Check if this route intersects with the flood polygon
-            if (route.geometry && route.geometry.coordinates) {
-              const routeLine = turf.lineString(route.geometry.coordinates)
-              const intersects = turf.booleanIntersects(routeLine, floodPolygon)
-
-              console.log(`Waypoint ${index + 1} - Route intersects flood area: ${intersects}`)
-              console.log(`Waypoint ${index + 1} - Route distance: ${route.distance}`)
-
-              if (!intersects && route.distance < bestDistance) {
-                bestRoute = data
-                bestDistance = route.distance
-                console.log(`Waypoint ${index + 1} is now the best route with distance ${bestDistance}`)
-              }
-            } else {
-              console.error(`Waypoint ${index + 1} has no valid geometry`)
-            }
-          } else {
-            console.error(`No routes found for waypoint ${index + 1}`)
-          }
-        })
-        .catch((error) => console.error(`Error fetching detour route for waypoint ${index + 1}:`, error))
-
-      promises.push(promise)
-    })
-
-    // After all waypoints have been tried
-    Promise.all(promises).then(() => {
-      if (bestRoute) {
-        console.log("Found best detour route:", bestRoute)
-        displayRoute(bestRoute)
-      } else {
-        console.error("Could not find a valid detour route")
-        // Fall back to displaying the original route with a warning
-        console.log("Falling back to original route with warning")
-
-        // Get original route
-        const originalUrl = `http://router.project-osrm.org/route/v1/driving/${startPoint.lng},${startPoint.lat};${endPoint.lng},${endPoint.lat}?overview=full&geometries=geojson`
-
-        fetch(originalUrl)
-          .then((response) => response.json())
-          .then((data) => {
-            if (data.routes && data.routes.length > 0) {
-              // Display with warning
-              console.warn("WARNING: This route passes through flood area!")
-              displayRoute(data, true) // Pass true to indicate this is through flood area
-            }
-          })
-          .catch((error) => console.error("Error fetching original route data:", error))
-      }
+    fetch("/api/routes/detour", {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify(payload),
     })
-  }
-  function findBestDetour(startPoint, endPoint, waypoints) {
-    console.log(`Trying ${waypoints.length} possible detour points around flood area`)
-
-    // Process waypoints one at a time instead of all at once
-    tryNextWaypoint(startPoint, endPoint, waypoints, 0)
-}
-
-function tryNextWaypoint(startPoint, endPoint, waypoints, index) {
-    // Get the loading indicator if it exists
-    const loadingDiv = document.getElementById("route-loading")
-
-    // Update loading message if the element exists
-    if (loadingDiv) {
-      loadingDiv.innerHTML = `<div class="spinner"></div><p>Calculating detour route... (${index + 1}/${waypoints.length})</p>`
-    }
-
-    // Base case: we've tried all waypoints
-    if (index >= waypoints.length) {
-      console.error("Could not find a valid detour route after trying all waypoints")
-      // Fall back to displaying the original route with a warning
-      console.log("Falling back to original route with warning")
-
-      const originalUrl = `http://router.project-osrm.org/route/v1/driving/${startPoint.lng},${startPoint.lat};${endPoint.lng},${endPoint.lat}?overview=full&geometries=geojson`
-
-      fetch(originalUrl)
-        .then((response) => response.json())
-        .then((data) => {
-          if (data.routes && data.routes.length > 0) {
-            console.warn("WARNING: This route passes through flood area!")
-
-            // Remove loading indicator if it exists
-            if (loadingDiv) {
-              document.body.removeChild(loadingDiv)
-            }
-
-            displayRoute(data, true) // Pass true to indicate this is through flood area
-          }
-        })
-        .catch((error) => {
-          console.error("Error fetching original route data:", error)
-          // Remove loading indicator if it exists
-          if (loadingDiv) {
-            document.body.removeChild(loadingDiv)
-          }
-        })
-      return
-    }
-
-    const waypoint = waypoints[index]
-    console.log(`Trying waypoint ${index + 1}/${waypoints.length}:`, waypoint)
-
-    const url = `http://router.project-osrm.org/route/v1/driving/${startPoint.lng},${startPoint.lat};${waypoint.lng},${waypoint.lat};${endPoint.lng},${endPoint.lat}?overview=full&geometries=geojson`
-
-    fetch(url)
-      .then((response) => response.json())
+      .then((response) => {
+        if (!response.ok) {
+          throw new Error(`HTTP error! status: ${response.status}`)
+        }
+        return response.json()
+      })
       .then((data) => {
-        if (data.routes && data.routes.length > 0) {
-          const route = data.routes[0]
-
-          // Check if this route intersects with the flood polygon
-          if (route.geometry && route.geometry.coordinates) {
-            const routeLine = turf.lineString(route.geometry.coordinates)
-            const intersects = turf.booleanIntersects(routeLine, floodPolygon)
+        console.log("Route response:", data)
+        document.body.removeChild(loadingDiv)
 
-            console.log(`Waypoint ${index + 1} - Route intersects flood area: ${intersects}`)
-
-            if (!intersects) {
-              // Found a valid route! Display it and stop looking
-              console.log(`Found valid detour route through waypoint ${index + 1}`)
-
-              // Remove loading indicator if it exists
-              if (loadingDiv) {
-                document.body.removeChild(loadingDiv)
-              }
-
-              displayRoute(data)
-              return // Stop processing more waypoints
-            }
-          }
+        if (!data.avoids_hazards) {
+          console.warn("WARNING: This route passes through flood area!")
         }
-
-        // If we get here, this waypoint didn't work, try the next one
-        tryNextWaypoint(startPoint, endPoint, waypoints, index + 1)
+        // displayRoute takes the OSRM response shape
+        displayRoute({ routes: data.routes }, !data.avoids_hazards)
       })
       .catch((error) => {
-        console.error(`Error fetching detour route for waypoint ${index + 1}:`, error)
-        // Even if there's an error, try the next waypoint
-        tryNextWaypoint(startPoint, endPoint, waypoints, index + 1)
+        console.error("Error fetching route data:", error)
+        document.body.removeChild(loadingDiv)
+        alert("Error calculating route. Please try again.")
       })
 }
 
@@ -1002,7 +833,8 @@ async function storeAffectedData() {
 }
 
 // function to update list of students based on drawn areas
-function updateAffectedStudents() {
+// the point in polygon tests run on the server against every student of the shown education level
+async function updateAffectedStudents() {
   affectedStudents = {
     flood: [],
     strike: [],
@@ -1010,21 +842,44 @@ function updateAffectedStudents() {
     fire: [],
   }
 
-  allMarkers.forEach((marker) => {
-    const studentPoint = turf.point([marker.getLatLng().lng, marker.getLatLng().lat])
-    const studentData = marker.options.studentData
+  const hasAreas = Object.values(affectedAreas).some((areas) => areas && areas.length > 0)
+  if (!currentEducationLevel || !hasAreas) return
 
-    for (const areaType in affectedAreas) {
-      if (affectedAreas[areaType]) {
-        // check if areaType array exists
-        affectedAreas[areaType].forEach((geoJsonArea) => {
-          if (geoJsonArea && geoJsonArea.geometry && turf.booleanPointInPolygon(studentPoint, geoJsonArea)) {
-            affectedStudents[areaType].push(studentData)
-          }
-        })
-      }
+  const areas = {}
+  for (const areaType in affectedAreas) {
+    areas[areaType] = (affectedAreas[areaType] || []).filter((geoJsonArea) => geoJsonArea && geoJsonArea.geometry)
+  }
+
+  const educationLevel = currentEducationLevel
+  let result
+  try {
+    const response = await fetch("/api/affected-students", {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify({ areas: areas, education_level: educationLevel }),
+    })
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`)
     }
+    result = (await response.json())[educationLevel.replace("_", "-")]
+  } catch (error) {
+    console.error("Error computing affected students:", error)
+    return
+  }
+  if (educationLevel !== currentEducationLevel) return
+
+  // match the returned ids back to the loaded markers
+  const studentsById = new Map()
+  allMarkers.forEach((marker) => {
+    const studentData = marker.options.studentData
+    studentsById.set(studentData.stud_id, studentData)
   })
+  for (const areaType in affectedStudents) {
+    const ids = (result.areas[areaType] && result.areas[areaType].stud_ids) || []
+    affectedStudents[areaType] = ids.map((id) => studentsById.get(id)).filter(Boolean)
+  }
 
   if (Object.values(affectedStudents).some((arr) => arr.length > 0)) {
     displayAffectedStudentsInfo()
@@ -1262,11 +1117,9 @@ const clusterColors = [
   "mediumvioletred",
 ]
 
-// function to add all markers to the map from the dataset
-function addMarkers(data) {
-  markers.clearLayers() // reset the marker cluster group
-
-  allMarkers = data.reduce((markerArray, item) => {
+// function to add markers for a batch of students without clearing the ones already on the map
+function appendMarkers(data) {
+  const batchMarkers = data.reduce((markerArray, item) => {
     const { latitude, longitude } = item
 
     if (latitude && longitude && !isNaN(Number.parseFloat(latitude)) && !isNaN(Number.parseFloat(longitude))) {
@@ -1279,13 +1132,27 @@ function addMarkers(data) {
       })
 
       markerArray.push(marker)
-      markers.addLayer(marker)
     }
     return markerArray
   }, [])
 
+  allMarkers = allMarkers.concat(batchMarkers)
+  markers.addLayers(batchMarkers) // one bulk add instead of one per marker
+}
+
+// function to add all markers to the map from the dataset
+function addMarkers(data) {
+  markers.clearLayers() // reset the marker cluster group
+  allMarkers = []
+
+  appendMarkers(data)
   map.addLayer(markers)
 
+  setupStudentFilters(data)
+}
+
+// filters and charts for the full set of students on the map
+function setupStudentFilters(data) {
   // Filter + Chart setup
   const yearLevels = [...new Set(data.map((item) => item.year).filter(Boolean))]
   const previousSchools = [...new Set(data.map((item) => item.previous_school).filter(Boolean))]
@@ -1337,11 +1204,19 @@ async function toggleClustering(apiUrl, clusterType, buttonId) {
   // capture the current educational level
   currentEducationLevel = apiUrl.includes("senior") ? "senior_high" : "college"
 
-  const data = await fetchData(`${apiUrl}?cluster_type=${clusterType}`)
-  console.log("Cluster data received:", data)
-
-  addMarkers(data)
+  // markers are added batch by batch as the stream arrives, the stream stops if the layer is toggled off
+  const clusterKey = activeCluster
+  allMarkers = []
   map.addLayer(markers)
+  const data = await fetchStudentStream(
+    `${apiUrl}?cluster_type=${clusterType}&fields=${STUDENT_MAP_FIELDS[currentEducationLevel]}`,
+    (batch) => appendMarkers(batch),
+    () => activeCluster !== clusterKey
+  )
+  if (activeCluster !== clusterKey) return
+  console.log("Cluster data received:", data.length)
+
+  setupStudentFilters(data)
   createPopulationDistribution(data)
 
   // update button text to hide
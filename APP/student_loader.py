@@ -0,0 +1,168 @@
+# student_loader.py
+# bulk loading of preprocessed student csv rows into the database
+#
+# uploads are read straight from the spooled upload file and parsed row by row, only one chunk of parsed
+# rows is held in memory at a time so memory stays flat whatever the file size.
+#
+# previous school ids are loaded once with a single query, the schools missing from that map are inserted
+# in one batch per chunk and the students are inserted with executemany. nothing is committed here, the
+# upload endpoint commits everything together with its activity log so an upload is one transaction.
+import csv, io, os, time
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from sqlalchemy import insert
+
+import models
+
+load_dotenv()
+
+# students per executemany
+BULK_INSERT_CHUNK_SIZE = int(os.getenv("BULK_INSERT_CHUNK_SIZE", 1000))
+
+
+def school_key(name: str) -> str:
+    # mysql compares names case-insensitively and ignores trailing spaces, the map does the same
+    return (name or "").rstrip().casefold()
+
+
+def senior_high_row(row: dict) -> dict:
+    return {
+        "stud_id": int(row['stud_id']),
+        "year": int(row['year']),
+        "strand": row['strand'],
+        "age": int(row['age']),
+        "city": row['city'],
+        "province": row['province'],
+        "barangay": row['barangay'],
+        "full_address": row['full_address'],
+        "latitude": float(row['latitude']),
+        "longitude": float(row['longitude']),
+        "cluster": int(row['cluster']) if row['cluster'] else None,
+    }
+
+
+def college_row(row: dict) -> dict:
+    return {
+        "stud_id": int(row['stud_id']),
+        "year": int(row['year']),
+        "course": row['course'],
+        "age": int(row['age']),
+        "strand": row['strand'],
+        "city": row['city'],
+        "province": row['province'],
+        "barangay": row['barangay'],
+        "full_address": row['full_address'],
+        "latitude": float(row['latitude']),
+        "longitude": float(row['longitude']),
+        "cluster": int(row['cluster']) if row['cluster'] else None,
+    }
+
+
+class StudentLoader:
+    def __init__(self, db, student_model, parse_row, chunk_size: int = BULK_INSERT_CHUNK_SIZE, summary=None, points=None):
+        self.db = db
+        self.table = student_model.__table__
+        self.parse_row = parse_row
+        self.chunk_size = chunk_size
+        # analytics_store.SummaryCounts collecting the counts of the inserted rows
+        self.summary = summary
+        # cluster_store.UploadedPoints collecting the coordinates of the inserted rows
+        self.points = points
+        self.pending = []
+        # school name -> (name, latitude, longitude) for schools first seen in the pending rows
+        self.new_schools = {}
+        self.rows = 0
+        self.schools_created = 0
+        self.start = time.perf_counter()
+
+        # lowest id wins when a name is stored more than once, like the old .first() lookup
+        schools = db.query(models.PreviousSchool.name, models.PreviousSchool.id).order_by(models.PreviousSchool.id.desc()).all()
+        self.school_ids = {school_key(name): school_id for name, school_id in schools}
+
+    def add(self, row: dict):
+        try:
+            student = self.parse_row(row)
+            key = school_key(row['previous_school'])
+            if key not in self.school_ids and key not in self.new_schools:
+                self.new_schools[key] = (row['previous_school'], float(row['prev_latitude']), float(row['prev_longitude']))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f'Invalid data in row: {row}. Error: {str(e)}')
+
+        self.pending.append((key, student))
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def _insert_new_schools(self):
+        if not self.new_schools:
+            return
+        self.db.execute(
+            insert(models.PreviousSchool.__table__),
+            [{"name": name, "latitude": lat, "longitude": lng} for name, lat, lng in self.new_schools.values()]
+        )
+        # executemany does not hand back the generated ids, read them back in one query
+        names = [name for name, _, _ in self.new_schools.values()]
+        created = self.db.query(models.PreviousSchool.name, models.PreviousSchool.id).filter(
+            models.PreviousSchool.name.in_(names)
+        ).order_by(models.PreviousSchool.id.desc()).all()
+        for name, school_id in created:
+            self.school_ids[school_key(name)] = school_id
+        self.schools_created += len(self.new_schools)
+        self.new_schools = {}
+
+    def flush(self):
+        if not self.pending:
+            return
+        self._insert_new_schools()
+        students = []
+        for key, student in self.pending:
+            student["previous_school_id"] = self.school_ids.get(key)
+            students.append(student)
+        self.db.execute(insert(self.table), students)
+        if self.summary is not None:
+            self.summary.add(students)
+        if self.points is not None:
+            self.points.add(students)
+        self.rows += len(students)
+        self.pending = []
+
+    # flush what is left and return the load statistics
+    def finish(self) -> dict:
+        self.flush()
+        seconds = time.perf_counter() - self.start
+        rows_per_second = round(self.rows / seconds) if seconds > 0 else self.rows
+        print(f"Loaded {self.rows} rows into {self.table.name} in {seconds:.2f}s ({rows_per_second} rows/s), "
+              f"{self.schools_created} new previous schools")
+        return {
+            "rows": self.rows,
+            "schools_created": self.schools_created,
+            "seconds": round(seconds, 3),
+            "rows_per_second": rows_per_second
+        }
+
+
+# csv rows of an UploadFile, decoded as they are read instead of loading the whole file
+def stream_csv_rows(upload_file):
+    upload_file.file.seek(0)
+    text = io.TextIOWrapper(upload_file.file, encoding='utf-8-sig', newline='')
+    try:
+        try:
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield row
+        except (UnicodeDecodeError, csv.Error) as e:
+            raise HTTPException(status_code=400, detail=f'Failed to read CSV file {str(e)}')
+    finally:
+        # leave the upload file open, it is closed by the framework
+        text.detach()
+
+
+# stream an upload into student_model, returns the load statistics plus the file size in kb
+def load_students_csv(db, upload_file, student_model, parse_row, summary=None, points=None) -> dict:
+    loader = StudentLoader(db, student_model, parse_row, summary=summary, points=points)
+    for row in stream_csv_rows(upload_file):
+        loader.add(row)
+    stats = loader.finish()
+
+    upload_file.file.seek(0, io.SEEK_END)
+    stats["file_size"] = upload_file.file.tell() / 1024
+    return stats
@@ -0,0 +1,265 @@
+# student_query.py
+# column projections and keyset pages over the student tables
+#
+# only the requested columns are selected, previous_school is the school name from a left join instead of the
+# whole related row. pages are keyed on stud_id (WHERE stud_id > cursor ORDER BY stud_id LIMIT n), so every page
+# is an index range scan no matter how deep into the table it is.
+#
+# for the map there are also streamed formats that skip building the response as one big list:
+#   ndjson    one json object per line, written while the rows come off a server side cursor
+#   columnar  parallel arrays per field, strand/course are sent as codes into a list of values
+#   binary    the columnar data as one little endian float32 buffer (see binary_response for the layout)
+# they take the same fields, cursor and limit as the json format, a page sends its next cursor in the
+# X-Next-Cursor header (and in the body of columnar and binary).
+import json, os, struct
+from typing import Optional
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+import numpy as np
+
+import models
+from database import SessionLocal
+
+load_dotenv()
+
+STUDENT_PAGE_SIZE = int(os.getenv("STUDENT_PAGE_SIZE", 5000))
+STUDENT_MAX_PAGE_SIZE = int(os.getenv("STUDENT_MAX_PAGE_SIZE", 50000))
+# rows fetched from the cursor and written to the response at a time
+STUDENT_STREAM_BATCH = int(os.getenv("STUDENT_STREAM_BATCH", 2000))
+
+FORMATS = ("json", "ndjson", "columnar", "binary")
+
+# education level in api paths -> student model
+STUDENT_MODELS = {
+    "senior-high": models.SeniorHighStudents,
+    "college": models.CollegeStudents,
+}
+
+STUDENT_FIELDS = {
+    models.SeniorHighStudents: ["stud_id", "year", "strand", "previous_school", "age", "latitude", "longitude", "cluster"],
+    models.CollegeStudents: ["stud_id", "year", "course", "strand", "previous_school", "age", "latitude", "longitude", "cluster"],
+}
+
+# fields returned when none are requested, what the student endpoints have always returned
+DEFAULT_FIELDS = {model: [name for name in fields if name != "stud_id"] for model, fields in STUDENT_FIELDS.items()}
+
+# fields of the columnar and binary formats, the text fields are sent as codes
+COLUMNAR_FIELDS = {
+    models.SeniorHighStudents: ["latitude", "longitude", "cluster", "year", "strand"],
+    models.CollegeStudents: ["latitude", "longitude", "cluster", "year", "strand", "course"],
+}
+CATEGORY_FIELDS = ("strand", "course")
+
+
+# "year,strand,latitude" -> ["year", "strand", "latitude"]
+def parse_fields(student_model, fields: Optional[str], available: list = None, default: list = None) -> list:
+    available = available or STUDENT_FIELDS[student_model]
+    if not fields:
+        return default or DEFAULT_FIELDS[student_model]
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Available fields: {', '.join(available)}"
+        )
+    return names
+
+
+# the columnar formats only send numbers and codes, previous_school and age are left out
+def parse_columnar_fields(student_model, fields: Optional[str]) -> list:
+    return parse_fields(student_model, fields, ["stud_id", *COLUMNAR_FIELDS[student_model]], COLUMNAR_FIELDS[student_model])
+
+
+# query selecting stud_id followed by the requested fields
+def student_query(db, student_model, field_names: list):
+    columns = [student_model.stud_id]
+    for name in field_names:
+        if name == "previous_school":
+            columns.append(models.PreviousSchool.name.label("previous_school"))
+        else:
+            columns.append(getattr(student_model, name).label(name))
+
+    query = db.query(*columns)
+    if "previous_school" in field_names:
+        query = query.outerjoin(models.PreviousSchool, student_model.previous_school_id == models.PreviousSchool.id)
+    return query
+
+
+def page_size(limit: Optional[int]) -> int:
+    return min(max(1, limit or STUDENT_PAGE_SIZE), STUDENT_MAX_PAGE_SIZE)
+
+
+# one page of students after cursor, next_cursor is None on the last page
+def student_page(db, student_model, fields: Optional[str] = None, cursor: Optional[int] = None, limit: Optional[int] = None) -> dict:
+    field_names = parse_fields(student_model, fields)
+    limit = page_size(limit)
+
+    query = student_query(db, student_model, field_names)
+    if cursor is not None:
+        query = query.filter(student_model.stud_id > cursor)
+    # one extra row tells whether there is another page without a count query
+    rows = query.order_by(student_model.stud_id).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "items": [dict(zip(field_names, row[1:])) for row in rows],
+        "next_cursor": rows[-1][0] if has_more else None,
+        "limit": limit
+    }
+
+
+# every student as a list, for callers that do not page
+def student_rows(db, student_model, fields: Optional[str] = None) -> list:
+    field_names = parse_fields(student_model, fields)
+    rows = student_query(db, student_model, field_names).order_by(student_model.stud_id).all()
+    return [dict(zip(field_names, row[1:])) for row in rows]
+
+
+def streamed_rows(db, student_model, field_names: list, cursor: Optional[int] = None, limit: Optional[int] = None):
+    query = student_query(db, student_model, field_names)
+    if cursor is not None:
+        query = query.filter(student_model.stud_id > cursor)
+    query = query.order_by(student_model.stud_id)
+    if limit is not None:
+        query = query.limit(limit)
+    # stream_results keeps the rows on a server side cursor instead of buffering the whole result
+    return query.execution_options(stream_results=True).yield_per(STUDENT_STREAM_BATCH)
+
+
+# stud_id the next page starts after, read from the index before a page is streamed
+def next_cursor(db, student_model, cursor: Optional[int], limit: int) -> Optional[int]:
+    query = db.query(student_model.stud_id)
+    if cursor is not None:
+        query = query.filter(student_model.stud_id > cursor)
+    # the last row of the page and the first row after it
+    ids = [stud_id for (stud_id,) in query.order_by(student_model.stud_id).offset(limit - 1).limit(2).all()]
+    return ids[0] if len(ids) == 2 else None
+
+
+# ndjson body written batch by batch, the generator has its own session because it runs after the endpoint returns
+# with cursor or limit only one page is streamed and the next cursor is sent in the X-Next-Cursor header
+def ndjson_response(
+    db, student_model, fields: Optional[str] = None, cursor: Optional[int] = None, limit: Optional[int] = None
+) -> StreamingResponse:
+    field_names = parse_fields(student_model, fields)
+    headers = {}
+    if cursor is not None or limit is not None:
+        limit = page_size(limit)
+        following = next_cursor(db, student_model, cursor, limit)
+        headers["X-Next-Cursor"] = "" if following is None else str(following)
+
+    def generate():
+        db = SessionLocal()
+        try:
+            lines = []
+            for row in streamed_rows(db, student_model, field_names, cursor, limit):
+                lines.append(json.dumps(dict(zip(field_names, row[1:])), separators=(",", ":")))
+                if len(lines) >= STUDENT_STREAM_BATCH:
+                    yield "\n".join(lines) + "\n"
+                    lines = []
+            if lines:
+                yield "\n".join(lines) + "\n"
+        finally:
+            db.close()
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson", headers=headers)
+
+
+# {field: float64 array} for the columnar fields, NULL becomes nan and text fields become codes into values
+# columns also holds the int64 stud_id of every row, it is only one of the returned field names when asked for
+def columnar_data(db, student_model, field_names: list = None, cursor: Optional[int] = None, limit: Optional[int] = None):
+    field_names = field_names or COLUMNAR_FIELDS[student_model]
+    queried = [name for name in field_names if name != "stud_id"]
+    raw = {name: [] for name in queried}
+    stud_ids = []
+    for row in streamed_rows(db, student_model, queried, cursor, limit):
+        stud_ids.append(row[0])
+        for name, value in zip(queried, row[1:]):
+            raw[name].append(value)
+
+    columns, values = {"stud_id": np.array(stud_ids, dtype=np.int64)}, {}
+    for name in queried:
+        if name in CATEGORY_FIELDS:
+            values[name] = sorted({value for value in raw[name] if value is not None})
+            codes = {value: code for code, value in enumerate(values[name])}
+            columns[name] = np.array([codes.get(value, np.nan) for value in raw[name]], dtype=np.float64)
+        else:
+            columns[name] = np.array(raw[name], dtype=np.float64)
+    return field_names, columns, values
+
+
+# columnar data of the whole table, or of one page when cursor or limit is given, with the next cursor
+def columnar_page(db, student_model, fields: Optional[str], cursor: Optional[int], limit: Optional[int]):
+    field_names = parse_columnar_fields(student_model, fields)
+    if cursor is None and limit is None:
+        return (*columnar_data(db, student_model, field_names), None)
+
+    # one extra row tells whether there is another page
+    limit = page_size(limit)
+    field_names, columns, values = columnar_data(db, student_model, field_names, cursor, limit + 1)
+    following = None
+    if len(columns["stud_id"]) > limit:
+        columns = {name: column[:limit] for name, column in columns.items()}
+        following = int(columns["stud_id"][-1])
+    return field_names, columns, values, following
+
+
+def page_headers(cursor: Optional[int], limit: Optional[int], following: Optional[int]) -> dict:
+    if cursor is None and limit is None:
+        return {}
+    return {"X-Next-Cursor": "" if following is None else str(following)}
+
+
+# built with json.dumps directly, returning the dict would send every value through jsonable_encoder
+def columnar_response(
+    db, student_model, fields: Optional[str] = None, cursor: Optional[int] = None, limit: Optional[int] = None
+) -> Response:
+    field_names, columns, values, following = columnar_page(db, student_model, fields, cursor, limit)
+    result = {"count": len(columns["stud_id"]), "fields": field_names, "values": values}
+    if cursor is not None or limit is not None:
+        result["next_cursor"] = following
+    for name in field_names:
+        column = columns[name]
+        if name == "stud_id":
+            result[name] = column.tolist()
+            continue
+        missing = np.isnan(column)
+        if name in ("latitude", "longitude"):
+            # 6 decimals is about 10 cm, plenty for a map marker
+            items = np.round(column, 6).tolist()
+        else:
+            items = np.where(missing, 0, column).astype(np.int64).tolist()
+        result[name] = [None if is_missing else item for item, is_missing in zip(items, missing.tolist())]
+    return Response(
+        content=json.dumps(result, separators=(",", ":")), media_type="application/json",
+        headers=page_headers(cursor, limit, following)
+    )
+
+
+# body: uint32 header length, json header padded with spaces to a multiple of 4 bytes, then one float32 block
+# per field in the order of header["fields"], each header["count"] values long. nan marks a missing value.
+# stud_id would lose precision as a float32, when it is asked for it follows as an int32 block (header["ids"]).
+#   const header = JSON.parse(text(buffer, 4, length)); new Float32Array(buffer, 4 + length, count * fields.length)
+def binary_response(
+    db, student_model, fields: Optional[str] = None, cursor: Optional[int] = None, limit: Optional[int] = None
+) -> Response:
+    field_names, columns, values, following = columnar_page(db, student_model, fields, cursor, limit)
+    count = len(columns["stud_id"])
+    float_fields = [name for name in field_names if name != "stud_id"]
+    header = {"count": count, "fields": float_fields, "values": values, "dtype": "float32", "ids": "stud_id" in field_names}
+    if cursor is not None or limit is not None:
+        header["next_cursor"] = following
+    header = json.dumps(header).encode("utf-8")
+    header += b" " * (-len(header) % 4)
+
+    blocks = [columns[name].astype("<f4") for name in float_fields]
+    if "stud_id" in field_names:
+        blocks.append(columns["stud_id"].astype("<i4"))
+    return Response(
+        content=struct.pack("<I", len(header)) + header + b"".join(block.tobytes() for block in blocks),
+        media_type="application/octet-stream",
+        headers={"X-Row-Count": str(count), **page_headers(cursor, limit, following)}
+    )
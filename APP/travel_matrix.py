@@ -0,0 +1,296 @@
+# travel_matrix.py
+# precomputed travel times and distances from the students of a level to every campus
+#
+# the origins are the cluster centroids of a level (TRAVEL_MATRIX_ORIGINS=clusters) or every student with
+# coordinates (students). the matrix is built by a background job through the routing backend and saved per
+# level as a columnar .npz: the origin and campus columns plus float32 duration and distance matrices.
+# a rebuild keeps every cell whose origin and campus are still there and moved less than
+# TRAVEL_MATRIX_TOLERANCE_M, so only new or moved students and campuses reach the router again.
+#
+# backends with a table method get every origin for one campus at once, the others one route per origin and
+# campus. blocks run TRAVEL_MATRIX_CONCURRENCY at a time, and students sharing a location are routed once.
+import json, os, tempfile, threading, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from fastapi import HTTPException
+import numpy as np
+
+import models, nearest_campus, routing, spatial_index
+from database import SessionLocal
+
+load_dotenv()
+
+TRAVEL_MATRIX_DIR = os.getenv("TRAVEL_MATRIX_DIR", "data/travel_matrix")
+# "clusters" or "students"
+TRAVEL_MATRIX_ORIGINS = os.getenv("TRAVEL_MATRIX_ORIGINS", "clusters")
+TRAVEL_MATRIX_CONCURRENCY = int(os.getenv("TRAVEL_MATRIX_CONCURRENCY", routing.ROUTE_CONCURRENCY))
+TRAVEL_MATRIX_TOLERANCE_M = float(os.getenv("TRAVEL_MATRIX_TOLERANCE_M", 50))
+# minutes, the accessibility summary counts the students within each of them
+TRAVEL_MATRIX_THRESHOLDS = [int(minutes) for minutes in os.getenv("TRAVEL_MATRIX_THRESHOLDS", "15,30,60").split(",")]
+ORIGIN_MODES = ("clusters", "students")
+
+
+def matrix_path(education_level: str) -> str:
+    return os.path.join(TRAVEL_MATRIX_DIR, f"{education_level}.npz")
+
+
+# (keys, latitude, longitude, students) of the origins of a level
+def matrix_origins(education_level: str, mode: str):
+    index = spatial_index.get_index(education_level)
+    if mode == "students":
+        return index.stud_id.astype(np.int64), index.latitude, index.longitude, np.ones(len(index.stud_id), dtype=np.int64)
+
+    # students without a cluster have no centroid to route from
+    clustered = index.cluster >= 0
+    keys, cluster_of, students = np.unique(index.cluster[clustered], return_inverse=True, return_counts=True)
+    latitude = np.bincount(cluster_of, weights=index.latitude[clustered]) / students
+    longitude = np.bincount(cluster_of, weights=index.longitude[clustered]) / students
+    return keys.astype(np.int64), latitude, longitude, students.astype(np.int64)
+
+
+# (new positions, old positions) of the keys found in both with a position that moved at most the tolerance
+def matching_positions(old_keys, old_latitude, old_longitude, keys, latitude, longitude):
+    if not len(old_keys) or not len(keys):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    order = np.argsort(old_keys)
+    position = np.minimum(np.searchsorted(old_keys[order], keys), len(old_keys) - 1)
+    new = np.flatnonzero(old_keys[order[position]] == keys)
+    old = order[position[new]]
+    kept = routing.haversine_m(old_latitude[old], old_longitude[old], latitude[new], longitude[new]) <= TRAVEL_MATRIX_TOLERANCE_M
+    return new[kept], old[kept]
+
+
+def save_matrix(path: str, matrix: dict):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # written next to the old file under a name of its own and swapped in, a reader never sees half a matrix
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp.npz")
+    try:
+        with os.fdopen(descriptor, "wb") as out:
+            np.savez(out, **matrix)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def read_matrix(path: str):
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+# compute the cells of one block of unique origin locations x campuses
+def route_block(backend, locations, campuses):
+    if hasattr(backend, "table"):
+        return backend.table([tuple(location) for location in locations], [tuple(campus) for campus in campuses])
+    durations = np.full((len(locations), len(campuses)), np.nan)
+    distances = np.full((len(locations), len(campuses)), np.nan)
+    for row, location in enumerate(locations):
+        for column, campus in enumerate(campuses):
+            route = backend.route([tuple(location), tuple(campus)])
+            if route is not None:
+                durations[row, column], distances[row, column] = route["duration"], route["distance"]
+    return durations, distances
+
+
+# build or update the matrix of a level, returns the path it was saved to
+def build_matrix(education_level: str, progress=None, backend_name: str = None, mode: str = None) -> str:
+    start = time.perf_counter()
+    progress = progress or (lambda percent, message: None)
+    mode = mode or TRAVEL_MATRIX_ORIGINS
+    if mode not in ORIGIN_MODES:
+        raise ValueError(f"Unknown travel matrix origins '{mode}'. Use one of: {', '.join(ORIGIN_MODES)}")
+    name, backend = routing.get_backend(backend_name)
+
+    progress(5, "Loading students and campuses")
+    keys, latitude, longitude, students = matrix_origins(education_level, mode)
+    # read from the database, the campus cache of a long lived worker process may be older than the build
+    db = SessionLocal()
+    try:
+        campuses = nearest_campus.CampusIndex(db.query(models.Campus).order_by(models.Campus.campus_id).all())
+    finally:
+        db.close()
+    durations = np.full((len(keys), len(campuses.campus_id)), np.nan, dtype=np.float32)
+    distances = np.full(durations.shape, np.nan, dtype=np.float32)
+    computed = np.zeros(durations.shape, dtype=bool)
+
+    # keep the cells of the previous build made with the same backend and origins
+    path = matrix_path(education_level)
+    old = read_matrix(path)
+    if old is not None and str(old["backend"]) == name and str(old["origins"]) == mode:
+        rows, old_rows = matching_positions(old["origin_key"], old["origin_latitude"], old["origin_longitude"], keys, latitude, longitude)
+        columns, old_columns = matching_positions(
+            old["campus_id"], old["campus_latitude"], old["campus_longitude"], campuses.campus_id, campuses.latitude, campuses.longitude
+        )
+        for target, source in ((durations, old["duration"]), (distances, old["distance"]), (computed, old["computed"])):
+            target[np.ix_(rows, columns)] = source[np.ix_(old_rows, old_columns)]
+
+    def matrix():
+        return {
+            "origin_key": keys, "origin_latitude": latitude, "origin_longitude": longitude, "origin_students": students,
+            "campus_id": campuses.campus_id, "campus_name": np.array(campuses.name, dtype=str),
+            "campus_latitude": campuses.latitude, "campus_longitude": campuses.longitude,
+            "duration": durations, "distance": distances, "computed": computed,
+            "backend": np.array(name), "origins": np.array(mode), "built_at": np.array(time.time()),
+        }
+
+    # new or moved campuses need every origin, the other campuses only the new or moved origins
+    full_columns = np.flatnonzero(~computed.any(axis=0)) if len(keys) else np.zeros(0, dtype=np.int64)
+    other_columns = np.setdiff1d(np.arange(len(campuses.campus_id)), full_columns)
+    passes = [(np.arange(len(keys)), full_columns), (np.flatnonzero(~computed[:, other_columns].all(axis=1)), other_columns)]
+
+    tasks = []
+    for rows, columns in passes:
+        if not len(rows) or not len(columns):
+            continue
+        # students sharing a location are routed once
+        points = np.round(np.column_stack([latitude[rows], longitude[rows]]), routing.ROUTE_CACHE_PRECISION)
+        locations, location_of = np.unique(points, axis=0, return_inverse=True)
+        location_of = location_of.reshape(-1)
+        if hasattr(backend, "table"):
+            # a table search costs about the same for any number of origins, so a block is one campus
+            tasks.extend((rows, columns[[column]], locations, location_of, 0, len(locations)) for column in range(len(columns)))
+        else:
+            tasks.extend((rows, columns, locations, location_of, first, first + 1) for first in range(len(locations)))
+
+    targets = np.column_stack([campuses.latitude, campuses.longitude])
+    cells = int((~computed).sum())
+    print(f"Travel matrix for {education_level}: {len(keys)} {mode} x {len(campuses.campus_id)} campuses, "
+          f"{cells} cells to route in {len(tasks)} blocks with the {name} backend")
+    progress(10, f"Routing {cells} of {computed.size} origin and campus pairs")
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, TRAVEL_MATRIX_CONCURRENCY)) as executor:
+            futures = {
+                executor.submit(route_block, backend, locations[first:end], targets[columns]): (rows, columns, location_of, first, end)
+                for rows, columns, locations, location_of, first, end in tasks
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                rows, columns, location_of, first, end = futures[future]
+                try:
+                    block_durations, block_distances = future.result()
+                except Exception:
+                    # blocks that have not started are dropped instead of waited for
+                    for pending in futures:
+                        pending.cancel()
+                    raise
+                # every row whose location falls in this block
+                in_block = (location_of >= first) & (location_of < end)
+                cell = np.ix_(rows[in_block], columns)
+                durations[cell] = block_durations[location_of[in_block] - first]
+                distances[cell] = block_distances[location_of[in_block] - first]
+                computed[cell] = True
+                if done % max(1, len(tasks) // 20) == 0:
+                    progress(10 + int(85 * done / len(tasks)), f"Routed {done} of {len(tasks)} blocks")
+    finally:
+        # the cells routed so far are kept even when the router fails, the next build continues from them
+        save_matrix(path, matrix())
+
+    print(f"Saved {education_level} travel matrix to {path} in {time.perf_counter() - start:.2f}s")
+    return path
+
+
+# background job entry point, input_path is the json file with the job parameters
+def run_travel_matrix_job(input_path: str, progress) -> str:
+    with open(input_path) as source:
+        params = json.load(source)
+    try:
+        return build_matrix(params["education_level"], progress=progress, mode=params.get("origins"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except routing.RoutingError as e:
+        raise HTTPException(status_code=502, detail=f"Routing failed, the cells routed so far are kept: {e}")
+
+
+# path -> (modified time, matrix)
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+# the saved matrix of a level, read again only after a job replaced the file
+def load_matrix(education_level: str):
+    path = matrix_path(education_level)
+    if not os.path.exists(path):
+        return None
+    modified = os.path.getmtime(path)
+    with _loaded_lock:
+        cached = _loaded.get(path)
+        if cached is not None and cached[0] == modified:
+            return cached[1]
+    matrix = read_matrix(path)
+    with _loaded_lock:
+        _loaded[path] = (modified, matrix)
+    return matrix
+
+
+def rounded(value) -> float:
+    return round(float(value), 1) if np.isfinite(value) else None
+
+
+# travel time and distance from one origin (cluster or student id) to every campus
+def origin_travel(education_level: str, key: int):
+    matrix = load_matrix(education_level)
+    if matrix is None:
+        return None
+    row = np.flatnonzero(matrix["origin_key"] == key)
+    if not len(row):
+        return None
+    row = int(row[0])
+    return {
+        "education_level": education_level,
+        "origins": str(matrix["origins"]),
+        "origin_key": int(key),
+        "latitude": float(matrix["origin_latitude"][row]),
+        "longitude": float(matrix["origin_longitude"][row]),
+        "students": int(matrix["origin_students"][row]),
+        "campuses": [
+            {
+                "campus_id": int(campus_id),
+                "name": str(matrix["campus_name"][column]),
+                "duration_s": rounded(matrix["duration"][row, column]),
+                "distance_m": rounded(matrix["distance"][row, column]),
+            }
+            for column, campus_id in enumerate(matrix["campus_id"])
+        ],
+    }
+
+
+# students per campus within each threshold, weighted mean travel time, and the students each campus is fastest for
+def accessibility(education_level: str):
+    matrix = load_matrix(education_level)
+    if matrix is None:
+        return None
+    durations, students = matrix["duration"].astype(np.float64), matrix["origin_students"]
+    reached = np.isfinite(durations)
+
+    fastest = np.full(len(students), -1, dtype=np.int64)
+    any_route = reached.any(axis=1)
+    if durations.size:
+        fastest[any_route] = np.nanargmin(durations[any_route], axis=1)
+
+    campuses = []
+    for column, campus_id in enumerate(matrix["campus_id"]):
+        column_reached = reached[:, column]
+        weights = students[column_reached]
+        times = durations[column_reached, column]
+        campuses.append({
+            "campus_id": int(campus_id),
+            "name": str(matrix["campus_name"][column]),
+            "students_reached": int(weights.sum()),
+            "mean_duration_s": rounded(np.average(times, weights=weights)) if len(times) else None,
+            "max_duration_s": rounded(times.max()) if len(times) else None,
+            "students_within_min": {str(minutes): int(weights[times <= minutes * 60].sum()) for minutes in TRAVEL_MATRIX_THRESHOLDS},
+            "fastest_for_students": int(students[fastest == column].sum()),
+        })
+
+    return {
+        "education_level": education_level,
+        "origins": str(matrix["origins"]),
+        "backend": str(matrix["backend"]),
+        "built_at": float(matrix["built_at"]),
+        "origin_count": int(len(students)),
+        "students": int(students.sum()),
+        "students_without_route": int(students[~any_route].sum()),
+        "pending_cells": int((~matrix["computed"]).sum()),
+        "campuses": campuses,
+    }